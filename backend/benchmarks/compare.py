@@ -0,0 +1,80 @@
+"""
+Compares two benchmark reports (e.g. from two commits):
+
+    python -m benchmarks.compare output/benchmarks/before.json output/benchmarks/after.json
+
+Prints the relative change of startup time, end-to-end percentiles, throughput and peak RSS
+per scenario, and exits with status 1 if any latency regressed by more than --threshold.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _delta(before: Optional[float], after: Optional[float]) -> Optional[float]:
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before
+
+
+def _fmt(before: Any, after: Any, change: Optional[float]) -> str:
+    pct = f"{change:+.1%}" if change is not None else "n/a"
+    return f"{before!s:>10} -> {after!s:>10}  ({pct})"
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any], threshold: float) -> Tuple[List[str], List[str]]:
+    """Returns (report lines, regressions). Higher is worse for everything but throughput."""
+    lines: List[str] = []
+    regressions: List[str] = []
+
+    def check(name: str, old: Optional[float], new: Optional[float], higher_is_better: bool = False) -> None:
+        change = _delta(old, new)
+        lines.append(f"  {name:<34}{_fmt(old, new, change)}")
+        if change is not None and (-change if higher_is_better else change) > threshold:
+            regressions.append(f"{name}: {change:+.1%}")
+
+    lines.append(f"before: {before['meta'].get('commit')}  after: {after['meta'].get('commit')}")
+    lines.append("startup")
+    for key in ("import_seconds", "setup_seconds", "spawn_seconds"):
+        check(f"startup.{key}", before["startup"].get(key), after["startup"].get(key))
+    check("peak_rss_mb", before.get("peak_rss_mb"), after.get("peak_rss_mb"))
+
+    old_scenarios = {s["label"]: s for s in before.get("scenarios", [])}
+    for scenario in after.get("scenarios", []):
+        old = old_scenarios.get(scenario["label"])
+        if old is None:
+            lines.append(f"{scenario['label']}: not in the baseline")
+            continue
+        lines.append(scenario["label"])
+        for pct in ("p50", "p95", "p99"):
+            check(f"{scenario['label']}.e2e.{pct}", old["end_to_end"].get(pct), scenario["end_to_end"].get(pct))
+        check(f"{scenario['label']}.throughput", old.get("throughput_runs_per_minute"),
+              scenario.get("throughput_runs_per_minute"), higher_is_better=True)
+        for task, stats in scenario.get("tasks", {}).items():
+            check(f"{scenario['label']}.{task}.p50", old.get("tasks", {}).get(task, {}).get("p50"), stats.get("p50"))
+    return lines, regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark JSON reports")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regression threshold (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    lines, regressions = compare(before, after, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\nRegressions over {args.threshold:.0%}:")
+        print("\n".join(f"  {r}" for r in regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Fake FLUX.1-schnell upstream for the offline benchmarks.
+
+Two flavours with the same `/infer` signature as the real Space
+(prompt, seed, randomize_seed, width, height, num_inference_steps) -> (image_path, seed):
+
+- `build_app()`: a local Gradio app (needs the optional `gradio` package), reached through
+  the real gradio_client exactly like the production Space:
+
+      python -m benchmarks.fake_flux --port 7860 --latency lognormal:2.0:0.3
+
+- `FakeFluxClient`: an in-process stand-in for `gradio_client.Client`, used as the
+  GradioClientPool `client_factory` when gradio is not installed.
+"""
+import argparse
+import io
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import zlib
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from benchmarks.latency import LatencyDistribution
+
+logger = logging.getLogger(__name__)
+
+# Distinct images per size, so the content-addressed store sees realistic (non-identical) outputs
+VARIANTS_PER_SIZE = 8
+
+
+@lru_cache(maxsize=64)
+def _encoded_image(width: int, height: int, variant: int) -> bytes:
+    """WebP bytes of a noisy image; encoded once per (size, variant) to keep the fake cheap."""
+    rng = random.Random(variant)
+    base = Image.effect_noise((max(8, width // 8), max(8, height // 8)), 40 + rng.randint(0, 40)).convert("RGB")
+    image = base.resize((width, height), Image.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=80, method=0)
+    return buffer.getvalue()
+
+
+def fake_infer(prompt: str, seed: int, randomize_seed: bool, width: int, height: int,
+               delay: float, out_dir: str) -> Tuple[str, int]:
+    """Sleeps for `delay` seconds (the simulated inference) and writes an image of the requested size."""
+    time.sleep(delay)
+    if randomize_seed:
+        seed = random.randint(0, 2 ** 31 - 1)
+    variant = (zlib.crc32(prompt.encode("utf-8")) + int(seed)) % VARIANTS_PER_SIZE
+    fd, path = tempfile.mkstemp(suffix=".webp", dir=out_dir)
+    with os.fdopen(fd, "wb") as f:
+        f.write(_encoded_image(int(width), int(height), variant))
+    return path, int(seed)
+
+
+class FakeFluxClient:
+    """In-process replacement for gradio_client.Client against the FLUX Space."""
+
+    latency = LatencyDistribution("lognormal:2.0:0.3", seed=2)
+    _latency_lock = threading.Lock()
+
+    def __init__(self, src: str = "fake-flux", **kwargs):
+        self.src = src
+        self.out_dir = tempfile.mkdtemp(prefix="fake-flux-")
+
+    @classmethod
+    def configure(cls, latency: str, seed: Optional[int] = 2) -> None:
+        cls.latency = LatencyDistribution(latency, seed=seed)
+
+    def view_api(self, *args, **kwargs):  # Health check used by GradioClientPool
+        return {"named_endpoints": {"/infer": {}}}
+
+    def predict(self, prompt: str, seed: int = 0, randomize_seed: bool = True, width: int = 1024,
+                height: int = 1024, num_inference_steps: int = 4, api_name: str = "/infer"):
+        with self._latency_lock:
+            delay = self.latency.sample()
+        return fake_infer(prompt, seed, randomize_seed, width, height, delay, self.out_dir)
+
+
+def build_app(latency: str = "lognormal:2.0:0.3", seed: Optional[int] = 2):
+    """Gradio Blocks app exposing /infer like the FLUX.1-schnell Space."""
+    import gradio as gr  # Optional dependency (pip install gradio)
+
+    distribution = LatencyDistribution(latency, seed=seed)
+    lock = threading.Lock()
+    out_dir = tempfile.mkdtemp(prefix="fake-flux-app-")
+
+    def infer(prompt, seed, randomize_seed, width, height, num_inference_steps):
+        with lock:
+            delay = distribution.sample()
+        return fake_infer(prompt, seed, randomize_seed, width, height, delay, out_dir)
+
+    with gr.Blocks() as app:
+        prompt = gr.Text(label="Prompt")
+        seed = gr.Number(value=0, label="Seed", precision=0)
+        randomize_seed = gr.Checkbox(value=True, label="Randomize seed")
+        width = gr.Number(value=1024, label="Width", precision=0)
+        height = gr.Number(value=1024, label="Height", precision=0)
+        steps = gr.Number(value=4, label="Steps", precision=0)
+        result = gr.Image(label="Result", type="filepath")
+        used_seed = gr.Number(label="Seed used", precision=0)
+        run = gr.Button("Run")
+        run.click(infer, inputs=[prompt, seed, randomize_seed, width, height, steps],
+                  outputs=[result, used_seed], api_name="infer")
+    app.queue(default_concurrency_limit=None)
+    return app
+
+
+def serve(host: str = "127.0.0.1", port: int = 7860, latency: str = "lognormal:2.0:0.3",
+          seed: Optional[int] = 2, ready=None) -> None:
+    """Launches the Gradio app (blocking). `ready` receives the URL once it is up."""
+    app = build_app(latency, seed)
+    app.launch(server_name=host, server_port=port, prevent_thread_lock=True, quiet=True)
+    url = f"http://{host}:{port}/"
+    if ready is not None:
+        ready.put(url)
+    logger.info(f"Fake FLUX app listening on {url} (latency {latency})")
+    app.block_thread()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake FLUX Gradio app for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--latency", default="lognormal:2.0:0.3", help="Latency distribution spec")
+    parser.add_argument("--seed", type=int, default=2)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    serve(args.host, args.port, args.latency, args.seed)
+
+
+if __name__ == "__main__":
+    main()
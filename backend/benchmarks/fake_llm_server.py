@@ -0,0 +1,170 @@
+"""
+Fake LLM endpoint for the offline benchmarks.
+
+Speaks the OpenAI chat-completions protocol (POST /v1/chat/completions, with and without
+stream=true), so LiteLLM can call it through `model="openai/<name>"` and `api_base`. The
+answers follow the crewAI ReAct format well enough to drive the Mininos crew end to end:
+the image agent calls the FLUX tool once and then finishes, the formatter returns JSON and
+every other agent returns a block of text. With an error rate, that share of the requests
+fails with a 503 (after the latency), to exercise retries and model failover.
+
+    python -m benchmarks.fake_llm_server --port 8001 --latency lognormal:0.8:0.4 --error-rate 0.1
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from benchmarks.latency import LatencyDistribution
+
+logger = logging.getLogger(__name__)
+
+FLUX_TOOL_NAME = "FLUX Image Generator"
+_WORDS = ("cats", "curious", "whiskers", "nap", "sunlight", "purr", "playful", "independent",
+          "companions", "gentle", "agile", "window", "yarn", "explore", "quiet", "evening")
+
+
+def _filler(words: int, seed: int) -> str:
+    return " ".join(_WORDS[(seed + i * 7) % len(_WORDS)] for i in range(words)).capitalize() + "."
+
+
+def build_answer(messages: List[Dict[str, Any]], completion_words: int) -> str:
+    """crewAI-style completion for the conversation so far."""
+    last = str(messages[-1].get("content", "")) if messages else ""
+    full = "\n".join(str(m.get("content", "")) for m in messages)
+    seed = len(full)
+    if "Observation:" in last:
+        return f"Thought: I now know the final answer\nFinal Answer: Images generated.\n{last.split('Observation:', 1)[1].strip()}"
+    if FLUX_TOOL_NAME in full:
+        spec = ("prompt: a curious cat reading a blog post, format: hd; "
+                "prompt: a playful cat for social media, formats: instagram_square, twitter_post, linkedin_post")
+        return (f"Thought: I need to generate the images\nAction: {FLUX_TOOL_NAME}\n"
+                f"Action Input: {json.dumps({'arguments': spec})}")
+    if "JSON object" in full:
+        payload = {network: _filler(40, seed + i) for i, network in enumerate(("instagram", "twitter", "linkedin"))}
+        return f"Thought: I now know the final answer\nFinal Answer: {json.dumps(payload)}"
+    return f"Thought: I now know the final answer\nFinal Answer: {_filler(completion_words, seed)}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeLLM/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):  # Silence per-request logging
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "bench", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server: "FakeLLMServer" = self.server  # type: ignore[assignment]
+        messages = request.get("messages", [])
+        answer = build_answer(messages, server.completion_words)
+        delay = server.next_delay()
+        if server.next_fails():
+            time.sleep(delay)
+            self._send_json(503, {"error": {"message": "The model is overloaded", "type": "server_error"}})
+            return
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer) // 4,
+                 "total_tokens": prompt_tokens + len(answer) // 4}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get("model", "bench")
+
+        if not request.get("stream"):
+            time.sleep(delay)
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        # Streaming: the delay is spread over the chunks (time to first token = 1 chunk)
+        chunks = [answer[i:i + 16] for i in range(0, len(answer), 16)] or [""]
+        per_chunk = delay / len(chunks)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, piece in enumerate(chunks):
+            time.sleep(per_chunk)
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": {"content": piece},
+                                                  "finish_reason": "stop" if i == len(chunks) - 1 else None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str, port: int, latency: LatencyDistribution, completion_words: int = 300,
+                 error_rate: float = 0.0, seed: Optional[int] = 1):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.completion_words = completion_words
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._latency_lock = threading.Lock()
+
+    def next_delay(self) -> float:
+        with self._latency_lock:
+            return self.latency.sample()
+
+    def next_fails(self) -> bool:
+        with self._latency_lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+
+def serve(host: str = "127.0.0.1", port: int = 0, latency: str = "fixed:0.5", seed: Optional[int] = 1,
+          completion_words: int = 300, error_rate: float = 0.0, ready=None) -> None:
+    """Runs the server forever. `ready` (a multiprocessing queue) receives the bound port."""
+    server = FakeLLMServer(host, port, LatencyDistribution(latency, seed=seed), completion_words,
+                           error_rate=error_rate, seed=seed)
+    if ready is not None:
+        ready.put(server.server_address[1])
+    logger.info(f"Fake LLM listening on http://{host}:{server.server_address[1]}/v1 (latency {latency}, "
+                f"error rate {error_rate})")
+    server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible fake LLM for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="lognormal:0.8:0.4", help="Latency distribution spec")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--completion-words", type=int, default=300)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 503")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    serve(args.host, args.port, args.latency, args.seed, args.completion_words, args.error_rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import math
+import random
+from typing import Callable, List, Optional, Sequence
+
+
+class LatencyDistribution:
+    """
+    Latency model for the fake upstreams, parsed from a compact spec:
+
+        fixed:0.5               always 0.5s
+        uniform:0.2:1.0         uniform between 0.2s and 1.0s
+        normal:0.8:0.2          normal (mean, stddev), clipped at 0
+        lognormal:0.8:0.4       lognormal with the given median and sigma (long tail)
+        exp:0.5                 exponential with the given mean
+
+    Sampling is seeded so repeated benchmark runs see the same sequence of delays.
+    """
+
+    def __init__(self, spec: str, seed: Optional[int] = None):
+        self.spec = spec
+        self._random = random.Random(seed)
+        kind, *raw = spec.split(":")
+        try:
+            params = [float(value) for value in raw]
+        except ValueError:
+            raise ValueError(f"Invalid latency spec '{spec}'")
+        samplers = {
+            "fixed": (1, lambda p: p[0]),
+            "uniform": (2, lambda p: self._random.uniform(p[0], p[1])),
+            "normal": (2, lambda p: self._random.gauss(p[0], p[1])),
+            "lognormal": (2, lambda p: self._random.lognormvariate(math.log(p[0]), p[1])),
+            "exp": (1, lambda p: self._random.expovariate(1.0 / p[0])),
+        }
+        if kind not in samplers or len(params) != samplers[kind][0]:
+            raise ValueError(f"Invalid latency spec '{spec}'. Kinds: fixed, uniform, normal, lognormal, exp")
+        sampler: Callable[[List[float]], float] = samplers[kind][1]
+        self._sample = lambda: max(0.0, sampler(params))
+
+    def sample(self) -> float:
+        return self._sample()
+
+    def __repr__(self) -> str:
+        return f"LatencyDistribution({self.spec!r})"
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """Linear-interpolated percentile (pct in 0..100) of `values`; None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(math.floor(rank))
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: Sequence[float]) -> dict:
+    """count/mean/min/max and p50/p95/p99 of a list of seconds, rounded to 0.1 ms."""
+    if not values:
+        return {"count": 0}
+
+    def r(value: Optional[float]) -> Optional[float]:
+        return round(value, 4) if value is not None else None
+
+    return {
+        "count": len(values),
+        "mean": r(sum(values) / len(values)),
+        "min": r(min(values)),
+        "max": r(max(values)),
+        "p50": r(percentile(values, 50)),
+        "p95": r(percentile(values, 95)),
+        "p99": r(percentile(values, 99)),
+    }
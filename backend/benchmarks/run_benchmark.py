@@ -0,0 +1,290 @@
+"""
+Offline end-to-end benchmark of `Mininos.run_crew_and_get_results`.
+
+Starts a fake OpenAI-compatible LLM server (LiteLLM talks to it over HTTP) and a fake FLUX
+upstream (a local Gradio app with --flux gradio, otherwise an in-process client), then runs
+the full crew at each requested concurrency level and writes a JSON report:
+
+- startup: import time, first (cold) Mininos construction, spawn() cost
+- per scenario: end-to-end p50/p95/p99, per-task latency, throughput, errors
+- peak RSS of the benchmark process
+
+With --fast-llm-latency a second fake LLM serves the fast model tier and the agents get their
+models from the router (agents.yaml `llm` settings, src.model_router); the report then adds
+the health of each model. --llm-error-rate makes the quality model fail to exercise failover.
+
+Run from backend/:
+
+    python -m benchmarks.run_benchmark --runs 20 --concurrency 1,4,8 --mode dag
+    python -m benchmarks.run_benchmark --fast-llm-latency lognormal:0.3:0.3 --llm-error-rate 0.2
+    python -m benchmarks.compare output/benchmarks/old.json output/benchmarks/new.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks import fake_flux, fake_llm_server
+from benchmarks.latency import summarize
+
+logger = logging.getLogger("benchmarks")
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parent.parent
+DEFAULT_OUTPUT_DIR = BACKEND_DIR / "output" / "benchmarks"
+
+
+def _start_server(target, **kwargs) -> Tuple[multiprocessing.Process, Any]:
+    """Runs a fake upstream in a child process and waits for its address."""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, kwargs={**kwargs, "ready": ready}, daemon=True)
+    process.start()
+    try:
+        return process, ready.get(timeout=60)
+    except Exception:
+        process.terminate()
+        raise RuntimeError(f"Fake upstream {target.__module__} did not start")
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class TaskTimer:
+    """Records how long each crew task takes, per generation, by wrapping Task.execute_sync."""
+
+    def __init__(self):
+        self.instances: Dict[str, Any] = {}
+        self.durations: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def install(self) -> None:
+        from crewai import Task
+        from src.run_context import current_generation_id
+
+        original = Task.execute_sync
+        timer = self
+
+        def timed_execute_sync(task, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(task, *args, **kwargs)
+            finally:
+                timer.record(current_generation_id(), task, time.perf_counter() - started)
+
+        Task.execute_sync = timed_execute_sync
+
+    def record(self, generation_id: Optional[str], task, seconds: float) -> None:
+        instance = self.instances.get(generation_id)
+        name = "unknown"
+        if instance is not None:
+            for index, candidate in enumerate(instance.tasks):
+                if candidate is task:
+                    name = instance.blueprint.layout[index][0]
+                    break
+        with self._lock:
+            self.durations.setdefault(name, []).append(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.durations = {}
+
+
+def run_scenario(template, timer: TaskTimer, runs: int, concurrency: int, label: str,
+                 progress_callback: Optional[Callable[[str, Dict], None]] = None) -> Dict[str, Any]:
+    timer.reset()
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    def one_run(index: int) -> float:
+        generation_id = f"bench-{label}-{index}"
+        instance = template.spawn(f"benchmark topic {index}", generation_id, progress_callback)
+        timer.instances[generation_id] = instance
+        started = time.perf_counter()
+        try:
+            result = instance.run_crew_and_get_results()
+        finally:
+            timer.instances.pop(generation_id, None)
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("message", "run failed"))
+        return time.perf_counter() - started
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as executor:
+        futures = [executor.submit(one_run, i) for i in range(runs)]
+        for future in as_completed(futures):
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors.append(str(e))
+    wall = time.perf_counter() - wall_started
+
+    return {
+        "label": label,
+        "mode": template.execution_mode,
+        "concurrency": concurrency,
+        "runs": runs,
+        "succeeded": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_seconds": round(wall, 3),
+        "throughput_runs_per_minute": round(len(latencies) / wall * 60, 3) if wall > 0 else None,
+        "end_to_end": summarize(latencies),
+        "tasks": {name: summarize(values) for name, values in sorted(timer.durations.items())},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for the Mininos crew")
+    parser.add_argument("--runs", type=int, default=10, help="Crew runs per concurrency level")
+    parser.add_argument("--concurrency", default="1,4", help="Comma-separated concurrency levels")
+    parser.add_argument("--mode", choices=["sequential", "dag"], default="sequential")
+    parser.add_argument("--stream", action="store_true", help="Use LLM token streaming")
+    parser.add_argument("--llm-latency", default="lognormal:0.8:0.4", help="Fake LLM latency spec")
+    parser.add_argument("--fast-llm-latency", help="Latency spec of a fake fast-tier LLM (enables model routing)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Share of fake LLM requests failing with 503")
+    parser.add_argument("--flux-latency", default="lognormal:2.0:0.3", help="Fake FLUX latency spec")
+    parser.add_argument("--flux", choices=["auto", "gradio", "inprocess"], default="auto",
+                        help="Fake FLUX flavour: a local Gradio app (needs gradio) or an in-process client")
+    parser.add_argument("--flux-port", type=int, default=7861, help="Port of the fake FLUX Gradio app")
+    parser.add_argument("--completion-words", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON report path (default: output/benchmarks/bench-<time>-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    # Isolate the run: no caches (every run must hit the fakes), outputs in a temp dir
+    work_dir = pathlib.Path(tempfile.mkdtemp(prefix="mewai-bench-"))
+    os.environ.update({
+        "LLM_CACHE": "off", "IMAGE_CACHE": "off", "GENERATION_STORE": "off", "CREW_CHECKPOINTS": "off",
+        "CREWAI_DISABLE_TELEMETRY": "true",
+        "OTEL_SDK_DISABLED": "true", "MODEL": "gemini/unused", "GOOGLE_API_KEY": "unused",
+    })
+    # Same queued logging pipeline as the API (console only: the report is the benchmark's output)
+    from src.logging_setup import configure_logging
+    configure_logging(log_file="off")
+
+    llm_process, llm_port = _start_server(fake_llm_server.serve, latency=args.llm_latency, seed=args.seed,
+                                          completion_words=args.completion_words, error_rate=args.llm_error_rate)
+    fast_llm_process = None
+    if args.fast_llm_latency:
+        fast_llm_process, fast_llm_port = _start_server(fake_llm_server.serve, latency=args.fast_llm_latency,
+                                                        seed=args.seed + 2, completion_words=args.completion_words)
+        # Quality tier on the first fake, fast tier (failing over to quality) on the second
+        os.environ.update({
+            "MODEL": "openai/bench", "MODEL_BASE_URL": f"http://127.0.0.1:{llm_port}/v1", "MODEL_API_KEY": "bench",
+            "MODEL_FAST": "openai/bench-fast", "MODEL_FAST_BASE_URL": f"http://127.0.0.1:{fast_llm_port}/v1",
+            "MODEL_FAST_API_KEY": "bench",
+        })
+    flux_process = None
+    flux_mode = args.flux
+    if flux_mode == "auto":
+        try:
+            import gradio  # noqa: F401
+            flux_mode = "gradio"
+        except ImportError:
+            flux_mode = "inprocess"
+    if flux_mode == "gradio":
+        flux_process, flux_url = _start_server(fake_flux.serve, port=args.flux_port, latency=args.flux_latency,
+                                               seed=args.seed + 1)
+    else:
+        fake_flux.FakeFluxClient.configure(args.flux_latency, seed=args.seed + 1)
+
+    try:
+        import_started = time.perf_counter()
+        from src.crew import Mininos
+        from src.llm import MininosLLM
+        from src.model_router import all_model_health
+        from src.tools.FluxImageGeneratorTool import FluxImageGeneratorTool
+        from src.tools.gradio_pool import GradioClientPool
+        import_seconds = time.perf_counter() - import_started
+
+        setup_started = time.perf_counter()
+        if flux_mode == "gradio":
+            pool = GradioClientPool(src=flux_url, size=4)
+        else:
+            pool = GradioClientPool(src="fake-flux", size=4, client_factory=fake_flux.FakeFluxClient)
+        tool = FluxImageGeneratorTool(save_dir=str(work_dir / "images"), client_pool=pool)
+        llm = None if fast_llm_process else MininosLLM(model="openai/bench", base_url=f"http://127.0.0.1:{llm_port}/v1",
+                                                       api_key="bench", temperature=0.6)
+        template = Mininos(topic=None, execution_mode=args.mode, llm=llm, image_generator_tool=tool,
+                           stream=args.stream)
+        setup_seconds = time.perf_counter() - setup_started
+
+        spawn_started = time.perf_counter()
+        for i in range(100):
+            template.spawn(f"topic {i}", f"spawn-{i}")
+        spawn_seconds = (time.perf_counter() - spawn_started) / 100
+
+        timer = TaskTimer()
+        timer.install()
+        # Streaming needs a progress_callback; events are discarded, only the transport is measured
+        progress_callback = (lambda generation_id, info: None) if args.stream else None
+
+        scenarios = []
+        for concurrency in levels:
+            label = f"{args.mode}-c{concurrency}"
+            logger.info(f"Running scenario {label}: {args.runs} runs")
+            scenarios.append(run_scenario(template, timer, args.runs, concurrency, label, progress_callback))
+
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "config": {**vars(args), "flux": flux_mode},
+            },
+            "startup": {
+                "import_seconds": round(import_seconds, 4),
+                "setup_seconds": round(setup_seconds, 4),
+                "spawn_seconds": round(spawn_seconds, 6),
+            },
+            "scenarios": scenarios,
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+        if fast_llm_process:
+            report["models"] = all_model_health()
+    finally:
+        llm_process.terminate()
+        if fast_llm_process is not None:
+            fast_llm_process.terminate()
+        if flux_process is not None:
+            flux_process.terminate()
+
+    output = pathlib.Path(args.output) if args.output else (
+        DEFAULT_OUTPUT_DIR / f"bench-{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    logger.info(f"Benchmark report written to {output}")
+    for scenario in scenarios:
+        e2e = scenario["end_to_end"]
+        logger.info(f"{scenario['label']}: p50={e2e.get('p50')}s p95={e2e.get('p95')}s p99={e2e.get('p99')}s "
+                    f"throughput={scenario['throughput_runs_per_minute']} runs/min errors={scenario['errors']}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Mantenimiento del almacén de imágenes (src/tools/image_store.py):
+
+    python -m scripts.image_store stats
+    python -m scripts.image_store gc --max-bytes 1G --max-age-days 30
+
+`gc` aplica las cuotas (por defecto las de IMAGE_STORE_MAX_BYTES / IMAGE_STORE_MAX_AGE_DAYS);
+con --include-untracked también borra las imágenes antiguas que no están en el índice.
+"""
+import argparse
+import logging
+import pathlib
+from typing import List, Optional
+
+from src.tools.FluxImageGeneratorTool import DEFAULT_SAVE_DIR
+from src.tools.image_store import parse_size, store_from_env
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="MewAI image store maintenance")
+    parser.add_argument("command", choices=["gc", "stats"])
+    parser.add_argument("--dir", default=str(DEFAULT_SAVE_DIR), help="Images directory (default: output/images)")
+    parser.add_argument("--max-bytes", help="Total size quota, e.g. 500M or 2G (default: env IMAGE_STORE_MAX_BYTES)")
+    parser.add_argument("--max-age-days", type=float, help="Remove images not used for this many days")
+    parser.add_argument("--include-untracked", action="store_true",
+                        help="Also remove old image files that are not in the index (legacy outputs)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    store = store_from_env(pathlib.Path(args.dir))
+    if args.command == "stats":
+        print(store.stats())
+        return
+    print(store.gc(max_bytes=parse_size(args.max_bytes) if args.max_bytes else None,
+                   max_age_seconds=args.max_age_days * 86400 if args.max_age_days else None,
+                   include_untracked=args.include_untracked))
+
+
+if __name__ == "__main__":
+    main()
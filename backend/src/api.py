@@ -0,0 +1,320 @@
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel, Field
+
+from src.blueprint import load_blueprint
+from src.crew import CONFIG_DIR, Mininos, OUTPUT_DIR, EXECUTION_MODES
+from src.generation_store import build_generation_store_from_env
+from src.jobs import (JobStore, JobEvents, JobWorkerPool, JOB_CANCELLED, JOB_QUEUED, JOB_RUNNING, FINISHED_STATES)
+from src.logging_setup import configure_logging, shutdown_logging
+from src.model_router import all_model_health
+from src.ratelimit import all_limiter_metrics
+from src.tools.FluxImageGeneratorTool import FluxImageGeneratorTool
+from src.tools.flux_balancer import all_balancer_metrics
+from src.tools.image_store import ImageStore, store_from_env
+from src import cancellation, telemetry
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file in the backend directory
+load_dotenv(dotenv_path=pathlib.Path(__file__).parent.parent / '.env')
+
+# Settings (env)
+IMAGES_DIR = OUTPUT_DIR / "images"
+JOBS_DB_PATH = os.getenv('JOBS_DB_PATH', str(OUTPUT_DIR / "jobs.sqlite3"))
+try:
+    API_WORKERS = int(os.getenv('API_WORKERS', 2))
+except ValueError:
+    logger.warning("Invalid API_WORKERS in .env, using default 2")
+    API_WORKERS = 2
+
+
+class GenerationRequest(BaseModel):
+    topic: str = Field(..., min_length=1, description="Topic for the content generation")
+    execution_mode: Optional[str] = Field(default=None, description="'sequential' or 'dag'")
+    stream: bool = Field(default=False, description="Stream LLM token deltas as progress events")
+    reuse_drafts: bool = Field(default=True, description="Reuse the draft of a near-duplicate earlier topic "
+                                                         "(false forces a fresh draft)")
+    reuse_threshold: Optional[float] = Field(default=None, ge=0.0, le=1.0,
+                                             description="Topic similarity needed to reuse a draft "
+                                                         "(default TOPIC_REUSE_THRESHOLD)")
+
+
+class ResumeRequest(BaseModel):
+    rerun: Optional[List[str]] = Field(default=None, description="Tasks to recompute (with their dependents), "
+                                                                 "e.g. ['format_post'] after editing tasks.yaml")
+
+
+class GenerationService:
+    """Interface between the API and the crew: job queue, workers and shared crew resources."""
+
+    def __init__(self, db_path: str = JOBS_DB_PATH, workers: int = API_WORKERS):
+        self.store = JobStore(db_path)
+        self.events = JobEvents()
+        self.pool = JobWorkerPool(self.store, self.events, self._run_job, workers=workers)
+        # Generation history, also available before the crew (LLM, tools) is first built
+        self.history = build_generation_store_from_env(default_dir=OUTPUT_DIR / "generations")
+        self._template: Optional[Mininos] = None
+        self._template_lock = threading.Lock()
+        self._image_store: Optional[ImageStore] = None
+        self._image_store_lock = threading.Lock()
+
+    def _get_template(self) -> Mininos:
+        """LLM, image tool and configurations are built once and shared by every job."""
+        with self._template_lock:
+            if self._template is None:
+                tool = FluxImageGeneratorTool(save_dir=str(IMAGES_DIR), image_store=self.image_store())
+                self._template = Mininos(topic=None, generation_store=self.history, image_generator_tool=tool)
+            return self._template
+
+    def image_store(self) -> ImageStore:
+        """Image store (content-addressed outputs and their index), shared with the FLUX tool of the crew.
+        Opened on its own: listing images needs no LLM configuration."""
+        with self._image_store_lock:
+            if self._image_store is None:
+                self._image_store = store_from_env(IMAGES_DIR)
+            return self._image_store
+
+    def _run_job(self, job: Dict[str, Any], progress_callback: Callable[[str, Dict], None]) -> Dict[str, Any]:
+        options = job.get("options", {})
+        instance = self._get_template().spawn(job["topic"], job["id"], progress_callback)
+        if options.get("execution_mode") in EXECUTION_MODES:
+            instance.execution_mode = options["execution_mode"]
+        instance.stream = bool(options.get("stream", False))
+        instance.reuse_drafts = bool(options.get("reuse_drafts", True))
+        if options.get("reuse_threshold") is not None:
+            instance.reuse_threshold = float(options["reuse_threshold"])
+        # Always resumable: a new job has no checkpoints, one re-queued after a restart or through
+        # /resume continues from the tasks it had completed
+        return instance.run_crew_and_get_results(resume=True, rerun=options.get("rerun"))
+
+    def start_generation(self, request: GenerationRequest) -> Dict[str, Any]:
+        job = self.store.create(request.topic, options=request.model_dump(exclude={"topic"}))
+        self.events.publish(job["id"], {"type": "status", "status": job["status"]})
+        self.pool.notify()
+        return job
+
+    def get_generation_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def stop_generation(self, job_id: str) -> Dict[str, Any]:
+        job = self.store.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if self.store.cancel_if_queued(job_id):
+            self.events.publish(job_id, {"type": "status", "status": JOB_CANCELLED})
+        elif job["status"] == JOB_RUNNING and cancellation.cancel(job_id):
+            # The crew stops at its next agent step or tool call; the worker then finishes the
+            # job as cancelled with the outputs of the completed tasks
+            self.store.update_progress(job_id, None, "Cancelling")
+        return self.store.get(job_id)
+
+    def resume_generation(self, job_id: str, request: ResumeRequest) -> Optional[Dict[str, Any]]:
+        """Re-queues a finished job; it reuses its checkpointed task outputs. None if the job is still active."""
+        job = self.store.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        options = {**job.get("options", {}), "rerun": request.rerun}
+        if not self.store.requeue(job_id, options):
+            return None
+        self.events.publish(job_id, {"type": "status", "status": JOB_QUEUED})
+        self.pool.notify()
+        return self.store.get(job_id)
+
+
+# Created at startup (see lifespan): importing this module writes nothing to disk
+service: Optional[GenerationService] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global service
+    configure_logging()
+    IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+    service = GenerationService()
+    service.pool.start()
+    yield
+    service.pool.stop()
+    telemetry.shutdown()
+    shutdown_logging()
+
+
+app = FastAPI(title="MewAI Generation API", lifespan=lifespan)
+
+# HTTP spans share the tracer provider of the crew spans (only if tracing is enabled, see src.telemetry)
+if telemetry.tracer_provider() is not None:
+    try:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        FastAPIInstrumentor.instrument_app(app, tracer_provider=telemetry.tracer_provider(),
+                                           excluded_urls="/metrics")
+    except ImportError:
+        logger.warning("opentelemetry-instrumentation-fastapi not installed, HTTP requests are not traced")
+
+# Images written by FluxImageGeneratorTool are referenced as /generated_images/<file>
+# (the directory is created at startup)
+app.mount("/generated_images", StaticFiles(directory=str(IMAGES_DIR), check_dir=False), name="generated_images")
+
+
+@app.post("/api/generation/start", status_code=202)
+async def start_generation(request: GenerationRequest) -> Dict[str, Any]:
+    return await asyncio.to_thread(service.start_generation, request)
+
+
+@app.get("/api/generation")
+async def list_generations(status: Optional[str] = None,
+                           limit: int = Query(default=50, ge=1, le=500),
+                           offset: int = Query(default=0, ge=0)) -> Dict[str, Any]:
+    jobs = await asyncio.to_thread(service.store.list, status, limit, offset)
+    return {"items": jobs, "limit": limit, "offset": offset}
+
+
+@app.get("/api/generation/{job_id}")
+async def get_generation(job_id: str) -> Dict[str, Any]:
+    job = await asyncio.to_thread(service.get_generation_status, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Generation not found")
+    return job
+
+
+@app.post("/api/generation/{job_id}/stop")
+async def stop_generation(job_id: str) -> Dict[str, Any]:
+    try:
+        return await asyncio.to_thread(service.stop_generation, job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Generation not found")
+
+
+@app.post("/api/generation/{job_id}/resume", status_code=202)
+async def resume_generation(job_id: str, request: Optional[ResumeRequest] = None) -> Dict[str, Any]:
+    request = request or ResumeRequest()
+    task_keys = load_blueprint(CONFIG_DIR).task_keys
+    unknown = sorted(set(request.rerun or ()).difference(task_keys))
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown tasks {unknown}, expected any of {task_keys}")
+    try:
+        job = await asyncio.to_thread(service.resume_generation, job_id, request)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Generation not found")
+    if job is None:
+        raise HTTPException(status_code=409, detail="Generation is still queued or running")
+    return job
+
+
+@app.get("/api/images")
+async def list_images(generation_id: Optional[str] = None,
+                      prompt: Optional[str] = None,
+                      image_format: Optional[str] = Query(default=None, alias="format"),
+                      kind: Optional[str] = None,
+                      limit: int = Query(default=100, ge=1, le=1000),
+                      offset: int = Query(default=0, ge=0)) -> Dict[str, Any]:
+    """Generated images from the image store index (no directory scan)."""
+    store = service.image_store()
+    items = await asyncio.to_thread(store.find, generation_id, prompt, image_format, kind, limit, offset)
+    return {"items": items, "limit": limit, "offset": offset}
+
+
+def _history_store():
+    store = service.history
+    if store is None:
+        raise HTTPException(status_code=404, detail="Generation history is disabled (GENERATION_STORE=off)")
+    return store
+
+
+@app.get("/api/history")
+async def list_history(topic: Optional[str] = Query(default=None, description="Case-insensitive topic prefix"),
+                       status: Optional[str] = None,
+                       since: Optional[float] = Query(default=None, description="Unix timestamp (inclusive)"),
+                       until: Optional[float] = Query(default=None, description="Unix timestamp (exclusive)"),
+                       limit: int = Query(default=50, ge=1, le=500),
+                       offset: int = Query(default=0, ge=0)) -> Dict[str, Any]:
+    """Stored generations, newest first, without their drafts (see /api/history/{id})."""
+    store = _history_store()
+    items = await asyncio.to_thread(store.list, topic, status, since, until, limit, offset)
+    total = await asyncio.to_thread(store.count, topic, status, since, until)
+    return {"items": items, "total": total, "limit": limit, "offset": offset}
+
+
+@app.get("/api/history/stats")
+async def history_stats(since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+    return await asyncio.to_thread(_history_store().stats, since, until)
+
+
+@app.get("/api/history/export")
+async def export_history(export_format: str = Query(default="ndjson", alias="format", pattern="^(ndjson|markdown)$"),
+                         topic: Optional[str] = None,
+                         status: Optional[str] = None,
+                         since: Optional[float] = None,
+                         until: Optional[float] = None) -> StreamingResponse:
+    """Streams the matching generations as NDJSON or Markdown (read from the store in batches)."""
+    store = _history_store()
+    filters = {"topic": topic, "status": status, "since": since, "until": until}
+    if export_format == "markdown":
+        return StreamingResponse(store.export_markdown(**filters), media_type="text/markdown; charset=utf-8",
+                                 headers={"Content-Disposition": 'attachment; filename="generations.md"'})
+    return StreamingResponse(store.export_ndjson(**filters), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": 'attachment; filename="generations.ndjson"'})
+
+
+@app.get("/api/history/{generation_id}")
+async def get_history(generation_id: str) -> Dict[str, Any]:
+    record = await asyncio.to_thread(_history_store().get, generation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Generation not found in history")
+    return record
+
+
+@app.get("/api/metrics/rate-limits")
+async def rate_limit_metrics() -> Dict[str, Any]:
+    """Queue time, throttle events, retries and current concurrency limit per upstream."""
+    return all_limiter_metrics()
+
+
+@app.get("/api/metrics/models")
+async def model_health_metrics() -> Dict[str, Any]:
+    """Recent p95 latency, error rate and degraded state of each LLM the router uses."""
+    return all_model_health()
+
+
+@app.get("/api/metrics/image-endpoints")
+async def image_endpoint_metrics() -> Dict[str, Any]:
+    """Outstanding requests, latency percentiles, circuit state and hedges of each FLUX endpoint."""
+    return all_balancer_metrics()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint: run/task/LLM/image latency histograms, token and error counters."""
+    return PlainTextResponse(telemetry.render_metrics(), media_type=telemetry.PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/api/generation/{job_id}/events")
+async def generation_events(job_id: str, since: int = Query(default=0, ge=0)) -> StreamingResponse:
+    """Server-Sent Events stream of the job's progress events until it finishes."""
+    if await asyncio.to_thread(service.get_generation_status, job_id) is None:
+        raise HTTPException(status_code=404, detail="Generation not found")
+
+    async def event_stream():
+        seq = since
+        while True:
+            for event in service.events.since(job_id, seq):
+                seq = event["seq"] + 1
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+            job = await asyncio.to_thread(service.get_generation_status, job_id)
+            if job is None or (job["status"] in FINISHED_STATES and not service.events.since(job_id, seq)):
+                yield f"event: end\ndata: {json.dumps({'status': job['status'] if job else None})}\n\n"
+                return
+            await asyncio.sleep(0.25)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
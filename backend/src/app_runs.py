@@ -0,0 +1,158 @@
+"""
+Background crew runs for the Streamlit app.
+
+The app script only submits runs and polls them: each run executes in a worker thread of a
+shared pool, and its progress events (the `progress_callback` of `Mininos`) are put in a
+thread-safe queue that the script drains on every rerun. Several runs can proceed side by
+side (up to `max_workers`, env STREAMLIT_MAX_RUNS); the rest wait in the pool's queue.
+
+The pool is meant to be created once per process (`st.cache_resource`), so it outlives
+reruns and is shared by every browser session; a session keeps the ids of its runs.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from src import cancellation
+from src.jobs import JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED, FINISHED_STATES
+
+logger = logging.getLogger(__name__)
+
+# Finished runs kept for their sessions to read; older ones are forgotten
+MAX_FINISHED_RUNS = 50
+
+
+class _Run:
+    def __init__(self, run_id: str, topic: str, options: Dict[str, Any]):
+        self.id = run_id
+        self.topic = topic
+        self.options = options
+        self.status = JOB_QUEUED
+        self.events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+
+
+class AppRunPool:
+    """
+    Runs crews in background threads. `submit` returns the run id at once; `poll(run_id)`
+    returns the progress events received since the previous poll and `get(run_id)` the run's
+    status and, once finished, its result. `cancel(run_id)` stops a run (see src.cancellation):
+    a queued run never starts, a running one returns its partial result as 'cancelled'.
+
+    `template` is a `Mininos` whose LLM, image tool and configurations every run shares
+    (see `Mininos.spawn`).
+    """
+
+    def __init__(self, template, max_workers: int = 2):
+        self.template = template
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mininos-app-run")
+        self._runs: Dict[str, _Run] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, topic: str, progress_callback: Optional[Callable[[str, Dict], None]] = None,
+               **options) -> str:
+        """
+        Queues a crew run for `topic`; returns its id (also its generation_id). Options are
+        applied to the spawned instance: stream, execution_mode. `progress_callback`, if
+        given, is called in the worker thread before each event is queued for the UI.
+        """
+        run = _Run(f"st-{uuid.uuid4()}", topic, options)
+        with self._lock:
+            self._runs[run.id] = run
+        run.events.put({"event": "status", "status": JOB_QUEUED})
+        self._executor.submit(self._execute, run, progress_callback)
+        logger.info(f"[{run.id}] Queued app run for topic '{topic}'")
+        return run.id
+
+    def _execute(self, run: _Run, progress_callback: Optional[Callable[[str, Dict], None]]) -> None:
+        def publish(generation_id: str, progress_info: Dict[str, Any]) -> None:
+            if run.cancel_requested:
+                cancellation.cancel(generation_id) # Requested before the run registered its token
+            if progress_callback is not None:
+                try:
+                    progress_callback(generation_id, progress_info)
+                except Exception as e:
+                    logger.error(f"[{generation_id}] Error in progress callback: {e}")
+            run.events.put(progress_info)
+
+        if run.cancel_requested:
+            run.status, run.finished_at, run.error = JOB_CANCELLED, time.time(), "Cancelled before start"
+            run.events.put({"event": "status", "status": run.status})
+            self._forget_old_runs()
+            return
+        run.status, run.started_at = JOB_RUNNING, time.time()
+        run.events.put({"event": "status", "status": JOB_RUNNING})
+        try:
+            instance = self.template.spawn(run.topic, run.id, publish)
+            if run.options.get("execution_mode"):
+                instance.execution_mode = run.options["execution_mode"]
+            if run.options.get("stream") is not None:
+                instance.stream = bool(run.options["stream"])
+            run.result = instance.run_crew_and_get_results()
+            if run.result.get("status") == "success":
+                run.status = JOB_DONE
+            elif run.result.get("status") == cancellation.CANCELLED:
+                run.status, run.error = JOB_CANCELLED, run.result.get("message")
+            else:
+                run.status, run.error = JOB_FAILED, run.result.get("message", "Crew run failed")
+        except Exception as e:
+            logger.error(f"[{run.id}] App run failed: {e}", exc_info=True)
+            run.status, run.error = JOB_FAILED, str(e)
+        run.finished_at = time.time()
+        run.events.put({"event": "status", "status": run.status})
+        self._forget_old_runs()
+
+    def _forget_old_runs(self) -> None:
+        with self._lock:
+            finished = sorted((r for r in self._runs.values() if r.status in FINISHED_STATES),
+                              key=lambda r: r.finished_at or 0)
+            for run in finished[:max(len(finished) - MAX_FINISHED_RUNS, 0)]:
+                del self._runs[run.id]
+
+    def cancel(self, run_id: str) -> bool:
+        """Requests a run to stop; False if it is unknown or already finished."""
+        run = self._runs.get(run_id)
+        if run is None or run.status in FINISHED_STATES:
+            return False
+        run.cancel_requested = True
+        # A run that has not registered its token yet picks the flag up at its next progress event
+        cancellation.cancel(run_id)
+        logger.info(f"[{run_id}] Cancellation requested for app run")
+        return True
+
+    def poll(self, run_id: str) -> List[Dict[str, Any]]:
+        """Progress events of a run received since the last poll (never blocks)."""
+        run = self._runs.get(run_id)
+        events = []
+        while run is not None:
+            try:
+                events.append(run.events.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Status of a run (with its result once finished), or None if unknown or forgotten."""
+        run = self._runs.get(run_id)
+        if run is None:
+            return None
+        return {"id": run.id, "topic": run.topic, "options": run.options, "status": run.status,
+                "result": run.result, "error": run.error, "created_at": run.created_at,
+                "started_at": run.started_at, "finished_at": run.finished_at}
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for r in self._runs.values() if r.status not in FINISHED_STATES)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,164 @@
+import logging
+import pathlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Crew structure: (task key, agent key, keys of the tasks it needs as context), in execution order
+Layout = Tuple[Tuple[str, str, Tuple[str, ...]], ...]
+
+# Keys of a task in tasks.yaml that wire the crew instead of configuring the crewai.Task
+LAYOUT_KEYS = ("agent", "context")
+
+# Reserved top-level key of tasks.yaml with run-wide settings (e.g. deadline_seconds), not a task
+RUN_SETTINGS_KEY = "crew"
+
+_TOPIC_SENTINEL = "\x00topic\x00"
+
+
+class TopicTemplate:
+    """
+    A config string pre-parsed once: the literal parts around each '{topic}' placeholder.
+    Rendering is a single join. Strings that don't format with only `topic` (other fields,
+    stray braces) are kept verbatim, like the previous `str.format` fallback did.
+    """
+
+    __slots__ = ("parts",)
+
+    def __init__(self, value: str):
+        try:
+            self.parts = value.format(topic=_TOPIC_SENTINEL).split(_TOPIC_SENTINEL)
+        except (KeyError, IndexError, ValueError):
+            self.parts = [value]
+
+    def render(self, topic: Optional[str]) -> str:
+        if len(self.parts) == 1:
+            return self.parts[0]
+        return str(topic).join(self.parts)
+
+
+def build_layout(agents_config: Dict[str, Any], tasks_config: Dict[str, Any]) -> Layout:
+    """
+    Crew layout from tasks.yaml: the tasks in file order, each with its `agent` (a key of
+    agents.yaml) and its `context` (keys of earlier tasks). Invalid entries are logged and
+    left out: a task without a known agent, or a context task that does not run before it.
+    """
+    layout = []
+    for task_key, config in tasks_config.items():
+        config = config or {}
+        agent_key = config.get("agent")
+        if agent_key not in agents_config:
+            logger.error(f"Task '{task_key}' has no agent or an unknown one ({agent_key!r}), leaving it out of the crew")
+            continue
+        context = config.get("context") or ()
+        context = (context,) if isinstance(context, str) else tuple(context)
+        earlier = {key for key, _, _ in layout}
+        for key in context:
+            if key not in earlier:
+                logger.error(f"Context task '{key}' of task '{task_key}' does not run before it, ignoring it")
+        layout.append((task_key, agent_key, tuple(key for key in context if key in earlier)))
+    return tuple(layout)
+
+
+def _compile_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: TopicTemplate(value) if isinstance(value, str) else value for key, value in config.items()}
+
+
+def _render_config(compiled: Dict[str, Any], topic: Optional[str]) -> Dict[str, Any]:
+    return {key: value.render(topic) if isinstance(value, TopicTemplate) else value
+            for key, value in compiled.items()}
+
+
+class CrewBlueprint:
+    """
+    Parsed and pre-compiled agents.yaml/tasks.yaml. Built once per config directory (see
+    `load_blueprint`); each run only substitutes the topic into the compiled strings.
+    The `crew:` section of tasks.yaml is kept apart as `run_settings`, and the `agent` /
+    `context` keys of the tasks give the crew `layout` (see `build_layout`).
+    """
+
+    def __init__(self, agents_config: Dict[str, Any], tasks_config: Dict[str, Any],
+                 config_path: Optional[pathlib.Path] = None, signature: Optional[Tuple] = None):
+        self.agents_config = agents_config or {}
+        self.tasks_config = dict(tasks_config or {})
+        self.run_settings: Dict[str, Any] = self.tasks_config.pop(RUN_SETTINGS_KEY, None) or {}
+        self.config_path = config_path
+        self.signature = signature
+        self._agents = {key: _compile_config(cfg or {}) for key, cfg in self.agents_config.items()}
+        self._tasks = {key: _compile_config({name: value for name, value in (cfg or {}).items()
+                                             if name not in LAYOUT_KEYS})
+                       for key, cfg in self.tasks_config.items()}
+        self.layout: Layout = build_layout(self.agents_config, self.tasks_config)
+        self.task_keys: List[str] = [task_key for task_key, _, _ in self.layout]
+
+    @property
+    def total_tasks(self) -> int:
+        return len(self.layout)
+
+    def agent_config(self, agent_type: str, topic: Optional[str]) -> Dict[str, Any]:
+        """Agent kwargs with the topic substituted. Raises ValueError if the agent is not configured."""
+        compiled = self._agents.get(agent_type)
+        if not compiled:
+            raise ValueError(f"Agent configuration for '{agent_type}' not found.")
+        return _render_config(compiled, topic)
+
+    def task_config(self, task_type: str, topic: Optional[str]) -> Dict[str, Any]:
+        """Task config with the topic substituted. Raises ValueError if the task is not configured."""
+        compiled = self._tasks.get(task_type)
+        if not compiled:
+            raise ValueError(f"Task configuration for '{task_type}' not found.")
+        return _render_config(compiled, topic)
+
+
+def _load_yaml(filename: pathlib.Path) -> dict:
+    """Loads a YAML file and returns its contents ({} if missing or invalid)."""
+    try:
+        with open(filename, 'r', encoding='utf-8') as file:
+            return yaml.safe_load(file) or {}
+    except FileNotFoundError:
+        logger.error(f"Configuration file not found: {filename}")
+        return {}
+    except yaml.YAMLError as e:
+        logger.error(f"Error loading YAML file {filename}: {e}")
+        return {}
+    except Exception as e:
+        logger.error(f"Unexpected error loading {filename}: {e}")
+        return {}
+
+
+def _signature(files: Tuple[pathlib.Path, ...]) -> Tuple:
+    """(mtime_ns, size) of each file; None for missing files."""
+    signature = []
+    for path in files:
+        try:
+            stat = path.stat()
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+_blueprints: Dict[pathlib.Path, CrewBlueprint] = {}
+_blueprints_lock = threading.Lock()
+
+
+def load_blueprint(config_path: pathlib.Path) -> CrewBlueprint:
+    """
+    Returns the compiled blueprint for a config directory. The YAML files are only
+    re-read when their modification time or size changes, so repeated calls cost two stats.
+    """
+    config_path = pathlib.Path(config_path).resolve()
+    files = (config_path / 'agents.yaml', config_path / 'tasks.yaml')
+    signature = _signature(files)
+    with _blueprints_lock:
+        blueprint = _blueprints.get(config_path)
+        if blueprint is not None and blueprint.signature == signature:
+            return blueprint
+        blueprint = CrewBlueprint(_load_yaml(files[0]), _load_yaml(files[1]),
+                                  config_path=config_path, signature=signature)
+        _blueprints[config_path] = blueprint
+    logger.info(f"Configurations loaded from {config_path}")
+    return blueprint
@@ -0,0 +1,350 @@
+"""
+Cooperative cancellation and deadlines for crew runs.
+
+Each running generation has a `CancellationToken` (registered under its generation_id, so
+the API can cancel a run it does not hold). The crew checks it between agent steps (every
+LLM call) and tool calls (`check_cancelled`). Blocking work is wrapped so that a cancel or
+a deadline releases the waiting thread at once:
+
+- `call_cancellable(fn)` runs a blocking request (an LLM completion) on a shared bounded pool
+  and stops waiting when the run is cancelled or its deadline passes. The abandoned request
+  is bounded by its own timeout, which callers cap at the remaining time (`remaining_time`).
+- `wait_future(future, on_abort)` waits for a future (a Gradio job) and cancels it on abort.
+- `sleep(seconds)` is a backoff/queue sleep that wakes up on cancel.
+
+Deadlines: the run deadline lives in the token; a task deadline is scoped to the code run
+for that task (`deadline_scope`, a context variable, so parallel tasks keep their own).
+`cancel_scope(token)` narrows cancellation to a piece of work (e.g. the losing copy of a
+hedged request): cancelling its token aborts only that block, and cancelling the run
+cancels it too.
+`RunCancelled` derives from BaseException, like asyncio.CancelledError: the `except
+Exception` handlers of crewAI (agent retries, tool errors fed back to the agent) must not
+swallow it.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src import telemetry
+from src.run_context import current_generation_id
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+
+
+class RunCancelled(BaseException):
+    """The crew run was cancelled (reason 'cancelled') or ran out of time (reason 'timeout')."""
+
+    def __init__(self, message: str, reason: str = CANCELLED):
+        super().__init__(message)
+        self.reason = reason
+
+
+class DeadlineExceeded(RunCancelled):
+    def __init__(self, message: str):
+        super().__init__(message, reason=TIMEOUT)
+
+
+class CancellationToken:
+    """Cancellation state of one generation, with an optional run deadline (seconds from creation)."""
+
+    def __init__(self, generation_id: str, deadline_seconds: Optional[float] = None):
+        self.generation_id = generation_id
+        self.deadline_seconds = deadline_seconds
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = CANCELLED) -> None:
+        """Cancels the run and wakes every wait on it (idempotent)."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        logger.info(f"[{self.generation_id}] Cancellation requested ({reason})")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"[{self.generation_id}] Error in cancellation callback: {e}")
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Calls `callback` when the run is cancelled (at once if it already is). Returns an unregister function."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the run deadline (None without one)."""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def check(self) -> None:
+        """Raises RunCancelled if the run was cancelled, DeadlineExceeded if its deadline passed."""
+        if self._event.is_set():
+            if self.reason == TIMEOUT:
+                raise DeadlineExceeded(f"Run deadline of {self.deadline_seconds}s exceeded")
+            raise RunCancelled("Run cancelled")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(TIMEOUT)
+            raise DeadlineExceeded(f"Run deadline of {self.deadline_seconds}s exceeded")
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """Waits up to `timeout` seconds for a cancel; True if cancelled."""
+        return self._event.wait(timeout)
+
+
+# --- Process-wide registry (generation_id -> token of its running crew) ---
+_tokens: Dict[str, CancellationToken] = {}
+_tokens_lock = threading.Lock()
+# Deadline (time.monotonic) of the task the current code runs for, and its budget
+_task_deadline: contextvars.ContextVar[Optional[tuple]] = contextvars.ContextVar("task_deadline", default=None)
+# Token of the innermost cancel_scope (cancelled along with the run and the enclosing scopes)
+_scope_token: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar("cancel_scope", default=None)
+
+
+def register(generation_id: str, deadline_seconds: Optional[float] = None) -> CancellationToken:
+    """Token for a run that is starting (replaces the token of a previous run of the same generation)."""
+    token = CancellationToken(generation_id, deadline_seconds)
+    with _tokens_lock:
+        _tokens[generation_id] = token
+    return token
+
+
+def unregister(token: CancellationToken) -> None:
+    with _tokens_lock:
+        if _tokens.get(token.generation_id) is token:
+            del _tokens[token.generation_id]
+
+
+def cancel(generation_id: str, reason: str = CANCELLED) -> bool:
+    """Cancels the running crew of a generation; False if none is running in this process."""
+    with _tokens_lock:
+        token = _tokens.get(generation_id)
+    if token is None:
+        return False
+    token.cancel(reason)
+    return True
+
+
+def current_token() -> Optional[CancellationToken]:
+    """Token of the run the current code belongs to (see src.run_context), or None."""
+    generation_id = current_generation_id()
+    if generation_id is None:
+        return None
+    return _tokens.get(generation_id)
+
+
+def _wait_token() -> Optional[CancellationToken]:
+    """Token whose cancel must wake a wait of the current code (the scope token is also cancelled with the run)."""
+    return _scope_token.get() or current_token()
+
+
+def on_cancel(callback: Callable[[], None]) -> Callable[[], None]:
+    """Calls `callback` when the current run (or cancel scope) is cancelled; returns an unregister function."""
+    token = _wait_token()
+    return token.on_cancel(callback) if token is not None else (lambda: None)
+
+
+@contextmanager
+def cancel_scope(token: Optional[CancellationToken] = None) -> Iterator[CancellationToken]:
+    """
+    Runs the block under its own token (a new one if not given): `token.cancel()` aborts the
+    cancellable work of the block only. The token is cancelled too when the run or an
+    enclosing scope is cancelled.
+    """
+    token = token or CancellationToken(current_generation_id() or "scope")
+    parents = [parent for parent in (_scope_token.get(), current_token()) if parent is not None]
+    unregister = [parent.on_cancel(lambda parent=parent: token.cancel(parent.reason or CANCELLED))
+                  for parent in parents]
+    reset = _scope_token.set(token)
+    try:
+        yield token
+    finally:
+        _scope_token.reset(reset)
+        for callback in unregister:
+            callback()
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float], label: str = "task") -> Iterator[None]:
+    """Runs the block with a deadline of `seconds` (nested scopes keep the earliest one)."""
+    if not seconds:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _task_deadline.get()
+    if current is not None and current[0] <= deadline:
+        yield
+        return
+    token = _task_deadline.set((deadline, seconds, label))
+    try:
+        yield
+    finally:
+        _task_deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the earliest deadline of the current code (run or task), None without any."""
+    remaining = []
+    token = current_token()
+    if token is not None and token.deadline is not None:
+        remaining.append(token.remaining())
+    scoped = _task_deadline.get()
+    if scoped is not None:
+        remaining.append(scoped[0] - time.monotonic())
+    return max(min(remaining), 0.0) if remaining else None
+
+
+def check_cancelled() -> None:
+    """Raises if the current run was cancelled or the run/task deadline passed; no-op outside runs."""
+    token = current_token()
+    if token is not None:
+        token.check()
+    scope = _scope_token.get()
+    if scope is not None:
+        scope.check()
+    scoped = _task_deadline.get()
+    if scoped is not None and time.monotonic() >= scoped[0]:
+        raise DeadlineExceeded(f"Deadline of {scoped[1]}s for {scoped[2]} exceeded")
+
+
+def sleep(seconds: float) -> None:
+    """time.sleep that wakes up (and raises) when the run is cancelled or a deadline passes first."""
+    token = _wait_token()
+    remaining = remaining_time()
+    if remaining is not None and remaining < seconds:
+        seconds = remaining
+    if token is not None:
+        token.wait(max(seconds, 0.0))
+    elif seconds > 0:
+        time.sleep(seconds)
+    check_cancelled()
+
+
+def wait_future(future, on_abort: Optional[Callable[[], Any]] = None) -> Any:
+    """
+    Result of a concurrent.futures-style future, waiting no longer than the run allows:
+    on cancel or deadline calls `on_abort` (e.g. cancel the remote job) and raises.
+    """
+    token = _wait_token()
+    if token is None and _task_deadline.get() is None:
+        return future.result()
+    check_cancelled()
+    wake = threading.Event()
+    future.add_done_callback(lambda _: wake.set())
+    unregister_callback = token.on_cancel(wake.set) if token is not None else (lambda: None)
+    try:
+        wake.wait(remaining_time())
+    finally:
+        unregister_callback()
+    if future.done():
+        return future.result()
+    if on_abort is not None:
+        try:
+            on_abort()
+        except Exception as e:
+            logger.warning(f"Error aborting in-flight request: {e}")
+    check_cancelled()
+    raise DeadlineExceeded("Deadline exceeded")  # Woken by the deadline within the check's clock skew
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_worker = threading.local()
+_abandoned = 0
+_abandoned_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Shared pool of `call_cancellable` (CANCELLABLE_MAX_WORKERS threads, 16 by default)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            try:
+                workers = max(1, int(os.getenv("CANCELLABLE_MAX_WORKERS", 16)))
+            except ValueError:
+                logger.warning("Invalid CANCELLABLE_MAX_WORKERS in .env, using default 16")
+                workers = 16
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cancellable")
+        return _executor
+
+
+def _run_in_worker(context: contextvars.Context, fn: Callable[..., Any], args, kwargs) -> Any:
+    _worker.active = True
+    try:
+        return context.run(fn, *args, **kwargs)
+    finally:
+        _worker.active = False
+
+
+def _track_abandoned(future: Future) -> None:
+    """Counts an abandoned call until it ends (bounded by the timeout its caller gave it)."""
+    global _abandoned
+    with _abandoned_lock:
+        _abandoned += 1
+        telemetry.ABANDONED_CALLS.set(_abandoned)
+
+    def _finished(_) -> None:
+        global _abandoned
+        with _abandoned_lock:
+            _abandoned -= 1
+            telemetry.ABANDONED_CALLS.set(_abandoned)
+
+    future.add_done_callback(_finished)
+
+
+def call_cancellable(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    `fn(*args, **kwargs)`, returning early with RunCancelled/DeadlineExceeded if the current
+    run is cancelled or a deadline passes first. Outside a run (no token, no deadline) it is
+    a plain call. The call keeps the caller's context variables.
+    Calls run on a shared bounded pool: an abandoned call that has not started is dropped;
+    one already running keeps its worker until it returns, so `fn` must carry a timeout.
+    """
+    if (_wait_token() is None and _task_deadline.get() is None) or getattr(_worker, "active", False):
+        return fn(*args, **kwargs) # Nested calls run inline: waiting on the pool from a worker could deadlock
+    check_cancelled()
+    future = _get_executor().submit(_run_in_worker, contextvars.copy_context(), fn, args, kwargs)
+
+    def _abandon() -> None:
+        if not future.cancel():
+            _track_abandoned(future)
+
+    return wait_future(future, on_abort=_abandon)
+
+
+def parse_deadline(label: str, value: Any) -> Optional[float]:
+    """Deadline in seconds from a YAML setting; None (no deadline) if absent or invalid."""
+    if value in (None, "", 0):
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        seconds = -1.0
+    if seconds <= 0:
+        logger.error(f"Invalid deadline_seconds for {label}: {value!r}, running without a deadline")
+        return None
+    return seconds
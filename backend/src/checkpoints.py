@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import re
+import shutil
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+_UNSAFE_ID_RE = re.compile(r"[^\w.\-]")
+
+
+def config_fingerprint(*configs: Dict[str, Any]) -> str:
+    """Stable hash of the formatted agent/task configuration a task output was produced with."""
+    payload = json.dumps(configs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class CheckpointStore:
+    """
+    Task outputs of each generation, saved to disk as each task completes, so a failed run
+    can be resumed from the tasks still missing and a finished one can re-run a single task
+    (and its dependents) after its configuration changes.
+
+    Layout: `<root>/<generation_id>/run.json` (topic, execution mode) and one
+    `<task_key>.json` per completed task (raw output, agent, config fingerprint). Files are
+    written atomically (tmp + rename), so a crash never leaves a half-written checkpoint.
+    """
+
+    def __init__(self, root: Union[str, pathlib.Path]):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, generation_id: str) -> pathlib.Path:
+        return self.root / _UNSAFE_ID_RE.sub("_", generation_id)
+
+    @staticmethod
+    def _write_json(path: pathlib.Path, data: Dict[str, Any]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _read_json(path: pathlib.Path) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+            return None
+
+    def save_run(self, generation_id: str, topic: Optional[str], execution_mode: str) -> None:
+        path = self._dir(generation_id) / "run.json"
+        run = self._read_json(path) or {"created_at": time.time()}
+        run.update({"generation_id": generation_id, "topic": topic, "execution_mode": execution_mode,
+                    "updated_at": time.time()})
+        self._write_json(path, run)
+
+    def load_run(self, generation_id: str) -> Optional[Dict[str, Any]]:
+        return self._read_json(self._dir(generation_id) / "run.json")
+
+    def save_task(self, generation_id: str, task_key: str, raw: str, agent: Optional[str] = None,
+                  fingerprint: Optional[str] = None) -> None:
+        self._write_json(self._dir(generation_id) / f"{task_key}.json", {
+            "task": task_key, "raw": raw, "agent": agent, "fingerprint": fingerprint, "completed_at": time.time(),
+        })
+
+    def load_tasks(self, generation_id: str) -> Dict[str, Dict[str, Any]]:
+        """Saved task outputs of a generation, by task key."""
+        directory = self._dir(generation_id)
+        if not directory.is_dir():
+            return {}
+        tasks = {}
+        for path in directory.glob("*.json"):
+            if path.name == "run.json":
+                continue
+            checkpoint = self._read_json(path)
+            if checkpoint and isinstance(checkpoint.get("raw"), str):
+                tasks[checkpoint.get("task", path.stem)] = checkpoint
+        return tasks
+
+    def delete(self, generation_id: str) -> None:
+        shutil.rmtree(self._dir(generation_id), ignore_errors=True)
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Deletes the checkpoints of generations not updated in `max_age_seconds`."""
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for directory in self.root.iterdir():
+            if not directory.is_dir():
+                continue
+            try:
+                newest = max((p.stat().st_mtime for p in directory.iterdir()), default=directory.stat().st_mtime)
+            except OSError:
+                continue
+            if newest < cutoff:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"Pruned checkpoints of {removed} generations older than {max_age_seconds / 86400:.1f} days")
+        return removed
+
+
+def build_checkpoint_store_from_env(default_dir: Union[str, pathlib.Path]) -> Optional[CheckpointStore]:
+    """
+    Builds the task checkpoint store from environment variables:
+      CREW_CHECKPOINTS=on (default) | off, CREW_CHECKPOINT_DIR, CREW_CHECKPOINT_MAX_AGE_DAYS
+      (checkpoints of older generations are pruned when the store is created; default 14).
+    """
+    if os.getenv("CREW_CHECKPOINTS", "on").lower() in ("", "off", "none", "false", "0"):
+        return None
+    try:
+        store = CheckpointStore(os.getenv("CREW_CHECKPOINT_DIR", str(default_dir)))
+    except OSError as e:
+        logger.error(f"Error initializing the checkpoint store, continuing without it: {e}")
+        return None
+    try:
+        max_age_days = float(os.getenv("CREW_CHECKPOINT_MAX_AGE_DAYS", 14))
+    except ValueError:
+        logger.warning("Invalid CREW_CHECKPOINT_MAX_AGE_DAYS in .env, using default 14")
+        max_age_days = 14.0
+    if max_age_days > 0:
+        store.prune(max_age_days * 86400)
+    return store
@@ -0,0 +1,219 @@
+"""
+Context budgets for chained tasks.
+
+Each downstream task receives the raw outputs of its context tasks (the reviewed blog post
+for 'format_post' and 'generate_images'). A task can cap that context with a
+`context_budget` in tasks.yaml:
+
+    generate_images:
+      context_budget:
+        strategy: key_points   # truncate | summary | key_points
+        max_tokens: 150
+
+- truncate: the head of the context, cut at a paragraph or sentence boundary.
+- summary: local extractive summary, the highest-scoring sentences (word frequency) in
+  their original order.
+- key_points: a compact digest (title, key themes, ranked key points). It depends only on
+  the context text, so it is derived once and shared by every task that asks for it; each
+  task keeps as many points as fit in its budget.
+
+Everything runs locally (no LLM calls); tokens are estimated with `CHARS_PER_TOKEN`.
+"""
+import functools
+import logging
+import re
+from collections import Counter
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+from src.ratelimit import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+TRUNCATION_MARKER = "\n\n[... context truncated to fit the task budget]"
+# Points and themes kept in the shared key-points digest (each task trims it to its budget)
+DIGEST_POINTS = 12
+DIGEST_THEMES = 8
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+(?=[\"'“¿¡(\[]?[A-ZÁÉÍÓÚÑ0-9])")
+_WORD_RE = re.compile(r"[^\W\d_]{3,}", re.UNICODE)
+_MARKDOWN_PREFIX_RE = re.compile(r"^\s*(?:#{1,6}\s+|[-*+]\s+|\d+[.)]\s+|>\s*)")
+_STOPWORDS = frozenset("""
+a about above after again against all also and any are because been before being below between both but
+can could did does doing down during each few for from further had has have having her here hers herself
+him himself his how into its itself just more most not now off once only other our ours out over own same
+she should some such than that the their theirs them themselves then there these they this those through
+too under until very was were what when where which while who whom why will with would you your yours
+yourself yourselves one make made many much may might like well even way get also use used using
+como con contra del desde donde durante entre esta este esto estos hasta las los más mas muy nos para
+pero por porque que qué sin sobre son sus también tiene una uno unos ser fue han hay
+""".split())
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Token estimate used for budgets and their logs (same ratio as the rate limiter)."""
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+def _split_sentences(text: str) -> List[Tuple[int, int, str]]:
+    """(paragraph index, position in paragraph, sentence); markdown headings and list items are units."""
+    units = []
+    for p_index, paragraph in enumerate(p for p in re.split(r"\n\s*\n", text) if p.strip()):
+        position = 0
+        for line in paragraph.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            for sentence in _SENTENCE_SPLIT_RE.split(line):
+                if sentence.strip():
+                    units.append((p_index, position, sentence.strip()))
+                    position += 1
+    return units
+
+
+def _words(text: str) -> List[str]:
+    return [w for w in (m.lower() for m in _WORD_RE.findall(text)) if w not in _STOPWORDS]
+
+
+def _rank_sentences(units: List[Tuple[int, int, str]]) -> List[Tuple[float, int]]:
+    """(score, unit index) by descending score: mean normalized frequency of the content words, plus a lead bonus."""
+    frequencies = Counter(w for _, _, sentence in units for w in _words(sentence))
+    if not frequencies:
+        return [(0.0, i) for i in range(len(units))]
+    top = max(frequencies.values())
+    ranked = []
+    seen = set()
+    for i, (p_index, position, sentence) in enumerate(units):
+        words = _words(sentence)
+        if not words or sentence.lstrip().startswith("#"):
+            continue  # Headings are handled separately, they say little on their own
+        if tuple(words) in seen:
+            continue  # Repeated sentences (a draft restating itself) count once
+        seen.add(tuple(words))
+        score = sum(frequencies[w] / top for w in words) / len(words) ** 0.5
+        if position == 0:
+            score *= 1.25  # Lead sentence of its paragraph
+        if p_index == 0:
+            score *= 1.1  # Introduction
+        ranked.append((score, i))
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    return ranked
+
+
+def _strip_markdown(sentence: str) -> str:
+    return _MARKDOWN_PREFIX_RE.sub("", sentence).replace("**", "").strip()
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Head of the text within the budget, cut at the last paragraph/sentence boundary of the kept part."""
+    max_chars = max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARKER)
+    if len(text) <= max_tokens * CHARS_PER_TOKEN:
+        return text
+    head = text[:max(max_chars, 0)]
+    # Prefer a paragraph break, then a sentence end, as long as it keeps most of the budget
+    for boundary in ("\n\n", ". ", "\n"):
+        cut = head.rfind(boundary)
+        if cut >= len(head) * 0.6:
+            head = head[:cut + (1 if boundary == ". " else 0)]
+            break
+    return head.rstrip() + TRUNCATION_MARKER
+
+
+def extractive_summary(text: str, max_tokens: int) -> str:
+    """The highest-ranked sentences that fit in the budget, in their original order (paragraphs kept)."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    units = _split_sentences(text)
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    selected, used = set(), 0
+    # The title (first heading) anchors the summary if it fits
+    if units and units[0][2].startswith("#") and len(units[0][2]) < max_chars // 4:
+        selected.add(0)
+        used += len(units[0][2]) + 2
+    for _, i in _rank_sentences(units):
+        length = len(units[i][2]) + 1
+        if used + length > max_chars:
+            continue
+        selected.add(i)
+        used += length
+    if not selected:
+        return truncate(text, max_tokens)
+    paragraphs: Dict[int, str] = {}
+    for i in sorted(selected):
+        p_index, _, sentence = units[i]
+        if p_index not in paragraphs:
+            paragraphs[p_index] = sentence
+        else:
+            # Headings and list items stay on their own line
+            separator = "\n" if _MARKDOWN_PREFIX_RE.match(sentence) else " "
+            paragraphs[p_index] += separator + sentence
+    return "\n\n".join(paragraph for _, paragraph in sorted(paragraphs.items()))
+
+
+@functools.lru_cache(maxsize=32)
+def key_points_digest(text: str) -> Tuple[Optional[str], Tuple[str, ...], Tuple[str, ...]]:
+    """
+    (title, themes, points ranked by importance) of a text. Cached on the text, so tasks that
+    share a context (e.g. the reviewed post) derive the digest once.
+    """
+    units = _split_sentences(text)
+    title = next((_strip_markdown(s) for _, _, s in units if s.startswith("#")), None)
+    frequencies = Counter(w for _, _, sentence in units for w in _words(sentence))
+    themes = tuple(word for word, _ in frequencies.most_common(DIGEST_THEMES))
+    points = tuple(_strip_markdown(units[i][2]) for _, i in _rank_sentences(units)[:DIGEST_POINTS])
+    return title, themes, points
+
+
+def key_points(text: str, max_tokens: int) -> str:
+    """The shared key-points digest of `text`, keeping the top points that fit in the budget."""
+    title, themes, points = key_points_digest(text)
+    lines = []
+    if title:
+        lines.append(f"Title: {title}")
+    if themes:
+        lines.append(f"Key themes: {', '.join(themes)}")
+    lines.append("Key points:")
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    used = sum(len(line) + 1 for line in lines)
+    for point in points:
+        line = f"- {point}"
+        if used + len(line) + 1 > max_chars:
+            if lines[-1] == "Key points:" and max_chars - used > 40:
+                # Not even the top point fits: keep its head, cut at a word boundary
+                lines.append(line[:max_chars - used - 4].rsplit(" ", 1)[0] + " ...")
+            break
+        lines.append(line)
+        used += len(line) + 1
+    if lines[-1] == "Key points:":
+        # No room for points: the themes are the digest
+        lines.pop()
+    return "\n".join(lines) if lines else truncate(text, max_tokens)
+
+
+_STRATEGIES = {"truncate": truncate, "summary": extractive_summary, "key_points": key_points}
+
+
+class ContextBudget(BaseModel):
+    """`context_budget` of a task in tasks.yaml."""
+    strategy: Literal["truncate", "summary", "key_points"] = "truncate"
+    max_tokens: int = Field(gt=0)
+
+    def apply(self, context: str) -> str:
+        """The context within the budget (unchanged if it already fits)."""
+        if not context or estimate_tokens(context) <= self.max_tokens:
+            return context
+        return _STRATEGIES[self.strategy](context, self.max_tokens)
+
+
+def parse_context_budget(task_type: str, config: Any) -> Optional[ContextBudget]:
+    """ContextBudget from a task's `context_budget` setting; None (whole context) if absent or invalid."""
+    if not config:
+        return None
+    if isinstance(config, int):
+        config = {"max_tokens": config}
+    try:
+        return ContextBudget.model_validate(config)
+    except ValidationError as e:
+        logger.error(f"Invalid context_budget for task '{task_type}', passing the whole context: {e.errors()}")
+        return None
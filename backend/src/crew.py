@@ -1,21 +1,39 @@
 import logging
 import os
 import json
-import yaml # Make sure PyYAML is installed
 import asyncio
+import functools
 import pathlib
-from typing import Optional, Dict, Any, Callable
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, Callable, Iterable, Iterator
 
 
 # --- Importación de LLM directamente desde crewai ---
 from crewai import Agent, Task, Crew, LLM
+from crewai.tasks.task_output import TaskOutput
+from crewai.utilities.formatter import aggregate_raw_outputs_from_tasks
+from pydantic import Field
 # Ya no necesitamos importar desde langchain_google_genaie
 
 # Import the tool using the new package structure
 from src.tools.FluxImageGeneratorTool import FluxImageGeneratorTool
-
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from src.scheduler import DagScheduler
+from src.blueprint import CrewBlueprint, load_blueprint
+from src.llm_cache import build_llm_cache_from_env
+from src.model_router import ModelRouter, build_router_from_env
+from src.streaming import stream_sink
+from src.run_context import generation_context, task_context, current_task_key, progress_context
+from src.social_posts import SocialPostStream, parse_social_posts
+from src.generation_store import GenerationStore, build_generation_store_from_env
+from src.checkpoints import CheckpointStore, build_checkpoint_store_from_env, config_fingerprint
+from src.context_budget import ContextBudget, estimate_tokens, parse_context_budget, truncate
+from src.topic_index import TopicIndex, build_topic_index_from_env
+from src import cancellation, telemetry
+
+# Logging is configured by the entry points (API, Streamlit app, benchmarks), see src.logging_setup
 logger = logging.getLogger(__name__)
 
 # Define project root relative to this file (backend/src/crew.py)
@@ -23,112 +41,188 @@ PROJECT_ROOT = pathlib.Path(__file__).parent.parent
 CONFIG_DIR = PROJECT_ROOT / "src" / "config"
 OUTPUT_DIR = PROJECT_ROOT / "output" # Define a consistent output directory if saving files
 
+# Execution modes: 'sequential' uses crew.kickoff(), 'dag' runs independent tasks in parallel
+EXECUTION_MODES = ("sequential", "dag")
+# Task whose output holds the social media posts (parsed and emitted per platform)
+SOCIAL_TASK = "format_post"
+# Task whose output can be reused from a previous generation on a near-duplicate topic
+DRAFT_TASK = "write_draft"
+# Cached draft appended to the write_draft description when the topic is only close (seed mode)
+DRAFT_SEED_TEMPLATE = ("\n\nA draft was written earlier for the closely related topic '{topic}'. Use it as a starting "
+                       "point: keep what applies, and adapt or extend it to the topic above.\n\n{draft}")
+DRAFT_SEED_MAX_TOKENS = 1500
+# Task settings that do not change a task's output (left out of its checkpoint fingerprint)
+RUNTIME_TASK_SETTINGS = ("deadline_seconds",)
+# Result dict field filled from each task's output
+RESULT_FIELDS = {
+    "write_draft": "blog_draft",
+    "review_draft": "blog_reviewed",
+    "format_post": "social_media",
+    "generate_images": "images",
+}
+
+
+class MininosTask(Task):
+    """
+    Task that runs inside a telemetry span and labels its LLM calls with its task/agent keys.
+    Its LLM calls and tool calls run under its deadline (see src.cancellation).
+    """
+    task_key: Optional[str] = Field(default=None, description="Blueprint key of the task (e.g. 'write_draft')")
+    agent_key: Optional[str] = Field(default=None, description="Blueprint key of the agent (e.g. 'writer')")
+    context_budget: Optional[ContextBudget] = Field(default=None, description="Cap on the context tokens (tasks.yaml)")
+    deadline_seconds: Optional[float] = Field(default=None, description="Time limit of the task (tasks.yaml)")
+
+    def execute_sync(self, agent: Optional[Agent] = None, context: Optional[str] = None, tools=None):
+        task_key = self.task_key or "unknown"
+        agent_key = self.agent_key or "unknown"
+        cancellation.check_cancelled() # Don't start a task of a cancelled run
+        with task_context(self.task_key), telemetry.labels(task=task_key, agent=agent_key), \
+             cancellation.deadline_scope(self.deadline_seconds, label=f"task '{task_key}'"), \
+             telemetry.observe("crew.task", telemetry.TASK_SECONDS, telemetry.TASKS, task=task_key, agent=agent_key):
+            # Both execution modes hand the context outputs in here, so the budget applies to either
+            if context and self.context_budget is not None:
+                context = self._apply_context_budget(context)
+            return super().execute_sync(agent=agent, context=context, tools=tools)
+
+    def _apply_context_budget(self, context: str) -> str:
+        task_key = self.task_key or "unknown"
+        budgeted = self.context_budget.apply(context)
+        before, after = estimate_tokens(context), estimate_tokens(budgeted)
+        telemetry.CONTEXT_TOKENS.inc(before, task=task_key, stage="before")
+        telemetry.CONTEXT_TOKENS.inc(after, task=task_key, stage="after")
+        telemetry.add_event("context.budget", strategy=self.context_budget.strategy, tokens_before=before,
+                            tokens_after=after)
+        logger.info(f"Context of task '{task_key}': ~{before} -> ~{after} tokens "
+                    f"({self.context_budget.strategy}, budget {self.context_budget.max_tokens})")
+        return budgeted
+
 class Mininos:
     def __init__(self,
                  topic: Optional[str] = None,
                  config_path: str = str(CONFIG_DIR),
                  generation_id: str = None,
-                 progress_callback: Callable[[str, Dict], None] = None):
+                 progress_callback: Callable[[str, Dict], None] = None,
+                 execution_mode: Optional[str] = None,
+                 max_workers: Optional[int] = None,
+                 llm: Optional[LLM] = None,
+                 model_router: Optional[ModelRouter] = None,
+                 image_generator_tool: Optional[FluxImageGeneratorTool] = None,
+                 agents_config: Optional[Dict[str, Any]] = None,
+                 tasks_config: Optional[Dict[str, Any]] = None,
+                 stream: Optional[bool] = None,
+                 blueprint: Optional[CrewBlueprint] = None,
+                 generation_store: Optional[GenerationStore] = None,
+                 checkpoints: Optional[CheckpointStore] = None,
+                 topic_index: Optional[TopicIndex] = None,
+                 reuse_drafts: Optional[bool] = None,
+                 reuse_threshold: Optional[float] = None,
+                 seed_threshold: Optional[float] = None):
         self.topic = topic
         self.config_path = pathlib.Path(config_path)
         self.generation_id = generation_id
         self.progress_callback = progress_callback
-        self.agents_config = {}
-        self.tasks_config = {}
-        # --- LLM se inicializa aquí ---
-        self.llm = self._initialize_llm()
-        self.image_generator_tool = FluxImageGeneratorTool(save_dir=str(OUTPUT_DIR / "images"))
-        self._load_configurations()
-        self.total_tasks = 0
-
-
-    def _load_configurations(self) -> None:
-        """Load agent and task configurations from YAML files."""
-        agents_file = self.config_path / 'agents.yaml'
-        tasks_file = self.config_path / 'tasks.yaml'
-        self.agents_config = self._load_yaml(agents_file)
-        self.tasks_config = self._load_yaml(tasks_file)
-        self.total_tasks = len(self.tasks_config) # Get total number of tasks for progress
-        logger.info(f"Configurations loaded from {self.config_path}")
-
-    def _load_yaml(self, filename: pathlib.Path) -> dict:
-        """Loads a YAML file and returns its contents."""
+        self.execution_mode = self._resolve_execution_mode(execution_mode)
+        self.max_workers = max_workers if max_workers is not None else self._env_int('CREW_MAX_WORKERS', 2)
+        # Token streaming to progress_callback (env LLM_STREAMING)
+        if stream is None:
+            stream = os.getenv('LLM_STREAMING', 'false').lower() in ('1', 'true', 'yes', 'on')
+        self.stream = stream
+        self.tasks = []
+        # --- LLM por agente según agents.yaml (o un LLM único para todos si se pasa `llm`, ej. en benchmarks) ---
+        # El router se comparte entre instancias (spawn, run_batch)
+        self.model_router = None if llm is not None else (model_router or self._initialize_router())
+        self.llm = llm if llm is not None else self.model_router.llm_for()
+        self.image_generator_tool = image_generator_tool or FluxImageGeneratorTool(save_dir=str(OUTPUT_DIR / "images"))
+        # Persistent history of the runs (env GENERATION_STORE / GENERATION_STORE_DIR); spawn() shares it
+        self.generation_store = generation_store if generation_store is not None else \
+            build_generation_store_from_env(default_dir=OUTPUT_DIR / "generations")
+        # Per-task output checkpoints for resume/re-run (env CREW_CHECKPOINTS / CREW_CHECKPOINT_DIR); spawn() shares it
+        self.checkpoints = checkpoints if checkpoints is not None else \
+            build_checkpoint_store_from_env(default_dir=OUTPUT_DIR / "checkpoints")
+        # Drafts of near-duplicate topics: reused above reuse_threshold, used as a seed above
+        # seed_threshold (env TOPIC_REUSE, TOPIC_REUSE_THRESHOLD, TOPIC_SEED_THRESHOLD); spawn() shares the index
+        self.topic_index = topic_index if topic_index is not None else build_topic_index_from_env(self.generation_store)
+        self.reuse_drafts = reuse_drafts if reuse_drafts is not None else True
+        self.reuse_threshold = reuse_threshold if reuse_threshold is not None else \
+            self._env_float('TOPIC_REUSE_THRESHOLD', 0.9)
+        self.seed_threshold = seed_threshold if seed_threshold is not None else \
+            self._env_float('TOPIC_SEED_THRESHOLD', 0.75)
+        if agents_config is not None and tasks_config is not None:
+            # Configurations passed in directly (not backed by files)
+            self.blueprint = CrewBlueprint(agents_config, tasks_config)
+        elif blueprint is not None:
+            self.blueprint = blueprint
+        else:
+            self._load_configurations()
+        self.agents_config = self.blueprint.agents_config
+        self.tasks_config = self.blueprint.tasks_config
+        self.total_tasks = self.blueprint.total_tasks # Get total number of tasks for progress
+        # Completed-task counter used for progress; tasks may finish concurrently in 'dag' mode
+        self._completed_tasks = 0
+        self._progress_lock = threading.Lock()
+        # Social posts already sent through progress_callback, and the stream parser per LLM call
+        self._social_emitted = set()
+        self._social_streams: Dict[int, SocialPostStream] = {}
+        self._social_lock = threading.Lock()
+        # Near-duplicate topic whose draft this run reused or was seeded with (see _reuse_similar_draft)
+        self._draft_reuse: Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def _env_int(name: str, default: int) -> int:
+        """Reads an integer from the environment, falling back to default on bad values."""
         try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                return yaml.safe_load(file)
-        except FileNotFoundError:
-            logger.error(f"Configuration file not found: {filename}")
-            return {}
-        except yaml.YAMLError as e:
-            logger.error(f"Error loading YAML file {filename}: {e}")
-            return {}
-        except Exception as e:
-             logger.error(f"Unexpected error loading {filename}: {e}")
-             return {}
-
-    # --- Método _initialize_llm ACTUALIZADO ---
-    def _initialize_llm(self) -> LLM: # Cambiar tipo de retorno a crewai.LLM
-        """Initializes the language model using crewai.LLM wrapper."""
-        model_name = os.getenv('MODEL')
-        api_key = os.getenv('GOOGLE_API_KEY') # Corrected variable name
-        # Opcional: Leer temperatura desde .env o usar un default
+            return int(os.getenv(name, default))
+        except ValueError:
+            logger.warning(f"Invalid {name} in .env, using default {default}")
+            return default
+
+    @staticmethod
+    def _env_float(name: str, default: float) -> float:
+        """Reads a float from the environment, falling back to default on bad values."""
         try:
-            temperature = float(os.getenv('LLM_TEMPERATURE', 0.6))
+            return float(os.getenv(name, default))
         except ValueError:
-            logger.warning("Invalid LLM_TEMPERATURE in .env, using default 0.6")
-            temperature = 0.6
+            logger.warning(f"Invalid {name} in .env, using default {default}")
+            return default
 
-        if not model_name or not api_key:
-            logger.error("MODEL and/or GOOGLE_API_KEY not found in .env file") # Corrected error message
-            raise ValueError("MODEL and GOOGLE_API_KEY must be set in the .env file") # Corrected error message
+    def _resolve_execution_mode(self, execution_mode: Optional[str]) -> str:
+        """Resolves the execution mode from the argument or the CREW_EXECUTION_MODE env var."""
+        mode = (execution_mode or os.getenv('CREW_EXECUTION_MODE', 'sequential')).lower()
+        if mode not in EXECUTION_MODES:
+            logger.warning(f"Unknown execution mode '{mode}', using 'sequential'.")
+            mode = "sequential"
+        return mode
 
-        # Asegurarse de que el nombre del modelo tenga el prefijo 'gemini/' para LiteLLM
-        if not model_name.startswith("gemini/"):
-            llm_model_name = f"gemini/{model_name}"
-            logger.warning(f"MODEL env var '{model_name}' is missing the 'gemini/' prefix. Using '{llm_model_name}' for LiteLLM.")
-        else:
-            llm_model_name = model_name
+    def _load_configurations(self) -> None:
+        """Loads the compiled agent/task configurations (cached per config directory, see src.blueprint)."""
+        self.blueprint = load_blueprint(self.config_path)
 
-        logger.info(f"Initializing crewai.LLM wrapper for model: {llm_model_name} with temperature: {temperature}")
+    def _initialize_router(self) -> ModelRouter:
+        """
+        Builds the per-agent model router (tiers MODEL / MODEL_FAST and their fallbacks, see
+        src.model_router). Every LLM shares the response cache (LLM_CACHE).
+        """
         try:
-            # --- Usar crewai.LLM ---
-            llm = LLM(
-                model=llm_model_name, # Pasar el nombre del modelo como espera LiteLLM
-                api_key=api_key,
-                temperature=temperature
-                # Puedes añadir más parámetros aquí si son soportados por LiteLLM para Gemini
-                # Por ejemplo: config={'max_tokens': 4096}
-            )
-            # Opcional: Probar una llamada simple si es posible/necesario
-            # llm.invoke("Test prompt")
-            logger.info("crewai.LLM initialized successfully.")
-            return llm
+            router = build_router_from_env(
+                cache=build_llm_cache_from_env(default_path=OUTPUT_DIR / "cache" / "llm_cache.sqlite3"))
+            logger.info("Model router initialized successfully.")
+            return router
         except Exception as e:
-             logger.error(f"Failed to initialize crewai.LLM: {e}", exc_info=True)
-             # Podrías intentar capturar errores específicos de LiteLLM si ocurren
-             raise
-
-    def _format_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
-         """Format configurations using the topic."""
-         formatted = {}
-         for key, value in config.items():
-             if isinstance(value, str):
-                 try:
-                     formatted[key] = value.format(topic=self.topic)
-                 except KeyError: # Handle cases where topic might not be needed
-                     formatted[key] = value
-             else:
-                 formatted[key] = value
-         return formatted
+            logger.error(f"Failed to initialize the model router: {e}", exc_info=True)
+            raise
+
+    def _agent_llm(self, agent_type: str, settings: Optional[Dict[str, Any]]) -> LLM:
+        """LLM of an agent: the one passed to the constructor, or the router's for its `llm` settings."""
+        if self.model_router is None:
+            return self.llm
+        return self.model_router.llm_for(agent_type, settings)
 
     def create_agent(self, agent_type: str) -> Agent:
         """Creates an agent based on the provided agent type."""
-        agent_config = self.agents_config.get(agent_type, {})
-        if not agent_config:
-             raise ValueError(f"Agent configuration for '{agent_type}' not found.")
-
-        formatted_config = self._format_config(agent_config)
+        formatted_config = self.blueprint.agent_config(agent_type, self.topic)
         logger.debug(f"Creating agent '{agent_type}' with config: {formatted_config}")
+        # Model, temperature and max_tokens of the agent (agents.yaml `llm` section)
+        llm = self._agent_llm(agent_type, formatted_config.pop('llm', None))
 
         tools = []
         if agent_type == 'image_generator':
@@ -136,28 +230,31 @@ class Mininos:
 
         # --- Pasar el LLM ya inicializado al Agente ---
         return Agent(
-            llm=self.llm, # Usar el LLM de la instancia de Mininos
+            llm=llm, # LLM compartido del agente (ver _agent_llm)
             tools=tools,
             **formatted_config
         )
 
-    def create_task(self, task_type: str, agent: Agent, context_tasks: list = None) -> Task:
+    def create_task(self, task_type: str, agent: Agent, context_tasks: list = None,
+                    task_index: int = -1, agent_type: Optional[str] = None) -> Task:
         """Creates a task for the specified agent."""
-        task_config = self.tasks_config.get(task_type, {})
-        if not task_config:
-            raise ValueError(f"Task configuration for '{task_type}' not found.")
-
-        formatted_config = self._format_config(task_config)
+        formatted_config = self.blueprint.task_config(task_type, self.topic)
         logger.debug(f"Creating task '{task_type}' with config: {formatted_config}")
 
         # Add context if provided (for task dependencies)
         context = context_tasks if context_tasks else []
 
-        return Task(
+        return MininosTask(
+            task_key=task_type,
+            agent_key=agent_type,
+            context_budget=parse_context_budget(task_type, formatted_config.get('context_budget')),
+            deadline_seconds=cancellation.parse_deadline(f"task '{task_type}'", formatted_config.get('deadline_seconds')),
             description=formatted_config.get('description', ''),
             agent=agent,
             expected_output=formatted_config.get('expected_output', ''),
-            context=context
+            context=context,
+            # The callback knows its task's position, so progress needs no description matching
+            callback=functools.partial(self._task_callback, task_index=task_index)
         )
 
     def _step_callback(self, agent_output):
@@ -177,32 +274,110 @@ class Mininos:
                  logger.error(f"Error in step callback: {e}")
 
 
-    def _task_callback(self, task_output):
-         """Callback triggered after each task is completed."""
+    def _stream_callback(self, event: Dict[str, Any]) -> None:
+        """
+        Forwards coalesced LLM token deltas through progress_callback so the UI can render the
+        output growing live. Events carry 'stream_id' (one per LLM call), 'delta' and 'done'.
+        """
+        if not (self.progress_callback and self.generation_id):
+            return
+        if current_task_key() == SOCIAL_TASK:
+            self._feed_social_stream(event)
+        task_label = event.get("task")
+        if task_label is None:
+            # Sequential mode: MininosTask sets the key of the running task in the run context
+            # (counting completed tasks is wrong once checkpoints or a reused draft skip some)
+            task_key = current_task_key()
+            current = next((task for task in self.tasks if getattr(task, "task_key", None) == task_key), None)
+            task_label = current.description[:50] if current is not None else task_key
+        progress_info = {
+            "message": f"Task '{task_label}...' is generating...",
+            "event": "token_delta",
+            "task": task_label,
+            "stream_id": event.get("stream_id"),
+            "delta": event.get("delta", ""),
+            "chars": event.get("chars", 0),
+            "done": event.get("done", False),
+        }
+        try:
+            self.progress_callback(self.generation_id, progress_info)
+        except Exception as e:
+            logger.error(f"Error executing progress callback for stream event: {e}")
+
+    def _feed_social_stream(self, event: Dict[str, Any]) -> None:
+        """Parses the formatter tokens as they arrive and emits each platform's post once complete."""
+        with self._social_lock:
+            stream = self._social_streams.setdefault(event.get("stream_id"), SocialPostStream())
+            completed = stream.feed(event.get("delta", ""))
+            if event.get("done"):
+                self._social_streams.pop(event.get("stream_id"), None)
+        for platform, post in completed:
+            self._emit_social_post(platform, post.text, source="stream")
+
+    def _emit_social_post(self, platform: str, text: str, source: str) -> None:
+        """Sends one platform's post through progress_callback (once per run)."""
+        with self._social_lock:
+            if platform in self._social_emitted:
+                return
+            self._social_emitted.add(platform)
+        progress_info = {
+            "message": f"Social media post for {platform} ready.",
+            "event": "social_post",
+            "platform": platform,
+            "post": text,
+            "source": source, # 'stream' (while the formatter generates) or 'task' (on completion)
+        }
+        try:
+            self.progress_callback(self.generation_id, progress_info)
+        except Exception as e:
+            logger.error(f"Error executing progress callback for social post: {e}")
+
+    def _emit_social_results(self, task_output) -> None:
+        """On formatter completion: emits the posts not streamed yet and reports parse problems."""
+        parsed = parse_social_posts(str(getattr(task_output, 'raw', task_output)))
+        for platform in [p for p in parsed if p not in ("errors", "error", "raw_output")]:
+            self._emit_social_post(platform, parsed[platform], source="task")
+        if parsed.get("errors"):
+            try:
+                self.progress_callback(self.generation_id, {
+                    "message": f"Social media output has {len(parsed['errors'])} problem(s).",
+                    "event": "social_post_error",
+                    "errors": parsed["errors"],
+                })
+            except Exception as e:
+                logger.error(f"Error executing progress callback for social post errors: {e}")
+
+    def _report_progress(self, progress_info: Dict[str, Any]) -> None:
+        """Progress sink of the run context: tools report intermediate results here (e.g. image previews)."""
+        if self.progress_callback and self.generation_id:
+            self.progress_callback(self.generation_id, progress_info)
+
+    def _stream_sink(self):
+        """Sink installed for the LLM calls of this run, or None if streaming is disabled."""
+        return self._stream_callback if self.stream and self.progress_callback else None
+
+    def _task_callback(self, task_output, task_index: int = -1):
+         """Callback triggered after each task is completed (task_index is bound per task in create_task)."""
+         if 0 <= task_index < len(self.blueprint.layout):
+             self._save_checkpoint(task_index, task_output)
          if self.progress_callback and self.generation_id:
-             task_index = -1
-             try:
-                 # Try to find the index of the completed task using task_output.description
-                 task_description_prefix = task_output.description[:30]
-                 for i, task_key in enumerate(self.tasks_config.keys()):
-                     # Ensure self.tasks_config is loaded and contains descriptions
-                     task_config_desc = self.tasks_config.get(task_key, {}).get('description', '')
-                     if task_config_desc and task_config_desc.format(topic=self.topic).startswith(task_description_prefix):
-                         task_index = i
-                         break
-             except Exception as e:
-                 logger.warning(f"Could not determine task index for progress: {e}")
+             # Progress is based on how many tasks have finished, not on the task position,
+             # so it stays monotonic when independent tasks complete out of order ('dag' mode)
+             with self._progress_lock:
+                 self._completed_tasks += 1
+                 completed = self._completed_tasks
 
              progress_percentage = 10 # Default start
-             if task_index != -1 and self.total_tasks > 0:
-                 # Calculate progress: add 1 because index is 0-based, ensure small progress even for first task
-                 progress_percentage = max(10, int(((task_index + 1) / self.total_tasks) * 95)) # Leave last 5% for final wrap-up
+             if self.total_tasks > 0:
+                 # Ensure small progress even for first task
+                 progress_percentage = max(10, int((completed / self.total_tasks) * 95)) # Leave last 5% for final wrap-up
 
              # Use task_output.description directly
              message = f"Task '{task_output.description[:50]}...' completed."
              progress_info = {
                  "message": message,
                  "progress": progress_percentage,
+                 "task_index": task_index,
                  # Use task_output.result for the summary, converting to string
                  "task_result_summary": str(task_output.result)[:200] if hasattr(task_output, 'result') else str(task_output)[:200]
              }
@@ -213,29 +388,124 @@ class Mininos:
              except Exception as e:
                  logger.error(f"Error executing progress callback: {e}")
 
+             if 0 <= task_index < len(self.blueprint.layout) and self.blueprint.layout[task_index][0] == SOCIAL_TASK:
+                 self._emit_social_results(task_output)
+
+    def _task_fingerprint(self, task_key: str, agent_key: str) -> str:
+        """Hash of the task and agent configuration for this topic (a changed YAML makes a checkpoint stale)."""
+        task_config = {key: value for key, value in self.blueprint.task_config(task_key, self.topic).items()
+                       if key not in RUNTIME_TASK_SETTINGS}
+        return config_fingerprint(task_config, self.blueprint.agent_config(agent_key, self.topic))
+
+    def _save_checkpoint(self, task_index: int, task_output) -> None:
+        """Saves a completed task's output; checkpoint problems are logged, never fail the run."""
+        if self.checkpoints is None or self.generation_id is None:
+            return
+        task_key, agent_key, _ = self.blueprint.layout[task_index]
+        try:
+            self.checkpoints.save_task(self.generation_id, task_key, str(getattr(task_output, 'raw', task_output)),
+                                       agent=getattr(task_output, 'agent', None),
+                                       fingerprint=self._task_fingerprint(task_key, agent_key))
+        except Exception as e:
+            logger.error(f"[{self.generation_id}] Error saving checkpoint of task '{task_key}': {e}")
+
+    def _restore_checkpoints(self, crew: Crew, rerun: Optional[Iterable[str]] = None) -> list:
+        """
+        Loads the saved outputs of this generation into the crew tasks that don't need to run
+        again, so only the rest are executed (with the restored outputs as their context).
+        A task runs again if it has no checkpoint, if it is listed in `rerun`, if its agent or
+        task configuration changed since it was saved, or if any task it depends on runs again.
+        Returns the keys of the restored tasks.
+        """
+        layout = self.blueprint.layout
+        rerun = set(rerun or ())
+        unknown = rerun.difference(key for key, _, _ in layout)
+        if unknown:
+            raise ValueError(f"Unknown tasks to re-run: {sorted(unknown)} (tasks: {[key for key, _, _ in layout]})")
+        saved = self.checkpoints.load_tasks(self.generation_id) if self.checkpoints is not None else {}
+        invalid = set()
+        for task_key, agent_key, context_keys in layout: # Layout order: dependencies come first
+            checkpoint = saved.get(task_key)
+            if checkpoint is None or task_key in rerun or invalid.intersection(context_keys):
+                invalid.add(task_key)
+            elif checkpoint.get("fingerprint") != self._task_fingerprint(task_key, agent_key):
+                logger.info(f"[{self.generation_id}] Configuration of task '{task_key}' changed, re-running it")
+                invalid.add(task_key)
+        restored = []
+        for (task_key, _, _), task in zip(layout, crew.tasks):
+            if task_key in invalid:
+                continue
+            task.output = TaskOutput(description=task.description, raw=saved[task_key]["raw"],
+                                     agent=saved[task_key].get("agent") or task.agent.role)
+            restored.append(task_key)
+        return restored
+
+    def _reuse_similar_draft(self, crew: Crew) -> Optional[Dict[str, Any]]:
+        """
+        Looks the topic up in the topic index. The draft of a near-duplicate topic (score >=
+        reuse_threshold) becomes the write_draft output, so the draft is not generated again;
+        a close one (>= seed_threshold) is appended to the write_draft description as a
+        starting point. Returns the match with its 'mode' ('reuse' or 'seed'), or None.
+        """
+        if not (self.reuse_drafts and self.topic_index is not None and self.generation_store is not None and self.topic):
+            return None
+        index = next((i for i, (key, _, _) in enumerate(self.blueprint.layout) if key == DRAFT_TASK), None)
+        if index is None or index >= len(crew.tasks) or crew.tasks[index].output is not None:
+            return None # Restored from a checkpoint
+        task = crew.tasks[index]
+        try:
+            match = self.topic_index.search(self.topic, exclude=[self.generation_id])
+            if match is None or match["score"] < self.seed_threshold:
+                return None
+            record = self.generation_store.get(match["generation_id"])
+        except Exception as e:
+            logger.error(f"[{self.generation_id}] Error looking up similar topics, writing the draft from scratch: {e}")
+            return None
+        draft = (record or {}).get("blog_draft")
+        if not draft:
+            return None
+        if match["score"] >= self.reuse_threshold:
+            task.output = TaskOutput(description=task.description, raw=draft, agent=task.agent.role)
+            with self._progress_lock:
+                self._completed_tasks += 1
+            self._save_checkpoint(index, task.output)
+            match["mode"] = "reuse"
+        else:
+            task.description += DRAFT_SEED_TEMPLATE.format(topic=match["topic"], draft=truncate(draft, DRAFT_SEED_MAX_TOKENS))
+            match["mode"] = "seed"
+        logger.info(f"[{self.generation_id}] Topic '{self.topic}' matches '{match['topic']}' "
+                    f"({match['generation_id']}, score {match['score']}): draft {match['mode']}")
+        if self.progress_callback:
+            try:
+                self.progress_callback(self.generation_id, {
+                    "message": f"Similar topic found ('{match['topic']}'), "
+                               f"{'reusing its draft' if match['mode'] == 'reuse' else 'drafting from its draft'}.",
+                    "event": "draft_reuse",
+                    **match,
+                })
+            except Exception as e:
+                logger.error(f"Error executing progress callback for draft reuse: {e}")
+        return match
+
 
     def configure_crew(self) -> Crew:
         """Creates and configures the crew with tasks and agents."""
         try:
-            writer_agent = self.create_agent('writer')
-            reviewer_agent = self.create_agent('reviewer')
-            formatter_agent = self.create_agent('formatter')
-            image_generator_agent = self.create_agent('image_generator')
-
-            # Define tasks with dependencies (context)
-            write_task = self.create_task('write_draft', writer_agent)
-            # Review task depends on the write task
-            review_task = self.create_task('review_draft', reviewer_agent, context_tasks=[write_task])
-             # Format task depends on the review task
-            format_task = self.create_task('format_post', formatter_agent, context_tasks=[review_task])
-            # Image generation depends on the reviewed content (review_task)
-            generate_images_task = self.create_task('generate_images', image_generator_agent, context_tasks=[review_task])
+            # Agents and tasks follow the blueprint layout: write -> review -> (format, images)
+            agents: Dict[str, Agent] = {}
+            tasks: Dict[str, Task] = {}
+            for index, (task_type, agent_type, context_keys) in enumerate(self.blueprint.layout):
+                if agent_type not in agents:
+                    agents[agent_type] = self.create_agent(agent_type)
+                tasks[task_type] = self.create_task(task_type, agents[agent_type],
+                                                    context_tasks=[tasks[key] for key in context_keys],
+                                                    task_index=index, agent_type=agent_type)
 
             # Order tasks correctly for execution flow
-            self.tasks = [write_task, review_task, format_task, generate_images_task]
+            self.tasks = list(tasks.values())
 
             crew = Crew(
-                agents=[writer_agent, reviewer_agent, formatter_agent, image_generator_agent],
+                agents=list(agents.values()),
                 tasks=self.tasks,
                 verbose=True, # Changed from integer 2 to boolean True
                 # step_callback=self._step_callback, # step_callback can be very verbose
@@ -246,44 +516,58 @@ class Mininos:
             logger.error(f"Error configuring crew: {e}", exc_info=True)
             raise
 
-    def _process_formatter_output(self, output: str) -> Dict[str, str]:
-        """Process formatter output string (potentially JSON in markdown) to a dict."""
+    def _run_dag(self, crew: Crew, tasks: Optional[list] = None) -> Any:
+        """
+        Executes the crew tasks as a DAG built from each task's context, running tasks whose
+        dependencies are complete in parallel (e.g. 'format_post' and 'generate_images'
+        both only need 'review_draft'). `tasks` limits the run to a subset (dependencies
+        outside it must already have an output). Returns the output of the last task in crew order.
+        """
+        # Same per-agent setup crew.kickoff() performs before running tasks
+        for agent in crew.agents:
+            agent.crew = crew
+            agent.create_agent_executor()
+        for task in crew.tasks:
+            if not task.callback:
+                task.callback = crew.task_callback
+
+        # Task spans started in the worker threads are children of the run span
+        parent_trace = telemetry.current_trace_context()
+
+        def execute(task: Task):
+            context = aggregate_raw_outputs_from_tasks(task.context) if task.context else None
+            tools = task.tools or task.agent.tools or []
+            logger.info(f"[{self.generation_id}] DAG: starting task '{task.description[:50]}...'")
+            # Worker threads need their own stream sink (labelled with the task they run) and run context
+            with generation_context(self.generation_id), progress_context(self._report_progress), \
+                 telemetry.trace_context(parent_trace), stream_sink(self._stream_sink(), task=task.description[:50]):
+                return task.execute_sync(agent=task.agent, context=context, tools=tools)
+
+        scheduler = DagScheduler(crew.tasks if tasks is None else tasks, max_workers=self.max_workers)
+        scheduler.run(execute)
+        return crew.tasks[-1].output if crew.tasks else None
+
+    def _kickoff(self, crew: Crew) -> Any:
+        """Runs the crew tasks without an output (all of them unless restored from checkpoints)."""
+        pending = [task for task in crew.tasks if task.output is None]
+        if not pending:
+            return crew.tasks[-1].output if crew.tasks else None
+        if self.execution_mode == "dag":
+            return self._run_dag(crew, pending)
+        if len(pending) < len(crew.tasks):
+            # Resumed run: a crew of the pending tasks only; their context reads the restored outputs
+            agents = list({id(task.agent): task.agent for task in pending}.values())
+            crew = Crew(agents=agents, tasks=pending, verbose=crew.verbose, task_callback=crew.task_callback)
+        with stream_sink(self._stream_sink()):
+            return crew.kickoff()
+
+    def _process_formatter_output(self, output: str) -> Dict[str, Any]:
+        """
+        Process formatter output string (JSON, possibly fenced or after prose) to a dict of
+        posts per platform; problems are reported under 'errors' (see src.social_posts).
+        """
         logger.debug(f"Processing formatter output: {output[:500]}...") # Log snippet
-        try:
-             # Remove potential markdown code fences
-             if output.startswith("```json"):
-                 output = output.strip()[7:-3].strip()
-             elif output.startswith("```"):
-                 output = output.strip()[3:-3].strip()
-
-             # Handle potential escape sequences if needed (e.g., \\n -> \n)
-             # output = output.encode().decode('unicode_escape') # Use with caution
-
-             # Replace invalid control characters if necessary (less common)
-             # output = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', output)
-
-             data = json.loads(output)
-             if isinstance(data, dict):
-                 return data
-             else:
-                 logger.warning(f"Formatter output parsed but is not a dictionary: {type(data)}")
-                 return {"raw_output": str(data)} # Return as raw if not dict
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding JSON output: {e}. Raw output: '{output[:500]}...'")
-            # Attempt to find JSON within the string if decode fails directly
-            try:
-                match = json.search(r'\{.*\}', output, json.DOTALL)
-                if match:
-                    logger.info("Found JSON object within raw output, attempting parse again.")
-                    return json.loads(match.group(0))
-            except Exception as inner_e:
-                 logger.error(f"Could not extract valid JSON after initial failure: {inner_e}")
-
-            # Fallback: Return the raw string with an error key
-            return {"error": "Failed to parse JSON", "raw_output": output}
-        except Exception as e:
-             logger.error(f"Unexpected error processing formatter output: {e}")
-             return {"error": f"Unexpected error: {e}", "raw_output": output}
+        return parse_social_posts(output)
 
     # --- Methods for saving files (Optional, can be used for debugging/backup) ---
     def _save_output(self, filename: str, content: Any) -> None:
@@ -307,62 +591,250 @@ class Mininos:
         except Exception as e:
             logger.error(f"Error saving output file {filename}: {e}")
 
-    def run_crew_and_get_results(self) -> Dict[str, Any]:
+    def run_crew_and_get_results(self, resume: bool = False, rerun: Optional[Iterable[str]] = None) -> Dict[str, Any]:
         """
         Synchronous method to configure, run the crew, and collect results.
-        Designed to be called within `run_in_executor`.
+        Designed to be called within `run_in_executor`. The run is traced as a 'crew.run' span
+        (parent of the task, LLM and image spans) and counted in the crew run metrics; the
+        results carry per-task 'timings' and per-agent token 'usage', and are recorded in the
+        generation store when one is configured.
+
+        Each task output is checkpointed under the generation_id as it completes. With
+        `resume=True` a previous run of the same generation_id continues from the tasks it
+        did not complete; `rerun=["format_post"]` recomputes those tasks and the ones that
+        depend on them, reusing every other checkpointed output.
+
+        The run can be cancelled from another thread with `src.cancellation.cancel(generation_id)`
+        and is bounded by the `crew.deadline_seconds` of tasks.yaml (and each task by its own
+        `deadline_seconds`): it then stops at the next agent step or tool call, aborts the
+        in-flight LLM/image requests and returns status 'cancelled'/'timeout' with the outputs
+        of the tasks that completed (checkpointed, so it can be resumed).
         """
+        if self.generation_id is None:
+            self.generation_id = f"gen-{uuid.uuid4()}"
+        if (resume or rerun) and self.topic is None and self.checkpoints is not None:
+            # Resuming by generation_id only: the topic is the one of the checkpointed run
+            self.topic = (self.checkpoints.load_run(self.generation_id) or {}).get("topic")
+        self._record_generation("start", self.generation_id, self.topic or "", self.execution_mode)
+        started = time.perf_counter()
+        telemetry.CREW_RUNS_IN_PROGRESS.inc()
+        token = cancellation.register(self.generation_id, cancellation.parse_deadline(
+            "the crew run", self.blueprint.run_settings.get("deadline_seconds")))
+        try:
+            with generation_context(self.generation_id), progress_context(self._report_progress), \
+                 telemetry.track_usage(self.generation_id) as usage, \
+                 telemetry.observe("crew.run", telemetry.CREW_RUN_SECONDS, telemetry.CREW_RUNS,
+                                   attributes={"generation_id": self.generation_id}, mode=self.execution_mode) as scope:
+                results = self._run_crew(resume=resume or bool(rerun), rerun=rerun)
+                if results.get("status") != "success":
+                    scope.fail(results.get("message", "Crew run failed"))
+        finally:
+            cancellation.unregister(token)
+            telemetry.CREW_RUNS_IN_PROGRESS.dec()
+        elapsed = time.perf_counter() - started
+        results["timings"] = {
+            "elapsed_seconds": round(elapsed, 3),
+            "tasks": {self.blueprint.layout[i][0]: round(task.execution_duration, 3)
+                      for i, task in enumerate(self.tasks) if task.execution_duration is not None},
+        }
+        results["usage"] = telemetry.summarize_usage(usage)
+        self._record_generation("finish", self.generation_id, results, elapsed_seconds=round(elapsed, 3))
+        self._index_topic(results)
+        return results
+
+    def _index_topic(self, results: Dict[str, Any]) -> None:
+        """Makes a freshly written draft available for reuse by later near-duplicate topics."""
+        if self.topic_index is None or self.generation_store is None or not self.topic:
+            return
+        if results.get("status") != "success" or not results.get("blog_draft"):
+            return
+        if (results.get("draft_reuse") or {}).get("mode") == "reuse":
+            return # Same draft as the matched generation, already indexed
+        try:
+            self.topic_index.add(self.topic, self.generation_id)
+        except Exception as e:
+            logger.error(f"[{self.generation_id}] Error indexing topic for draft reuse: {e}")
+
+    def _record_generation(self, action: str, *args, **kwargs) -> None:
+        """Calls GenerationStore.<action>; history problems are logged, never fail the run."""
+        if self.generation_store is None:
+            return
+        try:
+            getattr(self.generation_store, action)(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"[{self.generation_id}] Error recording generation history ({action}): {e}")
+
+    def _run_crew(self, resume: bool = False, rerun: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Configures and runs the crew and collects the task outputs (errors are returned, not raised)."""
         logger.info(f"[{self.generation_id}] Configuring and starting Crew execution...")
+        self.tasks = []
+        self._draft_reuse = None
         try:
             crew = self.configure_crew()
-            logger.info(f"[{self.generation_id}] Kicking off crew...")
-            # This is the blocking call
-            kickoff_result = crew.kickoff()
+            restored = self._restore_checkpoints(crew, rerun) if resume else []
+            self._completed_tasks = len(restored)
+            self._draft_reuse = self._reuse_similar_draft(crew)
+            self._social_emitted = set()
+            if restored:
+                logger.info(f"[{self.generation_id}] Resuming with checkpointed outputs of {restored}")
+            if self.checkpoints is not None:
+                self.checkpoints.save_run(self.generation_id, self.topic, self.execution_mode)
+            logger.info(f"[{self.generation_id}] Kicking off crew (mode: {self.execution_mode})...")
+            # This is the blocking call (tools tag their outputs with the generation_id of the run context)
+            kickoff_result = self._kickoff(crew)
             logger.info(f"[{self.generation_id}] Crew kickoff completed.")
+            # Progressive images: the run ends with the previews. The final renders finish in the
+            # background, replace each preview at its URL and report 'image_refined' through progress_callback
+            refinements = self.image_generator_tool.wait_for_refinements(self.generation_id, wait=False)
 
-            # --- Collect results directly from task outputs ---
             results = {
                 "status": "success",
                 "kickoff_raw_result": str(kickoff_result) if kickoff_result else None, # Crew output if any
-                "blog_draft": None,
-                "blog_reviewed": None,
-                "social_media": None,
-                "images": None
+                **self._collect_results(),
             }
-
-            # Safely access task outputs using the configured task order
-            # Access task outputs safely, checking for 'output' and then 'result'
-            if crew.tasks and len(crew.tasks) > 0 and crew.tasks[0].output:
-                 # Use .result if available, otherwise fallback to string representation
-                 output_content = crew.tasks[0].output.result if hasattr(crew.tasks[0].output, 'result') else str(crew.tasks[0].output)
-                 results["blog_draft"] = str(output_content)
-                 # self._save_output(f"{self.generation_id}_blog_draft.md", results["blog_draft"]) # Optional save
-
-            if crew.tasks and len(crew.tasks) > 1 and crew.tasks[1].output:
-                 output_content = crew.tasks[1].output.result if hasattr(crew.tasks[1].output, 'result') else str(crew.tasks[1].output)
-                 results["blog_reviewed"] = str(output_content)
-                 # self._save_output(f"{self.generation_id}_blog_reviewed.md", results["blog_reviewed"]) # Optional save
-
-            if crew.tasks and len(crew.tasks) > 2 and crew.tasks[2].output:
-                 output_content = crew.tasks[2].output.result if hasattr(crew.tasks[2].output, 'result') else str(crew.tasks[2].output)
-                 formatter_output_str = str(output_content)
-                 processed_social = self._process_formatter_output(formatter_output_str)
-                 results["social_media"] = processed_social
-                 # self._save_output(f"{self.generation_id}_social_media.json", results["social_media"]) # Optional save
-
-            if crew.tasks and len(crew.tasks) > 3 and crew.tasks[3].output:
-                 output_content = crew.tasks[3].output.result if hasattr(crew.tasks[3].output, 'result') else str(crew.tasks[3].output)
-                 # The image tool likely returns a string path or message in .result
-                 results["images"] = str(output_content)
-                 # No file saving here as tool already saves images
-
+            if restored:
+                results["restored_tasks"] = restored
+            if self._draft_reuse:
+                results["draft_reuse"] = self._draft_reuse
+            if refinements:
+                results["image_refinements"] = refinements
             logger.info(f"[{self.generation_id}] Results collected successfully.")
             return results
 
-        except Exception as e:
-            logger.error(f"[{self.generation_id}] Error during crew execution or result processing: {e}", exc_info=True)
-            # Return error status and message
-            return {
-                "status": "error",
-                "message": f"Crew execution failed: {str(e)}"
+        except (Exception, cancellation.RunCancelled) as e:
+            if isinstance(e, cancellation.RunCancelled):
+                logger.warning(f"[{self.generation_id}] Crew run stopped ({e.reason}): {e}")
+                status, message = e.reason, f"Crew execution {'timed out' if e.reason == cancellation.TIMEOUT else 'cancelled'}: {str(e)}"
+            else:
+                logger.error(f"[{self.generation_id}] Error during crew execution or result processing: {e}", exc_info=True)
+                status, message = "error", f"Crew execution failed: {str(e)}"
+            # Return error status and message, plus the outputs of the tasks that did complete
+            results = {
+                "status": status,
+                "message": message,
+                **self._collect_results(),
             }
+            # Final renders still running keep their preview if cancelled (they stop with the run)
+            refinements = self.image_generator_tool.wait_for_refinements(self.generation_id, wait=False)
+            if refinements:
+                results["image_refinements"] = refinements
+            results["completed_tasks"] = [key for (key, _, _), task in zip(self.blueprint.layout, self.tasks)
+                                          if task.output is not None]
+            # The completed outputs are checkpointed: run_crew_and_get_results(resume=True) continues from here
+            results["resumable"] = self.checkpoints is not None
+            return results
+
+    def _collect_results(self) -> Dict[str, Any]:
+        """Result fields (blog_draft, blog_reviewed, social_media, images) from the task outputs; None if missing."""
+        results: Dict[str, Any] = dict.fromkeys(RESULT_FIELDS.values())
+        for (task_key, _, _), task in zip(self.blueprint.layout, self.tasks):
+            if task.output is None or task_key not in RESULT_FIELDS:
+                continue
+            # Use .result if available, otherwise fallback to string representation
+            output_content = str(task.output.result if hasattr(task.output, 'result') else task.output)
+            if task_key == SOCIAL_TASK:
+                output_content = self._process_formatter_output(output_content)
+            # The image tool returns the markdown with the image paths (already saved by the tool)
+            results[RESULT_FIELDS[task_key]] = output_content
+        return results
+
+    def spawn(self,
+              topic: str,
+              generation_id: Optional[str] = None,
+              progress_callback: Callable[[str, Dict], None] = None) -> "Mininos":
+        """
+        Creates a new instance for `topic` that shares this instance's LLMs, image tool and
+        compiled configurations (and its execution settings), so no heavy setup is repeated.
+        """
+        return type(self)(topic=topic,
+                          config_path=str(self.config_path),
+                          generation_id=generation_id,
+                          progress_callback=progress_callback,
+                          execution_mode=self.execution_mode,
+                          max_workers=self.max_workers,
+                          llm=self.llm if self.model_router is None else None,
+                          model_router=self.model_router,
+                          image_generator_tool=self.image_generator_tool,
+                          stream=self.stream,
+                          # File-backed blueprints are looked up again so edits to the YAML are picked up
+                          blueprint=None if self.blueprint.config_path else self.blueprint,
+                          generation_store=self.generation_store,
+                          checkpoints=self.checkpoints,
+                          topic_index=self.topic_index,
+                          reuse_drafts=self.reuse_drafts,
+                          reuse_threshold=self.reuse_threshold,
+                          seed_threshold=self.seed_threshold)
+
+    @classmethod
+    def run_batch(cls,
+                  topics: Iterable[str],
+                  max_concurrency: Optional[int] = None,
+                  config_path: str = str(CONFIG_DIR),
+                  progress_callback: Callable[[str, Dict], None] = None,
+                  execution_mode: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Generates content for many topics, running up to `max_concurrency` crews at once.
+
+        The LLM, the image tool (and its Gradio client) and the parsed YAML configurations
+        are created once and shared by every run. Result dicts are yielded as each topic
+        finishes (not in input order); each one is the `run_crew_and_get_results` dict plus
+        the topic, its generation_id, per-topic timing and the running batch throughput.
+        """
+        topics = [topic for topic in topics if topic]
+        if max_concurrency is None:
+            max_concurrency = cls._env_int('BATCH_MAX_CONCURRENCY', 4)
+        max_concurrency = max(1, max_concurrency)
+
+        # Build the heavy objects once through a template instance
+        template = cls(topic=None, config_path=config_path, execution_mode=execution_mode)
+        batch_id = uuid.uuid4().hex[:8]
+        logger.info(f"[batch-{batch_id}] Starting batch of {len(topics)} topics with max_concurrency={max_concurrency}")
+
+        def run_topic(index: int, topic: str) -> Dict[str, Any]:
+            generation_id = f"batch-{batch_id}-{index}"
+            started = time.perf_counter()
+            instance = template.spawn(topic, generation_id, progress_callback)
+            results = instance.run_crew_and_get_results()
+            elapsed = time.perf_counter() - started
+            results["topic"] = topic
+            results["generation_id"] = generation_id
+            results.setdefault("timings", {}).update({
+                "elapsed_seconds": round(elapsed, 3),
+                "tasks_per_second": round(template.total_tasks / elapsed, 4) if elapsed > 0 else None,
+            })
+            return results
+
+        batch_started = time.perf_counter()
+        completed = 0
+        failed = 0
+        executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"mininos-batch-{batch_id}")
+        try:
+            futures = {executor.submit(run_topic, i, topic): topic for i, topic in enumerate(topics)}
+            for future in as_completed(futures):
+                topic = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    logger.error(f"[batch-{batch_id}] Topic '{topic}' failed: {e}", exc_info=True)
+                    results = {"status": "error", "message": f"Batch run failed: {str(e)}", "topic": topic}
+                completed += 1
+                if results.get("status") != "success":
+                    failed += 1
+                wall = time.perf_counter() - batch_started
+                results["batch"] = {
+                    "batch_id": batch_id,
+                    "completed": completed,
+                    "failed": failed,
+                    "total": len(topics),
+                    "wall_seconds": round(wall, 3),
+                    "topics_per_minute": round(completed / wall * 60, 3) if wall > 0 else None,
+                }
+                yield results
+        finally:
+            # If the consumer stops early, don't start the topics still queued
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        wall = time.perf_counter() - batch_started
+        logger.info(f"[batch-{batch_id}] Batch finished: {completed}/{len(topics)} topics "
+                    f"({failed} failed) in {wall:.1f}s "
+                    f"({(completed / wall * 60) if wall > 0 else 0:.2f} topics/min)")
@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Generation lifecycle in the store (the final ones mirror the result dict 'status')
+GENERATION_RUNNING = "running"
+GENERATION_SUCCESS = "success"
+GENERATION_ERROR = "error"
+GENERATION_CANCELLED = "cancelled"
+GENERATION_TIMEOUT = "timeout"
+
+# Large text fields of the result dict, kept as blob files instead of SQLite columns
+BLOB_FIELDS = ("blog_draft", "blog_reviewed", "images", "kickoff_raw_result")
+_IMAGE_URL_RE = re.compile(r"/generated_images/[\w.\-]+")
+_UNSAFE_ID_RE = re.compile(r"[^\w.\-]")
+
+
+class GenerationStore:
+    """
+    Persistent history of crew generations.
+
+    - A SQLite index (`generations.sqlite3`) holds one row per generation: topic, status,
+      execution mode, dates, elapsed time, token counts, the social posts (JSON), image
+      URLs, per-task timings and per-agent token usage. It is indexed by date, by status
+      and by topic (case-insensitive prefix), so listing and analytics never scan files.
+    - Drafts, reviewed posts and the raw tool/crew outputs are written as blob files
+      (`blobs/<generation_id>/<field>.md`, atomic tmp + rename) and only read when a full
+      record is requested or exported.
+    - Exports (NDJSON, Markdown) walk the index in keyset-paginated batches, so they
+      stream without loading the history in memory.
+    """
+
+    def __init__(self, root: Union[str, pathlib.Path], index_name: str = "generations.sqlite3"):
+        self.root = pathlib.Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / index_name), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            " id TEXT PRIMARY KEY, topic TEXT NOT NULL, topic_key TEXT NOT NULL, status TEXT NOT NULL,"
+            " execution_mode TEXT, created_at REAL NOT NULL, finished_at REAL, elapsed_seconds REAL,"
+            " prompt_tokens INTEGER NOT NULL DEFAULT 0, completion_tokens INTEGER NOT NULL DEFAULT 0,"
+            " social_media TEXT, image_urls TEXT, timings TEXT, usage TEXT, error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_created ON generations(created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_status ON generations(status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_topic ON generations(topic_key, created_at)")
+
+    # --- Blobs ---
+
+    def _blob_path(self, generation_id: str, field: str) -> pathlib.Path:
+        return self.blob_dir / _UNSAFE_ID_RE.sub("_", generation_id) / f"{field}.md"
+
+    def _write_blob(self, generation_id: str, field: str, content: Optional[str]) -> None:
+        path = self._blob_path(generation_id, field)
+        if content is None:
+            path.unlink(missing_ok=True)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(content, encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _read_blob(self, generation_id: str, field: str) -> Optional[str]:
+        try:
+            return self._blob_path(generation_id, field).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    # --- Writes ---
+
+    def start(self, generation_id: str, topic: str, execution_mode: Optional[str] = None) -> None:
+        """Records a generation as running (a re-run of the same id resets its outcome)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO generations (id, topic, topic_key, status, execution_mode, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET status = excluded.status, execution_mode = excluded.execution_mode,"
+                " finished_at = NULL, elapsed_seconds = NULL, error = NULL",
+                (generation_id, topic, topic.strip().lower(), GENERATION_RUNNING, execution_mode, time.time()),
+            )
+
+    def finish(self, generation_id: str, results: Dict[str, Any], elapsed_seconds: Optional[float] = None) -> None:
+        """Stores the result dict of `Mininos.run_crew_and_get_results` (with its 'timings' and 'usage')."""
+        for field in BLOB_FIELDS:
+            value = results.get(field)
+            self._write_blob(generation_id, field, str(value) if value is not None else None)
+        usage = results.get("usage") or {}
+        image_urls = _IMAGE_URL_RE.findall(str(results.get("images") or ""))
+        status = results.get("status")
+        if status not in (GENERATION_SUCCESS, GENERATION_CANCELLED, GENERATION_TIMEOUT):
+            status = GENERATION_ERROR
+        with self._lock:
+            self._conn.execute(
+                "UPDATE generations SET status = ?, finished_at = ?, elapsed_seconds = ?, prompt_tokens = ?,"
+                " completion_tokens = ?, social_media = ?, image_urls = ?, timings = ?, usage = ?, error = ?"
+                " WHERE id = ?",
+                (status, time.time(), elapsed_seconds, int(usage.get("prompt_tokens", 0)),
+                 int(usage.get("completion_tokens", 0)),
+                 json.dumps(results.get("social_media"), ensure_ascii=False, default=str),
+                 json.dumps(list(dict.fromkeys(image_urls))), json.dumps(results.get("timings") or {}),
+                 json.dumps(usage), results.get("message") if status != GENERATION_SUCCESS else None, generation_id),
+            )
+
+    # --- Reads ---
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        record.pop("topic_key", None)
+        for column in ("social_media", "image_urls", "timings", "usage"):
+            record[column] = json.loads(record[column]) if record[column] else None
+        return record
+
+    def _with_blobs(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        for field in BLOB_FIELDS:
+            record[field] = self._read_blob(record["id"], field)
+        return record
+
+    @staticmethod
+    def _filters(topic: Optional[str], status: Optional[str], since: Optional[float],
+                 until: Optional[float]) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        if topic:
+            # Case-insensitive prefix as a range on topic_key, so the index is used
+            prefix = topic.strip().lower()
+            clauses.append("topic_key >= ? AND topic_key < ?")
+            params += [prefix, prefix + "\U0010ffff"]
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def get(self, generation_id: str, include_blobs: bool = True) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM generations WHERE id = ?", (generation_id,)).fetchone()
+        if row is None:
+            return None
+        record = self._row_to_dict(row)
+        return self._with_blobs(record) if include_blobs else record
+
+    def list(self, topic: Optional[str] = None, status: Optional[str] = None, since: Optional[float] = None,
+             until: Optional[float] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Generations (newest first) matching the filters, without their blob fields."""
+        where, params = self._filters(topic, status, since, until)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM generations{where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def count(self, topic: Optional[str] = None, status: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None) -> int:
+        where, params = self._filters(topic, status, since, until)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM generations{where}", params).fetchone()[0]
+
+    def iter_records(self, topic: Optional[str] = None, status: Optional[str] = None,
+                     since: Optional[float] = None, until: Optional[float] = None,
+                     include_blobs: bool = True, batch_size: int = 100) -> Iterator[Dict[str, Any]]:
+        """
+        Yields every matching generation (newest first), fetching `batch_size` rows at a time
+        with keyset pagination on (created_at, id); the lock is only held per batch.
+        """
+        where, params = self._filters(topic, status, since, until)
+        cursor: Optional[Tuple[float, str]] = None
+        while True:
+            query, query_params = f"SELECT * FROM generations{where}", list(params)
+            if cursor is not None:
+                query += (" AND" if where else " WHERE") + " (created_at < ? OR (created_at = ? AND id < ?))"
+                query_params += [cursor[0], cursor[0], cursor[1]]
+            query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+            with self._lock:
+                rows = self._conn.execute(query, query_params + [batch_size]).fetchall()
+            for row in rows:
+                record = self._row_to_dict(row)
+                yield self._with_blobs(record) if include_blobs else record
+            if len(rows) < batch_size:
+                return
+            cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+    # --- Export ---
+
+    def export_ndjson(self, **filters) -> Iterator[str]:
+        """One JSON document per line and generation (with blobs)."""
+        for record in self.iter_records(**filters):
+            yield json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+    def export_markdown(self, **filters) -> Iterator[str]:
+        """One Markdown section per generation: metadata, reviewed post, social posts and images."""
+        for record in self.iter_records(**filters):
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(record["created_at"]))
+            parts = [f"# {record['topic']}\n\n",
+                     f"- ID: `{record['id']}`\n- Date: {created}\n- Status: {record['status']}\n"]
+            if record.get("elapsed_seconds") is not None:
+                parts.append(f"- Elapsed: {record['elapsed_seconds']:.1f}s\n")
+            parts.append(f"- Tokens: {record['prompt_tokens']} prompt / {record['completion_tokens']} completion\n\n")
+            post = record.get("blog_reviewed") or record.get("blog_draft")
+            if post:
+                parts.append(f"## Blog post\n\n{post.strip()}\n\n")
+            social = record.get("social_media") or {}
+            platforms = [key for key in social if key not in ("errors", "error", "raw_output")]
+            if platforms:
+                parts.append("## Social media\n\n")
+                parts.extend(f"### {platform.capitalize()}\n\n{str(social[platform]).strip()}\n\n" for platform in platforms)
+            if record.get("image_urls"):
+                parts.append("## Images\n\n")
+                parts.extend(f"![]({url})\n" for url in record["image_urls"])
+                parts.append("\n")
+            if record.get("error"):
+                parts.append(f"> Error: {record['error']}\n\n")
+            parts.append("---\n\n")
+            yield "".join(parts)
+
+    # --- Analytics ---
+
+    def stats(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+        where, params = self._filters(None, None, since, until)
+        with self._lock:
+            by_status = {row["status"]: row["n"] for row in self._conn.execute(
+                f"SELECT status, COUNT(*) AS n FROM generations{where} GROUP BY status", params)}
+            totals = self._conn.execute(
+                "SELECT COUNT(*) AS generations, AVG(elapsed_seconds) AS avg_elapsed,"
+                " MAX(elapsed_seconds) AS max_elapsed, COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,"
+                f" COALESCE(SUM(completion_tokens), 0) AS completion_tokens FROM generations{where}", params,
+            ).fetchone()
+        return {
+            "generations": totals["generations"],
+            "by_status": by_status,
+            "avg_elapsed_seconds": round(totals["avg_elapsed"], 3) if totals["avg_elapsed"] is not None else None,
+            "max_elapsed_seconds": round(totals["max_elapsed"], 3) if totals["max_elapsed"] is not None else None,
+            "prompt_tokens": totals["prompt_tokens"],
+            "completion_tokens": totals["completion_tokens"],
+        }
+
+
+def build_generation_store_from_env(default_dir: Union[str, pathlib.Path]) -> Optional[GenerationStore]:
+    """
+    Builds the generation history store from environment variables:
+      GENERATION_STORE=sqlite (default) | off, GENERATION_STORE_DIR (index + blobs directory).
+    """
+    kind = os.getenv("GENERATION_STORE", "sqlite").lower()
+    if kind in ("", "off", "none", "false", "0"):
+        return None
+    if kind != "sqlite":
+        logger.warning(f"Unknown GENERATION_STORE backend '{kind}', generation history disabled.")
+        return None
+    try:
+        return GenerationStore(os.getenv("GENERATION_STORE_DIR", str(default_dir)))
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Error initializing the generation store, continuing without it: {e}")
+        return None
@@ -0,0 +1,240 @@
+import json
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobStore:
+    """
+    Durable generation job queue backed by SQLite. The `jobs` table is the queue: workers
+    claim the oldest 'queued' job atomically. Jobs left 'running' by a previous process
+    are re-queued on startup.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, topic TEXT NOT NULL, options TEXT NOT NULL DEFAULT '{}',"
+            " status TEXT NOT NULL, progress INTEGER NOT NULL DEFAULT 0, message TEXT,"
+            " result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)")
+        requeued = self._conn.execute(
+            "UPDATE jobs SET status = ?, message = ? WHERE status = ?",
+            (JOB_QUEUED, "Re-queued after service restart", JOB_RUNNING),
+        ).rowcount
+        if requeued:
+            logger.warning(f"Re-queued {requeued} jobs interrupted by a previous shutdown")
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def create(self, topic: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        job_id = f"gen-{uuid.uuid4()}"
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, topic, options, status, message, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, topic, json.dumps(options or {}), JOB_QUEUED, "Queued", time.time()),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM jobs"
+        params: List[Any] = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically moves the oldest queued job to 'running' and returns it."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (JOB_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            claimed = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, message = ? WHERE id = ? AND status = ?",
+                (JOB_RUNNING, time.time(), "Starting", row["id"], JOB_QUEUED),
+            ).rowcount
+        return self.get(row["id"]) if claimed else None
+
+    def update_progress(self, job_id: str, progress: Optional[int], message: Optional[str]) -> None:
+        # Events arriving after the end (background image renders) don't overwrite the final state
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = COALESCE(?, progress), message = COALESCE(?, message)"
+                " WHERE id = ? AND status = ?",
+                (progress, message, job_id, JOB_RUNNING),
+            )
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?,"
+                " progress = CASE WHEN ? = 'done' THEN 100 ELSE progress END, message = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                 error, time.time(), status, f"Job {status}", job_id),
+            )
+
+    def requeue(self, job_id: str, options: Optional[Dict[str, Any]] = None) -> bool:
+        """Queues a finished job again (e.g. to resume it from its checkpoints), replacing its options."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, options = COALESCE(?, options), progress = 0, message = ?, result = NULL,"
+                " error = NULL, started_at = NULL, finished_at = NULL"
+                f" WHERE id = ? AND status IN ({', '.join('?' * len(FINISHED_STATES))})",
+                (JOB_QUEUED, json.dumps(options) if options is not None else None, "Queued for resume",
+                 job_id, *FINISHED_STATES),
+            ).rowcount > 0
+
+    def cancel_if_queued(self, job_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, message = ? WHERE id = ? AND status = ?",
+                (JOB_CANCELLED, time.time(), "Cancelled before start", job_id, JOB_QUEUED),
+            ).rowcount > 0
+
+
+class JobEvents:
+    """In-memory per-job progress event log, read incrementally by SSE/WebSocket clients."""
+
+    def __init__(self, max_events_per_job: int = 5000, max_jobs: int = 500):
+        self.max_events_per_job = max_events_per_job
+        self.max_jobs = max_jobs
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+        self._offsets: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        event = {"seq": None, "time": time.time(), **event}
+        with self._lock:
+            if job_id not in self._events and len(self._events) >= self.max_jobs:
+                # Forget the oldest job's log (its final state stays in the JobStore)
+                oldest = next(iter(self._events))
+                self._events.pop(oldest)
+                self._offsets.pop(oldest, None)
+            events = self._events.setdefault(job_id, [])
+            offset = self._offsets.setdefault(job_id, 0)
+            event["seq"] = offset + len(events)
+            events.append(event)
+            if len(events) > self.max_events_per_job:
+                # Drop the oldest events; readers that fell behind skip ahead
+                drop = len(events) - self.max_events_per_job
+                del events[:drop]
+                self._offsets[job_id] = offset + drop
+
+    def since(self, job_id: str, seq: int) -> List[Dict[str, Any]]:
+        """Events with sequence number >= seq."""
+        with self._lock:
+            events = self._events.get(job_id, [])
+            offset = self._offsets.get(job_id, 0)
+            return list(events[max(0, seq - offset):])
+
+    def discard(self, job_id: str) -> None:
+        with self._lock:
+            self._events.pop(job_id, None)
+            self._offsets.pop(job_id, None)
+
+
+class JobWorkerPool:
+    """
+    Pool of worker threads that take jobs from the JobStore and run a crew for each one.
+    `run_job(job, progress_callback)` performs the actual generation and returns the
+    result dict from `Mininos.run_crew_and_get_results`.
+    """
+
+    def __init__(self, store: JobStore, events: JobEvents,
+                 run_job: Callable[[Dict[str, Any], Callable[[str, Dict], None]], Dict[str, Any]],
+                 workers: int = 2, poll_interval: float = 0.5):
+        self.store = store
+        self.events = events
+        self.run_job = run_job
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"mininos-job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} generation workers")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+    def notify(self) -> None:
+        """Wakes idle workers after a job is enqueued."""
+        self._wakeup.set()
+
+    def _progress_callback(self, generation_id: str, progress_info: Dict[str, Any]) -> None:
+        self.events.publish(generation_id, {"type": "progress", **progress_info})
+        # Token deltas are only streamed, not persisted
+        if progress_info.get("event") != "token_delta":
+            self.store.update_progress(generation_id, progress_info.get("progress"), progress_info.get("message"))
+
+    def _worker_loop(self) -> None:
+        while not self._stopping.is_set():
+            job = self.store.claim_next()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _execute(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        logger.info(f"[{job_id}] Worker picked up job for topic '{job['topic']}'")
+        self.events.publish(job_id, {"type": "status", "status": JOB_RUNNING})
+        try:
+            result = self.run_job(job, self._progress_callback)
+            # A cancelled run keeps its partial result; a timed-out one is a failure
+            status = {"success": JOB_DONE, "cancelled": JOB_CANCELLED}.get(result.get("status"), JOB_FAILED)
+            self.store.finish(job_id, status, result=result, error=result.get("message") if status != JOB_DONE else None)
+        except Exception as e:
+            logger.error(f"[{job_id}] Job failed: {e}", exc_info=True)
+            status = JOB_FAILED
+            self.store.finish(job_id, status, error=str(e))
+        self.events.publish(job_id, {"type": "status", "status": status})
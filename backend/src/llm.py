@@ -0,0 +1,188 @@
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import litellm
+from crewai import LLM
+from crewai.llm import suppress_warnings
+from crewai.utilities.exceptions.context_window_exceeding_exception import LLMContextLengthExceededException
+
+from src import telemetry
+from src.cancellation import call_cancellable, check_cancelled, remaining_time
+from src.llm_cache import LLMResponseCache, KEY_PARAMS, make_cache_key
+from src.ratelimit import CHARS_PER_TOKEN, UpstreamLimiter
+from src.streaming import DeltaCoalescer, current_stream_sink, next_stream_id
+
+logger = logging.getLogger(__name__)
+
+
+class MininosLLM(LLM):
+    """
+    crewai.LLM used by the Mininos crew. Behaves exactly like crewai.LLM and adds:
+    - an optional response cache: when `cache` is set, identical requests (same model,
+      sampling parameters and normalized messages) are answered without calling LiteLLM.
+    - token streaming: when the calling thread has a stream sink installed
+      (see src.streaming.stream_sink) the completion is requested with stream=True and
+      the deltas are forwarded, coalesced, to the sink as they arrive.
+    - an optional shared rate limiter (src.ratelimit): every LiteLLM request goes through
+      it, so throttled calls are queued/retried instead of failing the agent.
+    - instrumentation (src.telemetry): a span per call, latency and prompt/completion token
+      counts labelled with the agent of the running task.
+    - cancellation (src.cancellation): every call is an agent step, so the run's token is
+      checked first; the request is abandoned as soon as the run is cancelled or a deadline
+      passes, and its timeout never outlives the deadline.
+    - an optional health tracker (src.model_router.ModelHealth) that records the latency and
+      outcome of every request sent upstream (not cache hits nor rate-limiter queueing).
+    """
+
+    def __init__(self, model: str, cache: Optional[LLMResponseCache] = None,
+                 stream_interval: float = 0.25, rate_limiter: Optional[UpstreamLimiter] = None,
+                 health=None, **kwargs):
+        # Must not reach crewai.LLM's **kwargs, which are forwarded to litellm.completion
+        super().__init__(model=model, **kwargs)
+        self.cache = cache
+        self.stream_interval = stream_interval
+        self.rate_limiter = rate_limiter
+        self.health = health
+
+    def _sampling_params(self) -> Dict[str, Any]:
+        """Current sampling parameters (they can change after init, e.g. `stop` set by the agent executor)."""
+        params = {name: getattr(self, name, None) for name in KEY_PARAMS}
+        params.update(self.kwargs)
+        return params
+
+    def _completion_params(self, messages: List[Dict[str, str]], stream: bool) -> Dict[str, Any]:
+        """Same parameters crewai.LLM.call sends to litellm.completion."""
+        timeout = self.timeout
+        remaining = remaining_time()
+        if remaining is not None:
+            # An abandoned request must not outlive the run/task deadline
+            timeout = min(timeout, remaining) if timeout else remaining
+        params = {
+            "model": self.model,
+            "messages": messages,
+            "timeout": timeout,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "n": self.n,
+            "stop": self.stop,
+            "max_tokens": self.max_tokens or self.max_completion_tokens,
+            "presence_penalty": self.presence_penalty,
+            "frequency_penalty": self.frequency_penalty,
+            "logit_bias": self.logit_bias,
+            "response_format": self.response_format,
+            "seed": self.seed,
+            "logprobs": self.logprobs,
+            "top_logprobs": self.top_logprobs,
+            "api_base": self.base_url,
+            "api_version": self.api_version,
+            "api_key": self.api_key,
+            "stream": stream,
+            **self.kwargs,
+        }
+        return {k: v for k, v in params.items() if v is not None}
+
+    def _stream_call(self, messages: List[Dict[str, str]], callbacks: List[Any], sink, task: Optional[str]) -> str:
+        """Calls LiteLLM with stream=True, forwarding coalesced deltas to `sink`."""
+        if callbacks and len(callbacks) > 0:
+            self.set_callbacks(callbacks)
+        stream_id = next_stream_id()
+        coalescer = DeltaCoalescer(
+            lambda delta, chars, done: sink({"stream_id": stream_id, "task": task,
+                                             "delta": delta, "chars": chars, "done": done}),
+            min_interval=self.stream_interval,
+        )
+        parts = []
+        usage = None
+        try:
+            for chunk in litellm.completion(**self._completion_params(messages, stream=True)):
+                check_cancelled() # Stops reading (and drops the connection) once the run is cancelled
+                try:
+                    delta = chunk.choices[0].delta.content or ""
+                except (AttributeError, IndexError, KeyError):
+                    delta = ""
+                if delta:
+                    parts.append(delta)
+                    coalescer.push(delta)
+                usage = getattr(chunk, "usage", None) or usage # Some providers report usage on the last chunks
+        except Exception as e:
+            logger.error(f"LiteLLM streaming call failed: {str(e)}")
+            raise
+        finally:
+            coalescer.close()
+        response = "".join(parts)
+        self._record_usage(messages, response, usage)
+        return response
+
+    def _complete(self, messages: List[Dict[str, str]], callbacks: List[Any]) -> str:
+        """Non-streaming request, as crewai.LLM.call sends it, keeping the usage the provider reports."""
+        with suppress_warnings():
+            if callbacks and len(callbacks) > 0:
+                self.set_callbacks(callbacks)
+            try:
+                response = litellm.completion(**self._completion_params(messages, stream=False))
+            except Exception as e:
+                if not LLMContextLengthExceededException(str(e))._is_context_limit_error(str(e)):
+                    logger.error(f"LiteLLM call failed: {str(e)}")
+                raise
+        content = response["choices"][0]["message"]["content"]
+        self._record_usage(messages, content or "", getattr(response, "usage", None))
+        return content
+
+    def _tracked_request(self, request, *args) -> str:
+        """Runs one upstream request, recording its latency and outcome in the health tracker."""
+        started = time.perf_counter()
+        try:
+            response = request(*args)
+        except Exception as e:
+            if not LLMContextLengthExceededException(str(e))._is_context_limit_error(str(e)):
+                self.health.record(time.perf_counter() - started, ok=False)
+            raise
+        self.health.record(time.perf_counter() - started, ok=True)
+        return response
+
+    def _record_usage(self, messages: List[Dict[str, str]], response: str, usage: Any) -> None:
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        estimated = prompt_tokens is None or completion_tokens is None
+        if estimated:
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // CHARS_PER_TOKEN
+            completion_tokens = len(response) // CHARS_PER_TOKEN
+        telemetry.record_llm_tokens(self.model, int(prompt_tokens), int(completion_tokens), estimated=estimated)
+
+    def call(self, messages: List[Dict[str, str]], callbacks: List[Any] = []) -> str:
+        check_cancelled() # Agent step boundary
+        stream = current_stream_sink()
+        with telemetry.observe("llm.call", telemetry.LLM_SECONDS, telemetry.LLM_REQUESTS,
+                               attributes={"stream": bool(stream), "task": telemetry.current_label("task")},
+                               model=self.model, agent=telemetry.current_label("agent")) as scope:
+            key = None
+            if self.cache is not None:
+                key = make_cache_key(self.model, self._sampling_params(), messages)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    logger.debug(f"LLM cache hit for {self.model} (key {key[:12]})")
+                    scope.status = "cache_hit"
+                    if stream:
+                        sink, task = stream
+                        sink({"stream_id": next_stream_id(), "task": task, "delta": cached,
+                              "chars": len(cached), "done": True})
+                    return cached
+
+            if stream:
+                request, args = self._stream_call, (messages, callbacks, *stream)
+            else:
+                request, args = self._complete, (messages, callbacks)
+            if self.health is not None:
+                request, args = self._tracked_request, (request, *args)
+            if self.rate_limiter is not None:
+                prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // CHARS_PER_TOKEN
+                response = self.rate_limiter.call(call_cancellable, request, *args, estimated_tokens=prompt_tokens)
+                # Completion tokens are only known afterwards; charge them to the TPM budget
+                self.rate_limiter.record_tokens(len(response or "") // CHARS_PER_TOKEN)
+            else:
+                response = call_cancellable(request, *args)
+
+            if key is not None and response:  # Never cache empty completions
+                self.cache.set(key, response)
+            return response
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Sampling parameters that change the completion and therefore belong in the cache key
+KEY_PARAMS = (
+    "temperature", "top_p", "n", "stop", "max_tokens", "max_completion_tokens",
+    "presence_penalty", "frequency_penalty", "logit_bias", "response_format",
+    "seed", "logprobs", "top_logprobs",
+)
+
+
+def normalize_messages(messages: Union[str, List[Dict[str, Any]]]) -> List[Dict[str, str]]:
+    """Normalizes a message list (or a bare prompt) so equivalent requests share a key."""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    normalized = []
+    for message in messages:
+        content = message.get("content", "")
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True, ensure_ascii=False)
+        normalized.append({
+            "role": str(message.get("role", "user")).lower(),
+            "content": content.replace("\r\n", "\n").strip(),
+        })
+    return normalized
+
+
+def make_cache_key(model: str, params: Dict[str, Any], messages: Union[str, List[Dict[str, Any]]]) -> str:
+    """Content-addressed key: sha256 of model, sampling parameters and normalized messages."""
+    sampling = {k: v for k, v in params.items() if v is not None}
+    if isinstance(sampling.get("stop"), list):
+        sampling["stop"] = sorted(sampling["stop"])
+    payload = json.dumps(
+        {"model": model, "params": sampling, "messages": normalize_messages(messages)},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryLRUBackend:
+    """Bounded in-memory LRU store with optional TTL and byte budget."""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, created_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, created_at, size = entry
+            if self.ttl and time.time() - created_at > self.ttl:
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        if self.max_bytes and size > self.max_bytes:
+            return  # Larger than the whole budget, never cacheable
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.time(), size)
+            self._bytes += size
+            while self._data and ((self.max_entries and len(self._data) > self.max_entries)
+                                  or (self.max_bytes and self._bytes > self.max_bytes)):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+class SQLiteBackend:
+    """On-disk store (SQLite) with TTL and LRU eviction by entry count and total size."""
+
+    def __init__(self, path: Union[str, pathlib.Path], max_entries: int = 50000,
+                 max_bytes: int = 512 * 1024 * 1024, ttl: Optional[float] = None):
+        self.path = pathlib.Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+        logger.info(f"LLM cache SQLite store at: {self.path.resolve()}")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        if self.max_bytes and size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Drops expired entries, then least recently used ones until within both limits."""
+        if self.ttl:
+            cur = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+            self.evictions += max(cur.rowcount, 0)
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if (not self.max_entries or count <= self.max_entries) and (not self.max_bytes or total <= self.max_bytes):
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall():
+            if (not self.max_entries or count <= self.max_entries) and (not self.max_bytes or total <= self.max_bytes):
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    @property
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+
+class LLMResponseCache:
+    """Front for a cache backend that keeps hit/miss counters."""
+
+    def __init__(self, backend: Union[MemoryLRUBackend, SQLiteBackend]):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"LLM cache read failed, treating as miss: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss/eviction counters and the current size of the store."""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.backend.evictions,
+            "entries": len(self.backend),
+            "size_bytes": self.backend.size_bytes,
+        }
+
+
+def build_llm_cache_from_env(default_path: Union[str, pathlib.Path]) -> Optional[LLMResponseCache]:
+    """
+    Builds the LLM response cache from environment variables. The cache is opt-in:
+      LLM_CACHE=memory|sqlite (unset/off disables it), LLM_CACHE_TTL (seconds, 0 = no expiry),
+      LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_BYTES, LLM_CACHE_PATH (sqlite file).
+    """
+    kind = os.getenv("LLM_CACHE", "off").lower()
+    if kind in ("", "off", "none", "false", "0"):
+        return None
+    try:
+        ttl = float(os.getenv("LLM_CACHE_TTL", 0)) or None
+        max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 0)) or None
+        max_bytes = int(os.getenv("LLM_CACHE_MAX_BYTES", 0)) or None
+    except ValueError:
+        logger.warning("Invalid LLM_CACHE_* values in .env, using backend defaults")
+        ttl, max_entries, max_bytes = None, None, None
+
+    limits = {k: v for k, v in (("max_entries", max_entries), ("max_bytes", max_bytes)) if v is not None}
+    if kind == "memory":
+        backend = MemoryLRUBackend(ttl=ttl, **limits)
+    elif kind == "sqlite":
+        backend = SQLiteBackend(os.getenv("LLM_CACHE_PATH", str(default_path)), ttl=ttl, **limits)
+    else:
+        logger.warning(f"Unknown LLM_CACHE backend '{kind}', cache disabled.")
+        return None
+    logger.info(f"LLM response cache enabled ({kind}, ttl={ttl}, limits={limits})")
+    return LLMResponseCache(backend)
@@ -0,0 +1,401 @@
+"""
+Logging pipeline for the API, the Streamlit app and the benchmarks.
+
+Loggers only enqueue records: the root logger has a single `QueueHandler` and a
+`QueueListener` thread formats and writes them, so console and file I/O never block the
+crew's worker threads. On the way:
+
+- Sampling (caller side, before anything is formatted): records below WARNING of noisy
+  third-party loggers are kept at a fixed rate (LiteLLM debug output carries whole prompts,
+  httpx logs one line per request). WARNING and above are always kept.
+- Context (caller side): `generation_id` and `task` from `src.run_context`.
+- Redaction (listener side): API keys, bearer tokens, `key=` URL parameters and the values of
+  the secret environment variables (`*_KEY`, `*_TOKEN`, `*_SECRET`, `*_PASSWORD`) are masked
+  in the message and in the `extra=` fields before any handler sees the record. Overlong messages are clipped.
+- Output: console (text, or JSON with LOG_FORMAT=json) and a JSON-lines file rotated by size
+  and by age, with gzip-compressed backups.
+
+If the queue is full (a burst faster than the disk) records are dropped instead of blocking
+the caller; the listener reports how many.
+
+Configuration (environment):
+  LOG_LEVEL (INFO), LOG_FORMAT=text | json (console), LOG_FILE (default src/logs/mewai.log,
+  'off' disables the file), LOG_ROTATE_MB (20), LOG_ROTATE_HOURS (24, 0 = size only),
+  LOG_BACKUP_COUNT (5), LOG_QUEUE_SIZE (10000), LOG_MAX_MESSAGE_CHARS (8000),
+  LOG_SAMPLE_RATES (e.g. "LiteLLM=0.01,httpx=0.05"; 1 keeps everything, 0 drops everything
+  below WARNING).
+"""
+import atexit
+import datetime
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import pathlib
+import queue
+import re
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from src import telemetry
+from src.run_context import current_generation_id, current_task_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_FILE = pathlib.Path(__file__).parent / "logs" / "mewai.log"
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Rates for records below WARNING (LiteLLM attaches its own loggers, see configure_logging)
+DEFAULT_SAMPLE_RATES = {
+    "LiteLLM": 0.01,
+    "LiteLLM Router": 0.01,
+    "LiteLLM Proxy": 0.01,
+    "httpx": 0.05,
+    "httpcore": 0.01,
+}
+REDACTED = "[REDACTED]"
+
+_SECRET_PATTERNS = [
+    r"AIza[0-9A-Za-z_\-]{35}",  # Google API keys
+    r"sk-[A-Za-z0-9_\-]{20,}",  # OpenAI-style keys
+    r"hf_[A-Za-z0-9]{30,}",  # Hugging Face tokens
+    r"(?<=Bearer )[A-Za-z0-9._~+/\-]{8,}=*",
+    r"(?<=[?&]key=)[^&\s'\"]+",
+    r"(?i:(?<=api_key=')[^']+)",
+    r"(?i:(?<=api_key=\")[^\"]+)",
+    r"(?i:(?<=\"api_key\": \")[^\"]+)",
+    r"(?i:(?<='api_key': ')[^']+)",
+    r"(?i:(?<=x-goog-api-key: )\S+)",
+]
+_SECRET_ENV_RE = re.compile(r"(KEY|TOKEN|SECRET|PASSWORD)$")
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+# Attributes of every LogRecord; anything else on a record came from `extra=`
+_RECORD_ATTRS = frozenset(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {
+    "message", "asctime", "generation_id", "task"}
+
+_lock = threading.Lock()
+_listener: Optional["_LogListener"] = None
+
+
+class SecretRedactor:
+    """Masks secrets in log messages: known key formats plus the values of secret env vars."""
+
+    def __init__(self, extra_secrets: Optional[List[str]] = None):
+        secrets = [value for name, value in os.environ.items()
+                   if _SECRET_ENV_RE.search(name.upper()) and len(value) >= 8]
+        secrets += [s for s in extra_secrets or [] if s]
+        # Longest first, so a secret that contains another is masked whole
+        literals = [re.escape(s) for s in sorted(set(secrets), key=len, reverse=True)]
+        self._pattern = re.compile("|".join(literals + _SECRET_PATTERNS))
+
+    def redact(self, text: str) -> str:
+        return self._pattern.sub(REDACTED, text)
+
+    def redact_value(self, value: Any) -> Any:
+        """Redacts an `extra=` value: strings, containers of them, and any other object as its str()."""
+        if isinstance(value, str):
+            return self.redact(value)
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, dict):
+            return {key: self.redact_value(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple, set)):
+            return [self.redact_value(item) for item in value]
+        return self.redact(str(value))
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fixed fraction of the records below WARNING of the configured loggers (and their
+    children). Deterministic: with rate 0.01 every 100th record passes, so bursts are thinned
+    evenly instead of at random.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = {name: min(max(rate, 0.0), 1.0) for name, rate in rates.items()}
+        self._counts: Dict[str, int] = {}
+        self._cache: Dict[str, Optional[str]] = {}
+
+    def _rule(self, name: str) -> Optional[str]:
+        rule = self._cache.get(name, "")
+        if rule == "":
+            rule = None
+            for candidate in self.rates:
+                if (name == candidate or name.startswith(candidate + ".")) and len(candidate) > len(rule or ""):
+                    rule = candidate
+            self._cache[name] = rule
+        return rule
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rule = self._rule(record.name)
+        if rule is None:
+            return True
+        rate = self.rates[rule]
+        if rate >= 1.0:
+            return True
+        # Races between threads only shift which record of the burst is kept
+        count = self._counts.get(rule, 0) + 1
+        self._counts[rule] = count
+        if rate > 0 and int(count * rate) != int((count - 1) * rate):
+            return True
+        telemetry.LOG_RECORDS_DROPPED.inc(reason="sampled")
+        return False
+
+
+class ContextFilter(logging.Filter):
+    """Tags records with the generation and task of the code that logged them."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.generation_id = current_generation_id()
+        record.task = current_task_key()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, generation_id, task, thread and `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "generation_id": getattr(record, "generation_id", None),
+            "task": getattr(record, "task", None),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RotatingLogFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    File handler rotated when the file reaches `max_bytes` or is `interval_seconds` old,
+    whichever comes first. Backups are named `<file>.<YYYYmmdd-HHMMSS-micro>[.gz]` and only the
+    newest `backup_count` are kept.
+    """
+
+    def __init__(self, filename: Union[str, pathlib.Path], max_bytes: int = 0, interval_seconds: float = 0,
+                 backup_count: int = 5, compress: bool = True):
+        pathlib.Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(filename, "a", encoding="utf-8", delay=True)
+        self.max_bytes = max_bytes
+        self.interval_seconds = interval_seconds
+        self.backup_count = backup_count
+        if compress:
+            self.rotator = self._compress
+        self._rollover_at = time.time() + interval_seconds if interval_seconds > 0 else None
+
+    @staticmethod
+    def _compress(source: str, dest: str) -> None:
+        with open(source, "rb") as src, gzip.open(dest + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        if self._rollover_at is not None and time.time() >= self._rollover_at:
+            if self.stream.tell() > 0:
+                return True
+            self._rollover_at = time.time() + self.interval_seconds  # Nothing written this interval
+        if self.max_bytes > 0:
+            return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+        return False
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename):
+            stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+            dest, n = f"{self.baseFilename}.{stamp}", 1
+            while os.path.exists(dest) or os.path.exists(dest + ".gz"):
+                dest, n = f"{self.baseFilename}.{stamp}.{n}", n + 1
+            self.rotate(self.baseFilename, dest)
+        self._delete_old_backups()
+        if self._rollover_at is not None:
+            self._rollover_at = time.time() + self.interval_seconds
+
+    def _delete_old_backups(self) -> None:
+        base = pathlib.Path(self.baseFilename)
+        # Timestamped names sort oldest first
+        backups = sorted(p for p in base.parent.glob(base.name + ".*") if not p.name.endswith(".tmp"))
+        for path in backups[:max(len(backups) - self.backup_count, 0)]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueues without ever blocking: records that do not fit in the queue are counted and dropped."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            telemetry.LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+class _LogListener(logging.handlers.QueueListener):
+    """Listener thread: reports dropped records, strips colors, clips and redacts messages (and `extra` fields), then writes them."""
+
+    def __init__(self, log_queue: queue.Queue, queue_handler: _QueueHandler, redactor: SecretRedactor,
+                 max_message_chars: int, *handlers: logging.Handler):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self.redactor = redactor
+        self.max_message_chars = max_message_chars
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler.prepare already merged args and traceback into a plain string message
+        message = _ANSI_RE.sub("", str(record.msg))
+        if self.max_message_chars and len(message) > self.max_message_chars:
+            message = f"{message[:self.max_message_chars]}... [{len(message) - self.max_message_chars} chars clipped]"
+        record.msg = record.message = self.redactor.redact(message)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                record.__dict__[key] = self.redactor.redact_value(value)
+        return record
+
+    def handle(self, record: logging.LogRecord) -> None:
+        dropped, self.queue_handler.dropped = self.queue_handler.dropped, 0
+        if dropped:
+            super().handle(logging.makeLogRecord({
+                "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": f"Logging queue full: dropped {dropped} log records"}))
+        super().handle(record)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(float(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+def parse_sample_rates(spec: Optional[str]) -> Dict[str, float]:
+    """Default sampling rates updated with a "logger=rate,..." spec."""
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in (spec or "").split(","):
+        name, _, rate = item.rpartition("=")
+        if not name.strip():
+            continue
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def configure_logging(log_file: Optional[Union[str, pathlib.Path]] = None, level: Optional[str] = None) -> None:
+    """
+    Installs the queue-based pipeline on the root logger (idempotent: later calls, e.g. on
+    Streamlit reruns, are no-ops). `log_file`/`level` override LOG_FILE/LOG_LEVEL; a
+    log_file of 'off' logs to the console only.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        level_name = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+        root_level = getattr(logging, level_name, None)
+        if not isinstance(root_level, int):
+            root_level = logging.INFO
+
+        console = logging.StreamHandler()
+        console.setFormatter(JsonFormatter() if os.getenv("LOG_FORMAT", "text").lower() == "json"
+                             else logging.Formatter(TEXT_FORMAT))
+        handlers: List[logging.Handler] = [console]
+        file_error: Optional[OSError] = None
+        file_setting = str(log_file or os.getenv("LOG_FILE", DEFAULT_LOG_FILE))
+        if file_setting.lower() not in ("", "off", "none", "false", "0"):
+            try:
+                file_handler = RotatingLogFileHandler(
+                    file_setting,
+                    max_bytes=_env_int("LOG_ROTATE_MB", 20) * 1024 * 1024,
+                    interval_seconds=_env_int("LOG_ROTATE_HOURS", 24) * 3600,
+                    backup_count=_env_int("LOG_BACKUP_COUNT", 5))
+                file_handler.setFormatter(JsonFormatter())
+                handlers.append(file_handler)
+            except OSError as e:
+                file_error = e # Reported once the pipeline is up
+
+        log_queue: queue.Queue = queue.Queue(maxsize=max(_env_int("LOG_QUEUE_SIZE", 10000), 0))
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(parse_sample_rates(os.getenv("LOG_SAMPLE_RATES"))))
+        queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(root_level)
+        # LiteLLM attaches a synchronous stderr handler to its loggers at import: route them
+        # through the queue (sampling, redaction) instead. Imported here so that a later
+        # import cannot bring the handler back.
+        try:
+            import litellm._logging  # noqa: F401
+        except ImportError:
+            pass
+        for name in ("LiteLLM", "LiteLLM Router", "LiteLLM Proxy"):
+            third_party = logging.getLogger(name)
+            for handler in third_party.handlers[:]:
+                third_party.removeHandler(handler)
+            third_party.propagate = True
+
+        _listener = _LogListener(log_queue, queue_handler, SecretRedactor(),
+                                 max(_env_int("LOG_MAX_MESSAGE_CHARS", 8000), 0), *handlers)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    if file_error is not None:
+        logger.warning(f"Cannot open log file {file_setting}, logging to the console only: {file_error}")
+    logger.info(f"Logging configured: level {level_name}, file "
+                f"{handlers[1].baseFilename if len(handlers) > 1 else 'off'}")
+
+
+def _after_fork_in_child() -> None:
+    # Forked children (e.g. benchmark fakes) do not inherit the listener thread: log to the
+    # console directly instead of into a queue nobody reads
+    global _listener
+    listener, _listener = _listener, None
+    if listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(listener.queue_handler)
+    console = logging.StreamHandler()
+    console.setFormatter(listener.handlers[0].formatter)
+    root.addHandler(console)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def shutdown_logging() -> None:
+    """Flushes the queued records and stops the listener thread (logging falls back to Python's default)."""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+        if listener is None:
+            return
+        root = logging.getLogger()
+        root.removeHandler(listener.queue_handler)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
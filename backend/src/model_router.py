@@ -0,0 +1,342 @@
+"""
+Per-agent model routing with model tiers and health-based failover.
+
+Models come in tiers configured from the environment (see `build_router_from_env`):
+'quality' (MODEL) for the agents whose output is the content itself, and 'fast'
+(MODEL_FAST) for light agents such as the formatter and the image prompter. Each tier has
+an ordered list of models: its primary and the fallbacks it fails over to.
+
+Each agent picks its tier and sampling settings in agents.yaml:
+
+    formatter:
+      llm:
+        tier: fast          # quality (default) | fast
+        model: ...          # optional, replaces the tier's primary model
+        fallback: ...       # optional, replaces the tier's fallbacks (a name or a list)
+        temperature: 0.4
+        max_tokens: 1500
+
+The agent gets a `RoutedLLM`: every call goes to the first healthy model of its list. A
+model is degraded when the p95 latency or the error rate of its recent calls crosses a
+threshold (`ModelHealth`); degraded models are skipped until a cooldown passes, and a
+call that fails on one model is retried on the next one. Health is tracked per model and
+endpoint for the whole process, so every agent and run sharing a model shares its state.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from crewai import LLM
+from crewai.utilities.exceptions.context_window_exceeding_exception import LLMContextLengthExceededException
+
+from src import telemetry
+from src.llm import MininosLLM
+from src.llm_cache import LLMResponseCache
+from src.ratelimit import get_limiter
+
+logger = logging.getLogger(__name__)
+
+QUALITY_TIER = "quality"
+FAST_TIER = "fast"
+# Env vars of each tier: (primary model, fallback models). Each one can set <VAR>_BASE_URL and <VAR>_API_KEY
+TIER_ENV = {
+    QUALITY_TIER: ("MODEL", "MODEL_FALLBACK"),
+    FAST_TIER: ("MODEL_FAST", "MODEL_FAST_FALLBACK"),
+}
+# Keys of the `llm` section of an agent in agents.yaml
+AGENT_LLM_KEYS = ("tier", "model", "fallback", "temperature", "max_tokens")
+
+
+class ModelEndpoint(NamedTuple):
+    model: str
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        """Identity used for health tracking (the same model behind two endpoints is tracked twice)."""
+        return f"{self.model}@{self.base_url}" if self.base_url else self.model
+
+
+class ModelHealth:
+    """
+    Rolling window of the latest calls to one model. The model is degraded when, with at
+    least `min_calls` in the window, the p95 latency of its successful calls exceeds
+    `p95_seconds` or its error rate exceeds `error_rate`. A degraded model stays degraded
+    for `cooldown_seconds`; then its window is cleared and it receives traffic again.
+    """
+
+    def __init__(self, key: str, window: int = 20, min_calls: int = 5, p95_seconds: float = 30.0,
+                 error_rate: float = 0.5, cooldown_seconds: float = 60.0):
+        self.key = key
+        self.min_calls = min_calls
+        self.p95_threshold = p95_seconds
+        self.error_rate_threshold = error_rate
+        self.cooldown_seconds = cooldown_seconds
+        self._calls: deque = deque(maxlen=window)  # (seconds, ok)
+        self._degraded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._calls.append((seconds, ok))
+
+    def _p95(self) -> Optional[float]:
+        latencies = sorted(seconds for seconds, ok in self._calls if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)]
+
+    def _error_rate(self) -> float:
+        return sum(1 for _, ok in self._calls if not ok) / len(self._calls) if self._calls else 0.0
+
+    def healthy(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._degraded_at is not None:
+                if now - self._degraded_at < self.cooldown_seconds:
+                    return False
+                # Cooldown over: start afresh so the model can prove itself again
+                self._degraded_at = None
+                self._calls.clear()
+                logger.info(f"Model {self.key} back in rotation after {self.cooldown_seconds}s cooldown")
+                return True
+            if len(self._calls) < self.min_calls:
+                return True
+            p95, error_rate = self._p95(), self._error_rate()
+            if (p95 is not None and p95 > self.p95_threshold) or error_rate > self.error_rate_threshold:
+                self._degraded_at = now
+                logger.warning(f"Model {self.key} degraded (p95 {p95 if p95 is None else round(p95, 2)}s, "
+                               f"error rate {error_rate:.0%}); routing to its fallbacks for {self.cooldown_seconds}s")
+                return False
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            p95 = self._p95()
+            return {"calls": len(self._calls), "p95_seconds": round(p95, 3) if p95 is not None else None,
+                    "error_rate": round(self._error_rate(), 3), "degraded": self._degraded_at is not None}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} in .env, using default {default}")
+        return default
+
+
+_health: Dict[str, ModelHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_health(key: str) -> ModelHealth:
+    """
+    Shared health tracker of a model, with the thresholds from env: LLM_FAILOVER_P95_SECONDS
+    (30), LLM_FAILOVER_ERROR_RATE (0.5), LLM_FAILOVER_WINDOW (20 calls), LLM_FAILOVER_MIN_CALLS (5)
+    and LLM_FAILOVER_COOLDOWN_SECONDS (60).
+    """
+    with _health_lock:
+        health = _health.get(key)
+        if health is None:
+            health = ModelHealth(key,
+                                 window=int(_env_float("LLM_FAILOVER_WINDOW", 20)),
+                                 min_calls=int(_env_float("LLM_FAILOVER_MIN_CALLS", 5)),
+                                 p95_seconds=_env_float("LLM_FAILOVER_P95_SECONDS", 30.0),
+                                 error_rate=_env_float("LLM_FAILOVER_ERROR_RATE", 0.5),
+                                 cooldown_seconds=_env_float("LLM_FAILOVER_COOLDOWN_SECONDS", 60.0))
+            _health[key] = health
+        return health
+
+
+def all_model_health() -> Dict[str, Dict[str, Any]]:
+    with _health_lock:
+        return {key: health.stats() for key, health in _health.items()}
+
+
+def _is_context_length_error(error: Exception) -> bool:
+    return LLMContextLengthExceededException(str(error))._is_context_limit_error(str(error))
+
+
+class RoutedLLM(LLM):
+    """
+    crewai.LLM over an ordered list of LLMs (primary first). Each call goes to the first
+    one whose model is healthy (degraded ones go last); if it fails, the call is retried on
+    the next one. Context-length errors are raised at once:
+    crewAI handles them by summarizing the conversation.
+    """
+
+    def __init__(self, candidates: List[MininosLLM]):
+        primary = candidates[0]
+        super().__init__(model=primary.model, temperature=primary.temperature, max_tokens=primary.max_tokens,
+                         timeout=primary.timeout, base_url=primary.base_url, api_key=primary.api_key)
+        self.candidates = candidates
+
+    def _route(self) -> List[MininosLLM]:
+        healthy, degraded = [], []
+        for llm in self.candidates:
+            (healthy if llm.health is None or llm.health.healthy() else degraded).append(llm)
+        order = healthy + degraded
+        for llm in self.candidates:
+            if llm is order[0]:
+                break
+            telemetry.LLM_FAILOVERS.inc(model=llm.model, reason="degraded")
+        return order
+
+    def call(self, messages: List[Dict[str, str]], callbacks: List[Any] = []) -> str:
+        order = self._route()
+        for position, llm in enumerate(order):
+            llm.stop = self.stop # Set by the agent executor on the agent's LLM
+            try:
+                return llm.call(messages, callbacks)
+            except Exception as e:
+                if position == len(order) - 1 or _is_context_length_error(e):
+                    raise
+                telemetry.LLM_FAILOVERS.inc(model=llm.model, reason="error")
+                logger.warning(f"LLM call to {llm.model} failed ({e}), failing over to {order[position + 1].model}")
+
+
+def _litellm_model(name: str) -> str:
+    """
+    Model name as LiteLLM expects it; names without a provider prefix are Gemini models.
+    Names with another provider prefix ('openai/...', 'ollama/...') are kept, so a tier can
+    point at a non-Gemini endpoint (MODEL_FAST_BASE_URL).
+    """
+    if "/" not in name:
+        logger.warning(f"Model '{name}' is missing a provider prefix. Using 'gemini/{name}' for LiteLLM.")
+        return f"gemini/{name}"
+    return name
+
+
+def _names(value: Any) -> List[str]:
+    """Model names from a setting that may be a string ('a, b'), a list or empty."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(name).strip() for name in value if str(name).strip()]
+
+
+class ModelRouter:
+    """
+    Builds (once per distinct setting) the LLM of each agent from its `llm` section in
+    agents.yaml and the model tiers. `tiers` maps a tier name to its endpoints, primary
+    first; `default_temperature` applies to agents that set none.
+    """
+
+    def __init__(self, tiers: Dict[str, List[ModelEndpoint]], default_temperature: float = 0.6,
+                 cache: Optional[LLMResponseCache] = None, api_key: Optional[str] = None):
+        if not tiers.get(QUALITY_TIER):
+            raise ValueError(f"The '{QUALITY_TIER}' model tier needs at least one model")
+        self.tiers = tiers
+        self.default_temperature = default_temperature
+        self.cache = cache
+        self.api_key = api_key # Default key of Gemini models
+        self._llms: Dict[Tuple, LLM] = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, name: str) -> ModelEndpoint:
+        """Endpoint of a model named in agents.yaml: the one configured for it in a tier, if any."""
+        model = _litellm_model(name)
+        for endpoints in self.tiers.values():
+            for endpoint in endpoints:
+                if endpoint.model == model:
+                    return endpoint
+        return ModelEndpoint(model)
+
+    def endpoints_for(self, settings: Optional[Dict[str, Any]] = None) -> List[ModelEndpoint]:
+        """Ordered endpoints (primary first) for an agent's `llm` settings."""
+        settings = settings or {}
+        tier = str(settings.get("tier") or QUALITY_TIER)
+        if tier not in self.tiers:
+            logger.warning(f"Unknown model tier '{tier}', using '{QUALITY_TIER}'")
+            tier = QUALITY_TIER
+        endpoints = list(self.tiers[tier])
+        if settings.get("model"):
+            endpoints[0] = self._endpoint(str(settings["model"]))
+        if settings.get("fallback") is not None:
+            endpoints[1:] = [self._endpoint(name) for name in _names(settings["fallback"])]
+        return list({endpoint.key: endpoint for endpoint in endpoints}.values())
+
+    def _build_llm(self, endpoint: ModelEndpoint, temperature: float, max_tokens: Optional[int]) -> MininosLLM:
+        provider = endpoint.model.split("/", 1)[0]
+        api_key = endpoint.api_key or (self.api_key if provider == "gemini" else None)
+        return MininosLLM(
+            model=endpoint.model,
+            cache=self.cache,
+            # Límites compartidos por todo el proceso por proveedor (GEMINI_RPM, GEMINI_TPM...)
+            rate_limiter=get_limiter(provider),
+            health=get_health(endpoint.key),
+            base_url=endpoint.base_url,
+            api_key=api_key,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            # Bounds a request abandoned by a cancel when the run has no deadline
+            timeout=_env_float("LLM_TIMEOUT_SECONDS", 120.0),
+        )
+
+    def llm_for(self, agent_key: Optional[str] = None, settings: Optional[Dict[str, Any]] = None) -> LLM:
+        """LLM for an agent (shared by every agent and run with the same settings)."""
+        settings = settings or {}
+        unknown = sorted(set(settings).difference(AGENT_LLM_KEYS))
+        if unknown:
+            logger.warning(f"Ignoring unknown llm settings {unknown} of agent '{agent_key}'")
+        endpoints = self.endpoints_for(settings)
+        temperature = float(settings.get("temperature", self.default_temperature))
+        max_tokens = int(settings["max_tokens"]) if settings.get("max_tokens") else None
+        cache_key = (tuple(endpoints), temperature, max_tokens)
+        with self._lock:
+            llm = self._llms.get(cache_key)
+            if llm is None:
+                candidates = [self._build_llm(endpoint, temperature, max_tokens) for endpoint in endpoints]
+                llm = candidates[0] if len(candidates) == 1 else RoutedLLM(candidates)
+                self._llms[cache_key] = llm
+                logger.info(f"LLM for agent '{agent_key or 'default'}': {' -> '.join(e.model for e in endpoints)} "
+                            f"(temperature {temperature}, max_tokens {max_tokens})")
+        return llm
+
+
+def _tier_endpoints(variable: str, fallbacks: str) -> List[ModelEndpoint]:
+    """Endpoints of a tier from its env vars (primary in `variable`, comma-separated list in `fallbacks`)."""
+    endpoints = []
+    for var, names in ((variable, _names(os.getenv(variable))[:1]), (fallbacks, _names(os.getenv(fallbacks)))):
+        for name in names:
+            endpoints.append(ModelEndpoint(_litellm_model(name), os.getenv(f"{var}_BASE_URL") or None,
+                                           os.getenv(f"{var}_API_KEY") or None))
+    return endpoints
+
+
+def build_router_from_env(cache: Optional[LLMResponseCache] = None) -> ModelRouter:
+    """
+    Builds the model router from environment variables:
+      MODEL (required), MODEL_FALLBACK: quality tier; MODEL_FAST, MODEL_FAST_FALLBACK: fast
+      tier. Without MODEL_FAST the fast tier is the quality tier; its fallbacks default to
+      the quality models. <VAR>_BASE_URL / <VAR>_API_KEY point a tier's models at another
+      endpoint (e.g. MODEL_FAST_BASE_URL for a local OpenAI-compatible server).
+      GOOGLE_API_KEY is the key of the Gemini models; LLM_TEMPERATURE the default temperature;
+      LLM_TIMEOUT_SECONDS the timeout of each request (120).
+    Raises ValueError if MODEL is missing or a Gemini model has no API key.
+    """
+    api_key = os.getenv('GOOGLE_API_KEY')
+    quality = _tier_endpoints(*TIER_ENV[QUALITY_TIER])
+    if not quality:
+        logger.error("MODEL not found in .env file")
+        raise ValueError("MODEL must be set in the .env file")
+    fast = _tier_endpoints(*TIER_ENV[FAST_TIER])
+    if not fast:
+        fast = quality
+    elif not os.getenv(TIER_ENV[FAST_TIER][1]):
+        fast = fast + quality # The fast tier fails over to the quality models
+    tiers = {QUALITY_TIER: quality, FAST_TIER: fast}
+    for endpoint in quality + fast:
+        if endpoint.model.startswith("gemini/") and not (endpoint.api_key or api_key):
+            logger.error(f"GOOGLE_API_KEY not found in .env file (needed by {endpoint.model})")
+            raise ValueError("GOOGLE_API_KEY must be set in the .env file for Gemini models")
+    default_temperature = _env_float('LLM_TEMPERATURE', 0.6)
+    logger.info("Model tiers: " + ", ".join(f"{tier}={' -> '.join(e.model for e in endpoints)}"
+                                             for tier, endpoints in tiers.items()))
+    return ModelRouter(tiers, default_temperature=default_temperature, cache=cache, api_key=api_key)
@@ -0,0 +1,328 @@
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from src import telemetry
+from src.cancellation import check_cancelled, sleep as cancellable_sleep
+
+logger = logging.getLogger(__name__)
+
+# Error text that marks a call as throttled / transient and therefore worth retrying
+RETRYABLE_MARKERS = (
+    "429", "rate limit", "ratelimit", "too many requests", "resource_exhausted", "quota",
+    "timeout", "timed out", "service unavailable", "overloaded", "connection reset",
+    "connection refused", "connection aborted",
+)
+
+# Rough characters-per-token ratio used to estimate TPM usage before a call
+CHARS_PER_TOKEN = 4
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Blocks until `amount` tokens are available and takes them. Returns seconds waited."""
+        amount = min(amount, self.capacity)  # A single request may never need more than a full bucket
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+            cancellable_sleep(delay) # Raises if the waiting run is cancelled
+            waited += delay
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def debit(self, amount: float) -> None:
+        """Takes tokens without waiting (may go negative), e.g. for completion tokens known after a call."""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+
+class UpstreamLimiter:
+    """
+    Coordinates every call to one upstream (Gemini, FLUX) made by the process:
+    - token buckets for requests per minute and (optionally) tokens per minute,
+    - an adaptive concurrency limit (AIMD): halved when the recent error rate crosses
+      `error_rate_threshold`, increased by one after a run of successes. With
+      `max_concurrency` None calls are unlimited until the upstream throttles; the limit
+      then starts at half the calls in flight and is lifted again once it climbs back to
+      that level,
+    - retries with jittered exponential backoff that honors Retry-After.
+    Only throttled/transient outcomes and successes feed the AIMD window: other errors say
+    nothing about the upstream's capacity. `adaptive=False` turns the AIMD limit off.
+    """
+
+    def __init__(self, name: str, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_concurrency: Optional[int] = 4, max_retries: int = 4, base_delay: float = 1.0,
+                 max_delay: float = 60.0, error_rate_threshold: float = 0.2, window: int = 20,
+                 adaptive: bool = True):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max(1, max_concurrency) if max_concurrency is not None else None
+        self.concurrency_limit = self.max_concurrency
+        self.adaptive = adaptive
+        self._ceiling = 0  # Calls in flight when an unlimited upstream started throttling
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.error_rate_threshold = error_rate_threshold
+        self._outcomes = deque(maxlen=window)  # True = throttled/failed
+        self._successes_since_change = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+        # Metrics
+        self.calls = 0
+        self.throttle_events = 0
+        self.retries = 0
+        self.failures = 0
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+
+    @staticmethod
+    def is_retryable(error: BaseException) -> bool:
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        status = getattr(error, "status_code", None)
+        if status in (429, 500, 502, 503, 504):
+            return True
+        text = f"{type(error).__name__} {error}".lower()
+        return any(marker in text for marker in RETRYABLE_MARKERS)
+
+    @staticmethod
+    def retry_after(error: BaseException) -> Optional[float]:
+        """Seconds requested by the upstream through a Retry-After header, if any."""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or getattr(error, "headers", None)
+        if not headers:
+            return None
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            parsed = email.utils.parsedate_to_datetime(value)
+        except (ValueError, TypeError):
+            return None # Malformed header: fall back to the exponential backoff
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        hinted = self.retry_after(error)
+        if hinted is not None:
+            return min(self.max_delay, hinted) + random.uniform(0, self.base_delay)
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _record(self, throttled: bool) -> None:
+        if not self.adaptive:
+            return
+        with self._cond:
+            self._outcomes.append(throttled)
+            error_rate = sum(self._outcomes) / len(self._outcomes)
+            # Unlimited so far: the calls in flight are the concurrency the upstream pushed back on
+            limit = self.concurrency_limit if self.concurrency_limit is not None else max(1, self._in_flight)
+            if throttled and error_rate >= self.error_rate_threshold and limit > 1:
+                if self.concurrency_limit is None:
+                    self._ceiling = limit
+                self.concurrency_limit = max(1, limit // 2)
+                self._successes_since_change = 0
+                logger.warning(f"[{self.name}] Error rate {error_rate:.0%}, concurrency limit lowered to {self.concurrency_limit}")
+            elif not throttled and self.concurrency_limit is not None:
+                self._successes_since_change += 1
+                ceiling = self.max_concurrency or self._ceiling
+                if self._successes_since_change >= self.concurrency_limit and self.concurrency_limit < ceiling:
+                    self.concurrency_limit += 1
+                    self._successes_since_change = 0
+                    if self.max_concurrency is None and self.concurrency_limit >= ceiling:
+                        self.concurrency_limit = None
+                        logger.info(f"[{self.name}] Concurrency limit lifted")
+                    else:
+                        logger.info(f"[{self.name}] Concurrency limit raised to {self.concurrency_limit}")
+            self._cond.notify_all()
+
+    def _enter(self, estimated_tokens: float) -> float:
+        started = time.monotonic()
+        with self._cond:
+            while self.concurrency_limit is not None and self._in_flight >= self.concurrency_limit:
+                self._cond.wait(0.5)
+                check_cancelled() # Queued calls of a cancelled run leave the queue
+            self._in_flight += 1
+        try:
+            if self.requests:
+                self.requests.acquire(1)
+            if self.tokens and estimated_tokens:
+                self.tokens.acquire(estimated_tokens)
+        except BaseException:
+            self._exit()
+            raise
+        waited = time.monotonic() - started
+        with self._cond:
+            self.queue_seconds_total += waited
+            self.queue_seconds_max = max(self.queue_seconds_max, waited)
+        return waited
+
+    def _exit(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def saturated(self) -> bool:
+        """True if a new call would have to queue (concurrency limit reached or no request budget left)."""
+        with self._cond:
+            if self.concurrency_limit is not None and self._in_flight >= self.concurrency_limit:
+                return True
+        return self.requests is not None and self.requests.available() < 1
+
+    @contextmanager
+    def slot(self, estimated_tokens: float = 0) -> Iterator[None]:
+        """
+        A single attempt under the limits, without retries: for callers that retry or fail
+        over on their own (e.g. the FLUX balancer, one slot per endpoint attempt).
+        """
+        waited = self._enter(estimated_tokens)
+        telemetry.UPSTREAM_QUEUE_SECONDS.observe(waited, upstream=self.name)
+        if waited > 0.05:
+            logger.info(f"[{self.name}] Call queued {waited:.2f}s by the rate limiter")
+        try:
+            with self._cond:
+                self.calls += 1
+            yield
+        except Exception as e:
+            if self.is_retryable(e):
+                self._record(throttled=True)
+                with self._cond:
+                    self.throttle_events += 1
+            raise
+        else:
+            self._record(throttled=False)
+        finally:
+            self._exit()
+
+    def call(self, fn: Callable[..., Any], *args, estimated_tokens: float = 0, **kwargs) -> Any:
+        """Runs `fn(*args, **kwargs)` under the limits, retrying throttled/transient failures."""
+        attempt = 0
+        while True:
+            try:
+                with self.slot(estimated_tokens):
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                if not self.is_retryable(e):
+                    raise
+                if attempt >= self.max_retries:
+                    with self._cond:
+                        self.failures += 1
+                    telemetry.UPSTREAM_FAILURES.inc(upstream=self.name)
+                    logger.error(f"[{self.name}] Giving up after {attempt + 1} attempts: {e}")
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                with self._cond:
+                    self.retries += 1
+                telemetry.UPSTREAM_RETRIES.inc(upstream=self.name)
+                telemetry.add_event("upstream.retry", upstream=self.name, attempt=attempt, delay=round(delay, 3),
+                                    error=str(e)[:200])
+                logger.warning(f"[{self.name}] Throttled/transient error ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            cancellable_sleep(delay)
+
+    def record_tokens(self, amount: float) -> None:
+        """Accounts tokens known only after the call (e.g. completion tokens) against the TPM budget."""
+        if self.tokens and amount:
+            self.tokens.debit(amount)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "upstream": self.name,
+                "calls": self.calls,
+                "in_flight": self._in_flight,
+                "concurrency_limit": self.concurrency_limit,
+                "max_concurrency": self.max_concurrency,
+                "throttle_events": self.throttle_events,
+                "retries": self.retries,
+                "failures": self.failures,
+                "queue_seconds_total": round(self.queue_seconds_total, 3),
+                "queue_seconds_max": round(self.queue_seconds_max, 3),
+                "queue_seconds_avg": round(self.queue_seconds_total / self.calls, 4) if self.calls else 0.0,
+            }
+
+
+# --- Process-wide registry ---
+_limiters: Dict[str, UpstreamLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid {name} in .env, ignoring it")
+        return None
+
+
+def get_limiter(name: str) -> UpstreamLimiter:
+    """
+    Returns the shared limiter for an upstream ('gemini', 'flux'), configured from env:
+    <NAME>_RPM, <NAME>_TPM, <NAME>_MAX_CONCURRENCY and <NAME>_MAX_RETRIES (e.g. GEMINI_RPM).
+    Quotas left unset are not enforced, but throttled calls are still retried with backoff
+    (<NAME>_MAX_RETRIES defaults to 4) and feed the adaptive concurrency limit.
+    <NAME>_RATE_LIMIT=off makes the limiter a pass-through: no retries, no adaptive limit.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            prefix = name.upper()
+            if os.getenv(f"{prefix}_RATE_LIMIT", "").strip().lower() in ("off", "false", "0", "no"):
+                logger.info(f"[{name}] Rate limiting disabled by {prefix}_RATE_LIMIT")
+                limiter = UpstreamLimiter(name, max_concurrency=None, max_retries=0, adaptive=False)
+                _limiters[name] = limiter
+                return limiter
+            settings = {key: _env_float(f"{prefix}_{key}") for key in ("RPM", "TPM", "MAX_CONCURRENCY", "MAX_RETRIES")}
+            max_concurrency, max_retries = settings["MAX_CONCURRENCY"], settings["MAX_RETRIES"]
+            limiter = UpstreamLimiter(
+                name,
+                rpm=settings["RPM"],
+                tpm=settings["TPM"],
+                max_concurrency=int(max_concurrency) if max_concurrency is not None else None,
+                max_retries=int(max_retries) if max_retries is not None else 4,
+            )
+            _limiters[name] = limiter
+        return limiter
+
+
+def all_limiter_metrics() -> Dict[str, Dict[str, Any]]:
+    with _limiters_lock:
+        return {name: limiter.metrics() for name, limiter in _limiters.items()}
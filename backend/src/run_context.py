@@ -0,0 +1,69 @@
+import contextvars
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# generation_id of the crew run the current code belongs to (tools use it to tag their outputs)
+_generation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("generation_id", default=None)
+
+
+@contextmanager
+def generation_context(generation_id: Optional[str]) -> Iterator[None]:
+    """
+    Marks the code run inside the block as part of `generation_id`. Context variables are not
+    inherited by pool threads: code that fans out must enter the context again in the worker
+    (or submit through `contextvars.copy_context().run`).
+    """
+    token = _generation_id.set(generation_id)
+    try:
+        yield
+    finally:
+        _generation_id.reset(token)
+
+
+def current_generation_id() -> Optional[str]:
+    return _generation_id.get()
+
+
+# Blueprint key of the crew task the current code runs for (e.g. 'format_post')
+_task_key: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("task_key", default=None)
+
+
+@contextmanager
+def task_context(task_key: Optional[str]) -> Iterator[None]:
+    token = _task_key.set(task_key)
+    try:
+        yield
+    finally:
+        _task_key.reset(token)
+
+
+def current_task_key() -> Optional[str]:
+    return _task_key.get()
+
+
+# Progress sink of the crew run: tools report intermediate results through it (e.g. image previews)
+_progress: contextvars.ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = \
+    contextvars.ContextVar("progress", default=None)
+
+
+@contextmanager
+def progress_context(callback: Optional[Callable[[Dict[str, Any]], None]]) -> Iterator[None]:
+    token = _progress.set(callback)
+    try:
+        yield
+    finally:
+        _progress.reset(token)
+
+
+def report_progress(progress_info: Dict[str, Any]) -> None:
+    """Sends a progress event to the run the current code belongs to; no-op outside runs."""
+    callback = _progress.get()
+    if callback is None:
+        return
+    try:
+        callback(progress_info)
+    except Exception as e:
+        logger.error(f"Error reporting progress ({progress_info.get('event')}): {e}")
@@ -0,0 +1,113 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+
+class DagScheduler:
+    """
+    Runs a list of nodes (crewAI tasks) respecting the dependencies declared by each
+    node, executing every node whose dependencies are satisfied in parallel on a
+    bounded thread pool.
+
+    Dependencies are read through `dependencies_of` (for crewAI tasks this is
+    `task.context`). Dependencies that are not part of `nodes` are considered already
+    satisfied, which allows scheduling a subset of a crew.
+    """
+
+    def __init__(self,
+                 nodes: Sequence[Any],
+                 dependencies_of: Callable[[Any], Optional[List[Any]]] = lambda task: task.context,
+                 max_workers: int = 2):
+        self.nodes = list(nodes)
+        self.max_workers = max(1, int(max_workers))
+        self.dependencies = self._build_dependencies(dependencies_of)
+
+    def _build_dependencies(self, dependencies_of: Callable[[Any], Optional[List[Any]]]) -> Dict[int, Set[int]]:
+        """Maps each node index to the indexes of the nodes it depends on."""
+        index_by_id = {id(node): i for i, node in enumerate(self.nodes)}
+        dependencies = {}
+        for i, node in enumerate(self.nodes):
+            deps = dependencies_of(node) or []
+            dependencies[i] = {index_by_id[id(dep)] for dep in deps if id(dep) in index_by_id}
+        self._check_acyclic(dependencies)
+        return dependencies
+
+    @staticmethod
+    def _check_acyclic(dependencies: Dict[int, Set[int]]) -> None:
+        """Raises ValueError if the dependency graph contains a cycle (Kahn's algorithm)."""
+        remaining = {i: set(deps) for i, deps in dependencies.items()}
+        ready = [i for i, deps in remaining.items() if not deps]
+        visited = 0
+        while ready:
+            current = ready.pop()
+            visited += 1
+            for i, deps in remaining.items():
+                if current in deps:
+                    deps.discard(current)
+                    if not deps:
+                        ready.append(i)
+        if visited != len(dependencies):
+            raise ValueError("Task dependencies contain a cycle; cannot build execution DAG.")
+
+    def levels(self) -> List[List[int]]:
+        """Returns node indexes grouped by dependency depth (useful for logging/debugging)."""
+        depth: Dict[int, int] = {}
+
+        def _depth(i: int) -> int:
+            if i not in depth:
+                depth[i] = 1 + max((_depth(d) for d in self.dependencies[i]), default=-1)
+            return depth[i]
+
+        grouped: Dict[int, List[int]] = {}
+        for i in range(len(self.nodes)):
+            grouped.setdefault(_depth(i), []).append(i)
+        return [grouped[level] for level in sorted(grouped)]
+
+    def run(self, execute: Callable[[Any], Any]) -> Dict[int, Any]:
+        """
+        Executes every node with `execute(node)`, starting each one as soon as all its
+        dependencies have finished. Returns a dict mapping node index to the value
+        returned by `execute`.
+
+        If a node raises, no new nodes are started; nodes already running are allowed
+        to finish and the first exception is re-raised.
+        """
+        results: Dict[int, Any] = {}
+        pending = {i: set(deps) for i, deps in self.dependencies.items()}
+        running = {}
+        first_error: Optional[BaseException] = None
+
+        logger.info(f"DAG scheduler starting {len(self.nodes)} tasks in levels {self.levels()} "
+                    f"with max_workers={self.max_workers}")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mininos-dag") as executor:
+            while pending or running:
+                if first_error is None:
+                    # Submit every node whose dependencies are all done, in declaration order
+                    ready = [i for i in sorted(pending) if not pending[i]]
+                    for i in ready:
+                        del pending[i]
+                        running[executor.submit(execute, self.nodes[i])] = i
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    try:
+                        value = future.result()
+                    except BaseException as e:
+                        logger.error(f"DAG task {i} failed: {e}")
+                        if first_error is None:
+                            first_error = e
+                        continue
+                    results[i] = value
+                    for deps in pending.values():
+                        deps.discard(i)
+
+        if first_error is not None:
+            raise first_error
+        return results
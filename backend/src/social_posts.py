@@ -0,0 +1,209 @@
+"""
+Parsing of the formatter task output: one post per social platform.
+
+The formatter is asked for a JSON object {"instagram": ..., "twitter": ..., "linkedin": ...},
+which LLMs tend to wrap in a code fence, precede with prose ("Final Answer: ...") or
+write with raw newlines inside strings. `SocialPostStream` scans the text incrementally
+and hands out each platform's post as soon as its value is complete, so it can be fed
+token deltas while the formatter is still generating; `parse_social_posts` runs the same
+scanner over a finished output. Posts are validated against `SocialPost`, and problems
+are reported per platform (`errors`) instead of failing the whole output.
+"""
+import json
+import logging
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+logger = logging.getLogger(__name__)
+
+SOCIAL_PLATFORMS = ("instagram", "twitter", "linkedin")
+PLATFORM_ALIASES = {"x": "twitter", "twitter/x": "twitter", "x/twitter": "twitter", "linked_in": "linkedin"}
+# Keys under which LLMs nest the post text when they answer with an object per platform
+TEXT_KEYS = ("text", "content", "post", "caption", "body", "message")
+
+
+def _normalize_platform(key: str) -> Optional[str]:
+    key = key.strip().lower()
+    key = PLATFORM_ALIASES.get(key, key)
+    return key if key in SOCIAL_PLATFORMS else None
+
+
+class SocialPost(BaseModel):
+    """Schema of one platform's post."""
+    platform: Literal["instagram", "twitter", "linkedin"]
+    text: str = Field(min_length=1)
+
+    @field_validator("text", mode="before")
+    @classmethod
+    def _coerce_text(cls, value: Any) -> Any:
+        # {"text": "...", "hashtags": [...]} and lists of paragraphs are accepted as text
+        if isinstance(value, dict):
+            text = next((value[k] for k in TEXT_KEYS if isinstance(value.get(k), str)), None)
+            if text is None:
+                return value
+            hashtags = value.get("hashtags")
+            if isinstance(hashtags, list) and hashtags:
+                text = f"{text}\n\n" + " ".join(f"#{str(tag).lstrip('#')}" for tag in hashtags)
+            value = text
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            value = "\n\n".join(value)
+        return value.strip() if isinstance(value, str) else value
+
+
+def _error(platform: Optional[str], error: str, detail: str = "") -> Dict[str, Any]:
+    return {"platform": platform, "error": error, "detail": detail[:300]}
+
+
+class SocialPostStream:
+    """
+    Incremental extractor of the platform posts in the formatter output.
+
+    `feed(chunk)` returns the posts whose value was completed by that chunk, as
+    (platform, SocialPost) pairs; each platform is returned once. Only the top level of
+    the first JSON object(s) in the text is tracked, so scanning is linear in the text.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = None  # 'key', 'colon', 'value', 'in_value', 'comma' (top level only)
+        self._token_start = 0
+        self._key: Optional[str] = None
+        self.posts: Dict[str, SocialPost] = {}
+        self.errors: List[Dict[str, Any]] = []
+        self.found_object = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, SocialPost]]:
+        self._text += chunk
+        completed: List[Tuple[str, SocialPost]] = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == "key":
+                        self._key = self._decode(text[self._token_start:i + 1])
+                        self._expect = "colon"
+                    elif self._depth == 1 and self._expect == "in_value":
+                        self._complete_value(self._token_start, i + 1, completed)
+                continue
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect in ("key", "value"):
+                    self._token_start = i
+                    if self._expect == "value":
+                        self._expect = "in_value"
+                continue
+            if self._depth == 0:
+                if c == "{":
+                    self._depth = 1
+                    self._expect = "key"
+                    self.found_object = True
+                continue
+            if c in "{[":
+                if self._depth == 1 and self._expect == "value":
+                    self._token_start = i
+                    self._expect = "in_value"
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 1 and self._expect == "in_value":  # Scalar value closed by '}'
+                    self._complete_value(self._token_start, i, completed)
+                self._depth -= 1
+                if self._depth == 1 and self._expect == "in_value":  # Object/array value closed
+                    self._complete_value(self._token_start, i + 1, completed)
+                elif self._depth == 0:
+                    self._expect = None
+            elif self._depth == 1:
+                if c == ":" and self._expect == "colon":
+                    self._expect = "value"
+                elif c == ",":
+                    if self._expect == "in_value":  # Scalar value closed by ','
+                        self._complete_value(self._token_start, i, completed)
+                    self._expect = "key"
+                elif self._expect == "value" and not c.isspace():
+                    self._token_start = i
+                    self._expect = "in_value"
+        self._pos = len(text)
+        return completed
+
+    @staticmethod
+    def _decode(raw: str) -> Any:
+        # strict=False accepts raw newlines/tabs inside strings, a frequent LLM slip
+        return json.loads(raw, strict=False)
+
+    def _complete_value(self, start: int, end: int, completed: List[Tuple[str, SocialPost]]) -> None:
+        self._expect = "comma"
+        key, self._key = self._key, None
+        if not isinstance(key, str):
+            return
+        raw = self._text[start:end].strip()
+        platform = _normalize_platform(key)
+        try:
+            value = self._decode(raw)
+        except json.JSONDecodeError as e:
+            if platform:
+                self.errors.append(_error(platform, "invalid_json", f"{e.msg}: {raw[:200]}"))
+            return
+        if platform is None:
+            # Posts nested one level down, e.g. {"social_media": {"instagram": ...}}
+            if isinstance(value, dict):
+                for nested_key, nested_value in value.items():
+                    nested_platform = _normalize_platform(str(nested_key))
+                    if nested_platform:
+                        self._accept(nested_platform, nested_value, completed)
+            return
+        self._accept(platform, value, completed)
+
+    def _accept(self, platform: str, value: Any, completed: List[Tuple[str, SocialPost]]) -> None:
+        if platform in self.posts:
+            return
+        try:
+            post = SocialPost(platform=platform, text=value)
+        except ValidationError as e:
+            self.errors.append(_error(platform, "invalid_post", e.errors()[0].get("msg", str(e))))
+            return
+        # A later valid value supersedes an earlier error for the same platform
+        self.errors = [error for error in self.errors if error["platform"] != platform]
+        self.posts[platform] = post
+        completed.append((platform, post))
+
+    def result(self) -> Dict[str, Any]:
+        """Posts found so far plus the structured errors (missing or invalid platforms)."""
+        errors = list(self.errors)
+        if not self.found_object:
+            errors.append(_error(None, "no_json_object", "The formatter output contains no JSON object"))
+        reported = {error["platform"] for error in errors}
+        for platform in SOCIAL_PLATFORMS:
+            if platform not in self.posts and platform not in reported:
+                errors.append(_error(platform, "missing", f"No '{platform}' post in the formatter output"))
+        result: Dict[str, Any] = {platform: post.text for platform, post in self.posts.items()}
+        if errors:
+            result["errors"] = errors
+        return result
+
+
+def parse_social_posts(output: str) -> Dict[str, Any]:
+    """
+    Parses a finished formatter output into {platform: post}. Problems are listed under
+    'errors'; if no post could be extracted the raw output is kept under 'raw_output' (and
+    'error', as callers of the previous parser expect).
+    """
+    stream = SocialPostStream()
+    stream.feed(output)
+    result = stream.result()
+    if not stream.posts:
+        logger.error(f"Could not extract any social post from the formatter output: '{output[:500]}...'")
+        result["error"] = "Failed to parse JSON"
+        result["raw_output"] = output
+    elif result.get("errors"):
+        logger.warning(f"Formatter output parsed with problems: {result['errors']}")
+    return result
@@ -0,0 +1,80 @@
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A sink receives stream events: {"stream_id", "task", "delta", "chars", "done"}
+StreamSink = Callable[[Dict], None]
+
+_local = threading.local()
+_stream_ids = itertools.count(1)
+
+
+@contextmanager
+def stream_sink(sink: Optional[StreamSink], task: Optional[str] = None) -> Iterator[None]:
+    """
+    Routes token deltas of every LLM call made by the current thread to `sink` while the
+    block runs. The LLM may be shared between runs/threads, so the sink is thread-local.
+    `task` labels the events; when None the sink is expected to know the current task.
+    """
+    previous = getattr(_local, "sink", None)
+    _local.sink = (sink, task) if sink else None
+    try:
+        yield
+    finally:
+        _local.sink = previous
+
+
+def current_stream_sink() -> Optional[Tuple[StreamSink, Optional[str]]]:
+    """Returns (sink, task) installed for this thread, or None if streaming is off."""
+    return getattr(_local, "sink", None)
+
+
+def next_stream_id() -> int:
+    return next(_stream_ids)
+
+
+class DeltaCoalescer:
+    """
+    Buffers token deltas and forwards them in batches: at most once every `min_interval`
+    seconds, or earlier when `max_chars` are pending, plus a final flush on close().
+    Keeps progress callbacks from being called once per token.
+    """
+
+    def __init__(self, emit: Callable[[str, int, bool], None], min_interval: float = 0.25, max_chars: int = 400):
+        self.emit = emit
+        self.min_interval = min_interval
+        self.max_chars = max_chars
+        self._buffer = []
+        self._pending = 0
+        self._chars = 0
+        self._last_flush = time.monotonic()
+
+    def push(self, delta: str) -> None:
+        if not delta:
+            return
+        self._buffer.append(delta)
+        self._pending += len(delta)
+        self._chars += len(delta)
+        if self._pending >= self.max_chars or time.monotonic() - self._last_flush >= self.min_interval:
+            self._flush(done=False)
+
+    def _flush(self, done: bool) -> None:
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        if not text and not done:
+            return
+        try:
+            self.emit(text, self._chars, done)
+        except Exception as e:
+            # A failing UI callback must never break the LLM call
+            logger.error(f"Error in stream callback: {e}")
+
+    def close(self) -> None:
+        self._flush(done=True)
@@ -0,0 +1,415 @@
+"""
+Instrumentation of the hot paths: crew runs, tasks, LLM calls and FLUX image generation.
+
+- Traces: one OpenTelemetry span per crew run, task, LLM call and `predict` call. The spans
+  come from a tracer provider owned by the backend: crewAI points the *global* provider at
+  its own telemetry endpoint, so it is never used here. Spans are exported over OTLP/HTTP
+  when OTEL_EXPORTER_OTLP_ENDPOINT (or OTEL_EXPORTER_OTLP_TRACES_ENDPOINT) is set, or
+  printed with OTEL_TRACES_EXPORTER=console; otherwise the tracer is a no-op.
+- Metrics: process-wide counters and histograms kept in memory and rendered in the
+  Prometheus text format (GET /metrics in src.api), so no extra dependency is needed.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from opentelemetry import context as otel_context
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+
+from src.run_context import current_generation_id
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "mewai-backend")
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; tuned for operations between a fast LLM call and a slow image generation
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+RUN_BUCKETS = (5.0, 10.0, 20.0, 30.0, 60.0, 90.0, 120.0, 180.0, 300.0, 600.0, 900.0)
+QUEUE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together by `render()`."""
+
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[MetricsRegistry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        unknown = set(labels) - set(self.labelnames)
+        if unknown:
+            raise ValueError(f"Unknown labels for {self.name}: {sorted(unknown)}")
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels_text(self, key: Tuple[str, ...], extra: Sequence[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels_text(key)} {_format_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional[MetricsRegistry] = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != float("inf")))
+        # Per label set: observations per bucket (the last one is +Inf), sum and count
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return int(series[-1]) if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, observations in zip((*self.buckets, float("inf")), series):
+                cumulative += observations
+                le = (("le", _format_number(bound)),)
+                lines.append(f"{self.name}_bucket{self._labels_text(key, le)} {_format_number(cumulative)}")
+            lines.append(f"{self.name}_sum{self._labels_text(key)} {_format_number(series[-2])}")
+            lines.append(f"{self.name}_count{self._labels_text(key)} {_format_number(series[-1])}")
+        return lines
+
+
+# --- Metrics of the backend ---
+CREW_RUNS = Counter("mewai_crew_runs_total", "Crew runs by execution mode and outcome", ("mode", "status"))
+CREW_RUN_SECONDS = Histogram("mewai_crew_run_duration_seconds", "End-to-end crew run latency", ("mode",),
+                             buckets=RUN_BUCKETS)
+CREW_RUNS_IN_PROGRESS = Gauge("mewai_crew_runs_in_progress", "Crew runs currently executing")
+TASKS = Counter("mewai_task_runs_total", "Crew task executions by outcome", ("task", "agent", "status"))
+TASK_SECONDS = Histogram("mewai_task_duration_seconds", "Crew task latency", ("task", "agent"))
+LLM_REQUESTS = Counter("mewai_llm_requests_total", "LLM calls by outcome (ok, error, cache_hit)",
+                       ("model", "agent", "status"))
+LLM_SECONDS = Histogram("mewai_llm_request_duration_seconds",
+                        "LLM call latency, including rate-limiter queueing and retries", ("model", "agent"))
+LLM_FAILOVERS = Counter("mewai_llm_failovers_total",
+                        "LLM calls moved off a model because it failed or was degraded (see src.model_router)",
+                        ("model", "reason"))
+LLM_TOKENS = Counter("mewai_llm_tokens_total",
+                     "LLM tokens by kind (prompt, completion); estimated when the provider reports no usage",
+                     ("model", "agent", "kind"))
+CONTEXT_TOKENS = Counter("mewai_context_tokens_total",
+                         "Estimated context tokens handed to tasks, before and after their context budget",
+                         ("task", "stage"))
+IMAGE_STAGE_SECONDS = Histogram("mewai_image_stage_duration_seconds",
+                                "Image generation latency per stage (predict, download, store, derive)", ("stage",))
+FLUX_ENDPOINT_REQUESTS = Counter("mewai_flux_endpoint_requests_total",
+                                 "FLUX requests per endpoint by outcome (ok, error, cancelled)", ("endpoint", "status"))
+FLUX_ENDPOINT_SECONDS = Histogram("mewai_flux_endpoint_duration_seconds",
+                                  "Latency of successful FLUX requests per endpoint", ("endpoint",))
+FLUX_HEDGES = Counter("mewai_flux_hedges_total",
+                      "Hedged FLUX requests: duplicates fired, and whether the duplicate won or lost", ("result",))
+FLUX_CIRCUIT_OPENS = Counter("mewai_flux_circuit_opens_total", "Times a FLUX endpoint circuit opened",
+                             ("endpoint",))
+IMAGES = Counter("mewai_images_total", "Image generations by result (generated, preview, cache_hit, error)", ("result",))
+LOG_RECORDS_DROPPED = Counter("mewai_log_records_dropped_total",
+                              "Log records discarded by sampling or a full logging queue", ("reason",))
+TOOL_ERRORS = Counter("mewai_tool_errors_total", "Errors returned by tools to the agents", ("tool", "error"))
+ABANDONED_CALLS = Gauge("mewai_abandoned_calls_in_progress",
+                        "Cancelled/timed-out blocking calls still running until their own timeout")
+UPSTREAM_QUEUE_SECONDS = Histogram("mewai_upstream_queue_seconds", "Time calls wait in the upstream rate limiter",
+                                   ("upstream",), buckets=QUEUE_BUCKETS)
+UPSTREAM_RETRIES = Counter("mewai_upstream_retries_total", "Retries of throttled/transient upstream errors",
+                           ("upstream",))
+UPSTREAM_FAILURES = Counter("mewai_upstream_failures_total", "Upstream calls that failed after the last retry",
+                            ("upstream",))
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+# --- Tracing ---
+_tracer: Optional[trace.Tracer] = None
+_tracer_provider = None
+_tracer_lock = threading.Lock()
+
+
+def _build_tracer() -> trace.Tracer:
+    global _tracer_provider
+    exporter_name = os.getenv("OTEL_TRACES_EXPORTER", "otlp").lower()
+    endpoint = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    if os.getenv("OTEL_SDK_DISABLED", "false").lower() == "true" or exporter_name == "none":
+        return trace.NoOpTracer()
+    if exporter_name != "console" and not endpoint:
+        return trace.NoOpTracer()
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        if exporter_name == "console":
+            exporter = ConsoleSpanExporter()
+        else:
+            # Endpoint, headers and timeout come from the standard OTEL_EXPORTER_OTLP_* variables
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+    except ImportError as e:
+        logger.warning(f"OpenTelemetry SDK/exporter not available, tracing disabled: {e}")
+        return trace.NoOpTracer()
+
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer_provider = provider
+    logger.info(f"Tracing enabled for '{SERVICE_NAME}' (exporter: {exporter_name}, endpoint: {endpoint or '-'})")
+    return provider.get_tracer("mewai")
+
+
+def get_tracer() -> trace.Tracer:
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = _build_tracer()
+    return _tracer
+
+
+def tracer_provider():
+    """The backend's TracerProvider, or None if tracing is disabled (e.g. for FastAPIInstrumentor)."""
+    get_tracer()
+    return _tracer_provider
+
+
+def shutdown() -> None:
+    """Flushes pending spans."""
+    if _tracer_provider is not None:
+        _tracer_provider.shutdown()
+
+
+def current_trace_context() -> otel_context.Context:
+    return otel_context.get_current()
+
+
+@contextmanager
+def trace_context(parent: Optional[otel_context.Context]) -> Iterator[None]:
+    """Makes spans started inside the block children of `parent` (used by code running in pool threads)."""
+    if parent is None:
+        yield
+        return
+    token = otel_context.attach(parent)
+    try:
+        yield
+    finally:
+        otel_context.detach(token)
+
+
+# Low-cardinality labels (task, agent) of the crew task the current code runs for
+_labels: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("telemetry_labels", default={})
+
+
+def current_label(name: str, default: str = "none") -> str:
+    return _labels.get().get(name, default)
+
+
+@contextmanager
+def labels(**values: str) -> Iterator[None]:
+    token = _labels.set({**_labels.get(), **values})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+class Scope:
+    """Span and outcome of an operation timed by `observe`."""
+
+    def __init__(self, span: trace.Span):
+        self.span = span
+        self.status = "ok"
+
+    def set(self, **attributes: Any) -> None:
+        for name, value in attributes.items():
+            if value is not None:
+                self.span.set_attribute(f"mewai.{name}", value)
+
+    def fail(self, error: Any) -> None:
+        self.status = "error"
+        if isinstance(error, BaseException):
+            self.span.record_exception(error)
+        self.span.set_status(Status(StatusCode.ERROR, str(error)[:200]))
+
+
+@contextmanager
+def observe(name: str, duration: Optional[Histogram] = None, count: Optional[Counter] = None,
+            attributes: Optional[Dict[str, Any]] = None, **metric_labels: str) -> Iterator[Scope]:
+    """
+    Runs the block inside a span named `name` and, when it ends, records its latency in
+    `duration` and its outcome (label status='ok'/'error', or the Scope's status) in `count`.
+    `metric_labels` label both metrics and become span attributes (prefixed 'mewai.').
+    """
+    span_attributes = {f"mewai.{k}": v for k, v in {**metric_labels, **(attributes or {})}.items() if v is not None}
+    started = time.perf_counter()
+    with get_tracer().start_as_current_span(name, attributes=span_attributes, record_exception=False,
+                                            set_status_on_exception=False) as span:
+        scope = Scope(span)
+        try:
+            yield scope
+        except BaseException as e:
+            scope.fail(e)
+            raise
+        finally:
+            if duration is not None:
+                duration.observe(time.perf_counter() - started, **metric_labels)
+            if count is not None:
+                count.inc(status=scope.status, **metric_labels)
+
+
+def add_event(name: str, **attributes: Any) -> None:
+    """Adds an event (e.g. a retry) to the current span, if any."""
+    trace.get_current_span().add_event(name, {k: v for k, v in attributes.items() if v is not None})
+
+
+# Token usage per agent of the generations being tracked (see track_usage)
+_generation_usage: Dict[str, Dict[str, Dict[str, int]]] = {}
+_generation_usage_lock = threading.Lock()
+
+
+@contextmanager
+def track_usage(generation_id: Optional[str]) -> Iterator[Dict[str, Dict[str, int]]]:
+    """
+    Collects the LLM tokens spent for `generation_id` while the block runs, as
+    {agent: {"prompt": n, "completion": n}} (filled in by record_llm_tokens from any thread).
+    """
+    usage: Dict[str, Dict[str, int]] = {}
+    if generation_id is None:
+        yield usage
+        return
+    with _generation_usage_lock:
+        _generation_usage[generation_id] = usage
+    try:
+        yield usage
+    finally:
+        with _generation_usage_lock:
+            _generation_usage.pop(generation_id, None)
+
+
+def summarize_usage(usage: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+    with _generation_usage_lock:
+        by_agent = {agent: dict(counts) for agent, counts in usage.items()}
+    return {
+        "prompt_tokens": sum(counts["prompt"] for counts in by_agent.values()),
+        "completion_tokens": sum(counts["completion"] for counts in by_agent.values()),
+        "by_agent": by_agent,
+    }
+
+
+def record_llm_tokens(model: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False) -> None:
+    """Counts the tokens of an LLM call for the agent running it and tags the current (LLM) span."""
+    agent = current_label("agent")
+    LLM_TOKENS.inc(prompt_tokens, model=model, agent=agent, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, model=model, agent=agent, kind="completion")
+    with _generation_usage_lock:
+        usage = _generation_usage.get(current_generation_id())
+        if usage is not None:
+            counts = usage.setdefault(agent, {"prompt": 0, "completion": 0})
+            counts["prompt"] += prompt_tokens
+            counts["completion"] += completion_tokens
+    span = trace.get_current_span()
+    span.set_attribute("gen_ai.usage.input_tokens", prompt_tokens)
+    span.set_attribute("gen_ai.usage.output_tokens", completion_tokens)
+    span.set_attribute("mewai.tokens_estimated", estimated)
@@ -1,18 +1,31 @@
 # backend/src/tools/FluxImageGeneratorTool.py
 
-from gradio_client import Client, utils as gradio_utils # Import utils para manejo de paths si es necesario
-from typing import Optional, Tuple, Dict, List
+from gradio_client import utils as gradio_utils # Import utils para manejo de paths si es necesario
+from typing import Any, Optional, Tuple, Dict, List, Union
 from enum import Enum
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import contextvars
 import os
+import re
+import json
 import pathlib
-import datetime
-import shutil
+import sqlite3
+import threading
+import uuid
 import logging # Usar logging es mejor que print para libs
-import traceback # Para logs de error detallados
 
 from crewai.tools import BaseTool
 from pydantic import ConfigDict, Field # Field podría ser útil si añades más config
 
+from src.tools.image_cache import ImageCache
+from src.tools.image_store import ImageStore, store_from_env
+from src.tools.gradio_pool import GradioClientPool, GradioPoolError
+from src.tools.flux_balancer import FluxEndpointBalancer, get_flux_backend
+from src.tools.image_derivatives import DerivativePipeline, DIMENSION_MULTIPLE, ENCODINGS, master_dimensions
+from src.ratelimit import UpstreamLimiter, get_limiter
+from src.run_context import current_generation_id, report_progress
+from src import cancellation, telemetry
+
 # Configurar un logger específico para esta herramienta
 logger = logging.getLogger(__name__)
 
@@ -61,11 +74,22 @@ class FluxImageGeneratorTool(BaseTool):
     - 'seed': (Opcional) Semilla específica para reproducibilidad. Por defecto: aleatoria.
     - 'randomize': (Opcional) 'true' o 'false' para aleatorizar semilla. Por defecto: 'true'.
     - 'width', 'height': (Opcional, solo para formato 'custom') Dimensiones exactas.
+    - 'formats': (Opcional) Lista de formatos a derivar de UNA sola generación (ej: 'instagram_square, twitter_post, linkedin_banner').
+      Se genera una imagen master y cada formato se obtiene localmente por recorte y redimensionado.
+    - 'encoding': (Opcional, con 'formats') 'webp' o 'jpeg' para los derivados. Por defecto: 'webp'.
+    - 'progressive': (Opcional) 'true' para devolver al momento una vista previa rápida; la imagen
+      final sustituye a la vista previa en la MISMA URL cuando termina. Por defecto: env IMAGE_PROGRESSIVE.
 
     Ejemplo: "prompt: Un gato futurista programando en un teclado holográfico, format: hd, steps: 8"
     Ejemplo: "prompt: Logo minimalista para una empresa IA, format: custom, width: 512, height: 512"
+    Ejemplo: "prompt: Un gato astronauta, formats: instagram_square, twitter_post, linkedin_post"
+
+    Para generar VARIAS imágenes en una sola llamada (se generan en paralelo), separa cada
+    especificación con ';' o un salto de línea; cada una debe empezar por 'prompt:'.
+    Ejemplo: "prompt: Un gato leyendo, format: hd; prompt: Un gato en la playa, format: instagram_square"
 
     Retorna una cadena con la ruta URL relativa de la imagen guardada y detalles de generación, o un mensaje de error.
+    Con varias especificaciones retorna un resumen y una lista JSON con el resultado de cada imagen.
     """
 
     # Presets de dimensiones para cada formato
@@ -89,13 +113,36 @@ class FluxImageGeneratorTool(BaseTool):
     save_dir: pathlib.Path = Field(default=DEFAULT_SAVE_DIR)
     default_format: ImageFormat = Field(default=ImageFormat.SQUARE)
     default_steps: int = Field(default=4)
-    # El cliente se inicializa en __init__
-    client: Optional[Client] = Field(default=None, exclude=True) # Excluir de la validación/serialización Pydantic si es posible
+    # Pool de clientes Gradio (o balanceador entre varios endpoints) compartido por el proceso;
+    # las conexiones se abren en el primer _run
+    client_pool: Optional[Union[GradioClientPool, FluxEndpointBalancer]] = Field(default=None, exclude=True) # Excluir de la validación/serialización Pydantic si es posible
+    # Almacén de imágenes por hash de contenido con índice y cuotas (ver image_store)
+    image_store: Optional[ImageStore] = Field(default=None, exclude=True)
+    # Caché de generaciones deterministas (randomize=false); None si está desactivada
+    image_cache: Optional[ImageCache] = Field(default=None, exclude=True)
+    # Limitador compartido por el proceso para las llamadas a FLUX (FLUX_RPM, FLUX_MAX_CONCURRENCY...)
+    rate_limiter: Optional[UpstreamLimiter] = Field(default=None, exclude=True)
+    # Pipeline local de derivados (recorte/redimensionado de un master a varios formatos)
+    derivative_pipeline: Optional[DerivativePipeline] = Field(default=None, exclude=True)
+    # Modo progresivo: vista previa barata (pocos pasos, menor tamaño) devuelta al momento y
+    # render final en segundo plano que sustituye el archivo de la vista previa
+    progressive: bool = Field(default=False)
+    preview_steps: int = Field(default=1)
+    preview_scale: float = Field(default=0.5)
+    refine_executor: Optional[ThreadPoolExecutor] = Field(default=None, exclude=True)
+    # Renders finales en curso por generation_id (ver wait_for_refinements)
+    pending_refinements: Dict[Optional[str], List[Future]] = Field(default_factory=dict, exclude=True)
+    refinements_lock: Any = Field(default_factory=threading.Lock, exclude=True)
 
     def __init__(self,
                  save_dir: Optional[str] = None,
                  default_format: Optional[ImageFormat] = None,
                  default_steps: Optional[int] = None,
+                 use_cache: Optional[bool] = None,
+                 image_store: Optional[ImageStore] = None,
+                 client_pool: Optional[Union[GradioClientPool, FluxEndpointBalancer]] = None,
+                 rate_limiter: Optional[UpstreamLimiter] = None,
+                 progressive: Optional[bool] = None,
                  **kwargs):
         """
         Inicializa la herramienta FluxImageGenerator.
@@ -104,6 +151,16 @@ class FluxImageGeneratorTool(BaseTool):
             save_dir: Directorio para guardar las imágenes generadas.
             default_format: Formato de imagen por defecto.
             default_steps: Número de pasos de inferencia por defecto.
+            use_cache: Activa la caché de imágenes deterministas. Por defecto: env IMAGE_CACHE (on).
+            image_store: Almacén de imágenes. Por defecto uno sobre `save_dir` con las cuotas de
+                IMAGE_STORE_MAX_BYTES / IMAGE_STORE_MAX_AGE_DAYS (ver `store_from_env`).
+            client_pool: Pool de clientes Gradio o balanceador de endpoints. Por defecto: el del
+                proceso para FLUX_GRADIO_SRC (ver `get_flux_backend`).
+            rate_limiter: Limitador de peticiones a FLUX. Por defecto: el limitador 'flux'
+                compartido del proceso (ver `src.ratelimit.get_limiter`).
+            progressive: Devuelve primero una vista previa (IMAGE_PREVIEW_STEPS pasos, tamaño
+                escalado por IMAGE_PREVIEW_SCALE) y refina en segundo plano. Por defecto: env
+                IMAGE_PROGRESSIVE (off). Cada llamada puede cambiarlo con 'progressive: true/false'.
             **kwargs: Argumentos adicionales para BaseTool.
         """
         # Usar valores pasados o los defaults de la clase
@@ -122,14 +179,28 @@ class FluxImageGeneratorTool(BaseTool):
         self.default_format = resolved_default_format
         self.default_steps = resolved_default_steps
 
-        # Inicializar el cliente Gradio
+        # Pool de clientes Gradio: no abre conexiones aquí, solo en el primer _run
+        # (HF_TOKEN se pasa al cliente si el Space es privado)
+        self.client_pool = client_pool or get_flux_backend()
+        self.rate_limiter = rate_limiter or get_limiter("flux")
+
+        # Pipeline de derivados: los procesos del pool se crean en el primer uso
+        encoding = os.getenv('IMAGE_DERIVATIVE_ENCODING', 'webp').lower()
+        if encoding not in ENCODINGS:
+            logger.warning(f"Invalid IMAGE_DERIVATIVE_ENCODING '{encoding}', using webp")
+            encoding = 'webp'
+        self.derivative_pipeline = DerivativePipeline(self.save_dir, encoding=encoding)
+
+        # Modo progresivo
+        if progressive is None:
+            progressive = os.getenv('IMAGE_PROGRESSIVE', 'off').lower() in ('on', 'true', '1', 'yes')
+        self.progressive = progressive
         try:
-            # Aquí podrías necesitar pasar credenciales (hf_token) si el Space es privado
-            self.client = Client(src="black-forest-labs/FLUX.1-schnell")
-            logger.info("Gradio client for FLUX.1-schnell initialized successfully.")
-        except Exception as e:
-            logger.error(f"Error initializing Gradio client: {e}. Image generation will fail.", exc_info=True)
-            self.client = None # Asegurar que sea None si falla
+            self.preview_steps = max(1, int(os.getenv('IMAGE_PREVIEW_STEPS', 1)))
+            self.preview_scale = min(1.0, max(0.1, float(os.getenv('IMAGE_PREVIEW_SCALE', 0.5))))
+        except ValueError:
+            logger.warning("Invalid IMAGE_PREVIEW_STEPS/IMAGE_PREVIEW_SCALE in .env, using 1 step at half size")
+            self.preview_steps, self.preview_scale = 1, 0.5
 
         # Crear directorio de guardado
         try:
@@ -138,6 +209,20 @@ class FluxImageGeneratorTool(BaseTool):
         except OSError as e:
             logger.error(f"Error creating save directory {self.save_dir}: {e}")
 
+        # Almacén de imágenes: todas las salidas pasan por él (nombres por hash, cuotas de disco)
+        self.image_store = image_store or store_from_env(self.save_dir)
+
+        # Inicializar la caché de imágenes deterministas (un índice sobre el almacén)
+        if use_cache is None:
+            use_cache = os.getenv('IMAGE_CACHE', 'on').lower() not in ('off', 'false', '0', 'no')
+        if use_cache:
+            try:
+                self.image_cache = ImageCache(self.image_store)
+                logger.info(f"Image cache enabled (store quota: {self.image_store.max_bytes} bytes).")
+            except sqlite3.Error as e:
+                logger.error(f"Error initializing image cache, continuing without it: {e}")
+                self.image_cache = None
+
     def _process_args(self, arguments: str) -> dict:
         """Procesa la cadena de argumentos en un diccionario de parámetros."""
         args_dict = {
@@ -146,7 +231,10 @@ class FluxImageGeneratorTool(BaseTool):
             'randomize_seed': True,
             'seed': 0,
             'width': None, # Para formato custom
-            'height': None # Para formato custom
+            'height': None, # Para formato custom
+            'formats': [], # Formatos a derivar localmente de un único master
+            'encoding': None, # Codificación de los derivados (webp/jpeg)
+            'progressive': None # Vista previa + render final en segundo plano (None: lo que diga la herramienta)
         }
         try:
             # Separar por coma, respetando posibles comas dentro de un prompt (simplificado)
@@ -159,16 +247,7 @@ class FluxImageGeneratorTool(BaseTool):
                 if ':' in part: # Potencialmente un nuevo par clave:valor
                     # Procesar el par anterior si existe
                     if key and value_buffer:
-                        value = ','.join(value_buffer).strip()
-                        if key == 'prompt': args_dict['prompt'] = value.strip('"\' ') # Limpiar comillas
-                        elif key == 'format':
-                            try: args_dict['format'] = ImageFormat(value.lower())
-                            except ValueError: logger.warning(f"Invalid format '{value}', using default {self.default_format.value}.")
-                        elif key == 'steps': args_dict['num_inference_steps'] = int(value)
-                        elif key == 'seed': args_dict['seed'] = int(value)
-                        elif key == 'randomize': args_dict['randomize_seed'] = value.lower() == 'true'
-                        elif key == 'width': args_dict['width'] = int(value)
-                        elif key == 'height': args_dict['height'] = int(value)
+                        self._apply_arg(args_dict, key, ','.join(value_buffer).strip())
 
                     # Empezar nuevo par
                     try:
@@ -185,21 +264,14 @@ class FluxImageGeneratorTool(BaseTool):
 
             # Procesar el último par clave:valor
             if key and value_buffer:
-                value = ','.join(value_buffer).strip()
-                if key == 'prompt': args_dict['prompt'] = value.strip('"\' ') # Limpiar comillas
-                elif key == 'format':
-                    try: args_dict['format'] = ImageFormat(value.lower())
-                    except ValueError: logger.warning(f"Invalid format '{value}', using default {self.default_format.value}.")
-                elif key == 'steps': args_dict['num_inference_steps'] = int(value)
-                elif key == 'seed': args_dict['seed'] = int(value)
-                elif key == 'randomize': args_dict['randomize_seed'] = value.lower() == 'true'
-                elif key == 'width': args_dict['width'] = int(value)
-                elif key == 'height': args_dict['height'] = int(value)
-
+                self._apply_arg(args_dict, key, ','.join(value_buffer).strip())
 
             if 'prompt' not in args_dict or not args_dict['prompt']:
                  raise ValueError("Missing required argument: 'prompt'")
 
+            if args_dict['encoding'] and args_dict['encoding'] not in ENCODINGS:
+                raise ValueError(f"Invalid encoding '{args_dict['encoding']}'. Use one of: {', '.join(ENCODINGS)}")
+
             # Validar dimensiones para formato custom
             if args_dict['format'] == ImageFormat.CUSTOM:
                 if args_dict['width'] is None or args_dict['height'] is None:
@@ -213,110 +285,437 @@ class FluxImageGeneratorTool(BaseTool):
 
         return args_dict
 
-    def _generate_filename(self, prompt: str, image_format: ImageFormat) -> str:
-        """Genera un nombre de archivo único basado en el prompt y formato."""
-        # Limpiar prompt para nombre de archivo
-        clean_prompt = "".join(c if c.isalnum() else '_' for c in prompt[:30]).rstrip('_')
-        if not clean_prompt: clean_prompt = "image" # Fallback si el prompt es muy raro
-        # Añadir timestamp y random hex para unicidad
-        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-        random_hex = os.urandom(3).hex()
-        return f"{clean_prompt}_{image_format.value}_{timestamp}_{random_hex}.webp"
-
-    def _run(self, arguments: str) -> str:
+    def _apply_arg(self, args_dict: dict, key: str, value: str) -> None:
+        """Guarda en `args_dict` el valor de un par clave:valor (las claves desconocidas se ignoran)."""
+        if key == 'prompt': args_dict['prompt'] = value.strip('"\' ') # Limpiar comillas
+        elif key == 'format':
+            try: args_dict['format'] = ImageFormat(value.lower())
+            except ValueError: logger.warning(f"Invalid format '{value}', using default {self.default_format.value}.")
+        elif key == 'steps': args_dict['num_inference_steps'] = int(value)
+        elif key == 'seed': args_dict['seed'] = int(value)
+        elif key == 'randomize': args_dict['randomize_seed'] = value.lower() == 'true'
+        elif key == 'width': args_dict['width'] = int(value)
+        elif key == 'height': args_dict['height'] = int(value)
+        elif key == 'formats': args_dict['formats'] = self._parse_formats(value)
+        elif key == 'encoding': args_dict['encoding'] = value.lower()
+        elif key == 'progressive': args_dict['progressive'] = value.lower() == 'true'
+
+    @staticmethod
+    def _parse_formats(value: str) -> List[ImageFormat]:
+        """Convierte 'instagram_square, twitter_post' (o separados por '|') en la lista de formatos preestablecidos."""
+        formats = []
+        for name in re.split(r'[,|]', value):
+            name = name.strip().strip('"\' ').lower()
+            if not name:
+                continue
+            try:
+                image_format = ImageFormat(name)
+            except ValueError:
+                logger.warning(f"Invalid derivative format '{name}', skipping it.")
+                continue
+            if image_format == ImageFormat.CUSTOM:
+                logger.warning("'custom' cannot be derived from a master image, skipping it.")
+                continue
+            if image_format not in formats:
+                formats.append(image_format)
+        return formats
+
+    def _success_message(self, result: Dict[str, Any]) -> str:
+        """Construye el mensaje de éxito con la RUTA URL RELATIVA para el frontend."""
+        success_message = (
+            f"Image generated successfully.\n"
+            f"URL Path: {result['url']}\n"
+            f"Format: {result['format']}\n"
+            f"Dimensions: {result['width']}x{result['height']}\n"
+            f"Seed used: {result['seed']}"
+        )
+        if result.get('cached'):
+            success_message += "\nCache: hit"
+        if result.get('preview'):
+            success_message += "\nStatus: preview (the full-quality render replaces it at the same URL)"
+        for derivative in result.get('derivatives', []):
+            success_message += (f"\nDerivative {derivative['preset']}: {derivative['url']} "
+                                f"({derivative['width']}x{derivative['height']})")
+        logger.info(success_message.replace('\n', ' | ')) # Log en una línea
+        return success_message
+
+    def _error_message(self, error: Exception) -> str:
+        """Traduce una excepción de generación al mensaje de error que ve el agente."""
+        telemetry.TOOL_ERRORS.inc(tool="flux_image_generator", error=type(error).__name__)
+        telemetry.IMAGES.inc(result="error")
+        if isinstance(error, ValueError): # Errores de procesamiento de argumentos
+            logger.error(f"Argument processing error: {error}")
+            return f"Error en los argumentos: {error}"
+        if isinstance(error, GradioPoolError):
+            logger.error(f"Gradio client unavailable: {error}")
+            return f"Error: El cliente Gradio no está disponible: {error}"
+        if isinstance(error, FileNotFoundError):
+            logger.error(f"File handling error: {error}", exc_info=error)
+            return f"Error de archivo: {error}"
+        logger.error(f"Unexpected error during image generation: {error}", exc_info=error)
+        return f"Error inesperado al generar imagen: {str(error)}"
+
+    def _generate_image(self, arguments: str) -> Dict[str, Any]:
         """
-        Ejecuta la generación de imagen.
-        Este es el método principal llamado por CrewAI.
+        Genera una imagen a partir de una especificación 'prompt: ..., format: ...'.
+        Devuelve un dict con url, filename, format, width, height, seed y cached.
+        Lanza excepción si algo falla.
         """
-        if not self.client:
-            logger.error("Gradio client not initialized. Cannot generate image.")
-            return "Error: El cliente Gradio no está inicializado."
-        try:
-            # 1. Procesar argumentos
-            args = self._process_args(arguments)
-            logger.info(f"Processing image generation with args: {args}")
-            image_format = args.get('format') # Ya tiene default desde _process_args
+        # 1. Procesar argumentos
+        args = self._process_args(arguments)
+        logger.info(f"Processing image generation with args: {args}")
+        image_format = args.get('format') # Ya tiene default desde _process_args
+
+        # 2. Determinar dimensiones
+        if image_format == ImageFormat.CUSTOM:
+            dimensions = {'width': args['width'], 'height': args['height']}
+        elif image_format in self.FORMAT_PRESETS:
+            dimensions = self.FORMAT_PRESETS[image_format]
+        else:
+            logger.warning(f"Format {image_format} not in presets, falling back to default.")
+            dimensions = self.FORMAT_PRESETS[self.default_format]
+            image_format = self.default_format # Corregir formato si hubo fallback
+
+        # Con 'formats' se genera un único master que cubre todos los formatos pedidos
+        derivative_presets = {fmt.value: (self.FORMAT_PRESETS[fmt]['width'], self.FORMAT_PRESETS[fmt]['height'])
+                              for fmt in args.get('formats') or []}
+        if derivative_presets:
+            master_width, master_height = master_dimensions(derivative_presets.values())
+            dimensions = {'width': master_width, 'height': master_height}
+
+        # 3. Preparar parámetros para Gradio Client
+        generation_params = {
+            'prompt': args.get('prompt'),
+            'width': dimensions['width'],
+            'height': dimensions['height'],
+            'num_inference_steps': args.get('num_inference_steps'),
+            'seed': args.get('seed'),
+            'randomize_seed': args.get('randomize_seed'),
+            'api_name': "/infer" # Endpoint específico del Space Gradio
+        }
 
-            # 2. Determinar dimensiones
-            if image_format == ImageFormat.CUSTOM:
-                dimensions = {'width': args['width'], 'height': args['height']}
-            elif image_format in self.FORMAT_PRESETS:
-                dimensions = self.FORMAT_PRESETS[image_format]
-            else:
-                logger.warning(f"Format {image_format} not in presets, falling back to default.")
-                dimensions = self.FORMAT_PRESETS[self.default_format]
-                image_format = self.default_format # Corregir formato si hubo fallback
+        format_label = 'master' if derivative_presets else image_format.value
 
-            # 3. Preparar parámetros para Gradio Client
-            generation_params = {
-                'prompt': args.get('prompt'),
+        def build_result(filename: str, seed: float, cached: bool = False) -> Dict[str, Any]:
+            # Asumiendo que FastAPI sirve el directorio 'output/images' en '/generated_images/'
+            return {
+                'prompt': generation_params['prompt'],
+                'url': f"/generated_images/{filename}",
+                'filename': filename,
+                'format': format_label,
                 'width': dimensions['width'],
                 'height': dimensions['height'],
-                'num_inference_steps': args.get('num_inference_steps'),
-                'seed': args.get('seed'),
-                'randomize_seed': args.get('randomize_seed'),
-                'api_name': "/infer" # Endpoint específico del Space Gradio
+                'seed': int(seed), # Convertir seed a int para claridad
+                'cached': cached,
             }
-            logger.info(f"Calling Gradio client with parameters: {generation_params}")
-
-            # 4. Llamar al cliente Gradio
-            # El resultado es una tupla: (filepath_str, seed_float)
-            result: Tuple[str, float] = self.client.predict(**generation_params)
-            logger.info(f"Gradio client predict returned: {result}")
-
-            temp_image_path_str = result[0]
-            used_seed = result[1]
 
-            # Gradio puede devolver rutas temporales, necesitamos copiarlas
-            # Usa gradio_utils.download_file si es una URL o maneja rutas locales
-            if temp_image_path_str.startswith('http'):
-                 temp_image_path = pathlib.Path(gradio_utils.download_file(temp_image_path_str))
+        def finish(result: Dict[str, Any]) -> Dict[str, Any]:
+            # Derivar localmente los formatos pedidos a partir del master
+            return self._derive(result, derivative_presets, args.get('encoding'), generation_id)
+
+        generation_id = current_generation_id()
+
+        # 4. Buscar en caché si la generación es determinista (semilla fija)
+        cache_key = None
+        if self.image_cache is not None and not generation_params['randomize_seed']:
+            # La misma semilla en otro Space/modelo da otra imagen: el endpoint forma parte de la clave
+            cache_key = ImageCache.make_key(generation_params, model=self.client_pool.src)
+            cached = self.image_cache.lookup(cache_key)
+            if cached:
+                cached_filename, cached_seed = cached
+                logger.info(f"Image cache hit for key {cache_key[:12]}: {cached_filename}")
+                self.image_store.add_record(cached_filename, generation_params['prompt'], format_label,
+                                            int(cached_seed), dimensions['width'], dimensions['height'], generation_id)
+                telemetry.IMAGES.inc(result="cache_hit")
+                return finish(build_result(cached_filename, cached_seed, cached=True))
+
+        cancellation.check_cancelled() # No se envían imágenes nuevas si la ejecución se canceló o venció su plazo
+
+        # 5. Modo progresivo: vista previa barata ahora; el render final sigue en segundo plano
+        #    con la misma semilla y sustituye el archivo de la vista previa (misma URL)
+        progressive = args['progressive'] if args.get('progressive') is not None else self.progressive
+        preview_params = self._preview_params(generation_params) if progressive else None
+        if preview_params is not None:
+            temp_image_path, used_seed = self._predict(preview_params, stage="preview")
+            suffix = temp_image_path.suffix.lower() or '.webp'
+            preview_name = f"progressive-{uuid.uuid4().hex}{suffix}" # Nombre estable: el contenido cambiará
+            # Fijada hasta que acabe el render final (ver _refine): la GC por cuota no debe borrarla antes
+            self.image_store.pin(preview_name)
+            try:
+                with telemetry.observe("flux.store", telemetry.IMAGE_STAGE_SECONDS, stage="store"):
+                    new_filename = self.image_store.put(
+                        temp_image_path,
+                        prompt=generation_params['prompt'],
+                        image_format=format_label,
+                        seed=int(used_seed),
+                        width=preview_params['width'],
+                        height=preview_params['height'],
+                        generation_id=generation_id,
+                        suffix=suffix,
+                        name=preview_name,
+                        kind='preview',
+                    )
+                telemetry.IMAGES.inc(result="preview")
+                result = finish(build_result(new_filename, used_seed))
+                result['preview'] = True
+                refine_params = {**generation_params, 'seed': int(used_seed), 'randomize_seed': False}
+                self._schedule_refinement(result, refine_params, derivative_presets, args.get('encoding'), cache_key)
+            except BaseException:
+                self.image_store.unpin(preview_name)
+                raise
+            report_progress(self._image_event("image_preview", result, preview_params))
+            return result
+
+        # 6. Llamar al cliente Gradio
+        temp_image_path, used_seed = self._predict(generation_params)
+
+        # 7. Mover la imagen al almacén (nombre por hash de contenido, rename/hardlink atómico)
+        #    y registrarla en el índice; el temporal se consume en el proceso
+        with telemetry.observe("flux.store", telemetry.IMAGE_STAGE_SECONDS, stage="store"):
+            new_filename = self.image_store.put(
+                temp_image_path,
+                prompt=generation_params['prompt'],
+                image_format=format_label,
+                seed=int(used_seed),
+                width=dimensions['width'],
+                height=dimensions['height'],
+                generation_id=generation_id,
+                suffix=temp_image_path.suffix.lower() or '.webp',
+            )
+        telemetry.IMAGES.inc(result="generated")
+        logger.info(f"Image stored as: {(self.save_dir / new_filename).resolve()}")
+
+        # 8. Generación determinista: registrar la clave en la caché
+        if cache_key:
+            self.image_cache.store_blob(cache_key, new_filename, int(used_seed), dimensions['width'], dimensions['height'])
+
+        # 9. Devolver la RUTA URL RELATIVA para el frontend (y los derivados si se pidieron)
+        return finish(build_result(new_filename, used_seed))
+
+    def _predict(self, generation_params: Dict[str, Any], stage: str = "predict") -> Tuple[pathlib.Path, float]:
+        """Llama a FLUX y devuelve la ruta local de la imagen generada (temporal) y la semilla usada."""
+        logger.info(f"Calling Gradio client with parameters: {generation_params}")
+        # El resultado es una tupla: (filepath_str, seed_float)
+        # El limitador reintenta con backoff los errores de cuota/timeout del Space; con varios
+        # endpoints el balanceador pasa cada intento por el limitador y hace failover en lugar de reintentar
+        # (el span incluye la espera en el limitador, los reintentos y la descarga que hace gradio_client)
+        with telemetry.observe(f"flux.{stage}", telemetry.IMAGE_STAGE_SECONDS, stage=stage,
+                               attributes={"width": generation_params['width'], "height": generation_params['height'],
+                                           "steps": generation_params['num_inference_steps']}):
+            if isinstance(self.client_pool, FluxEndpointBalancer):
+                result: Tuple[str, float] = self.client_pool.predict_with(self.rate_limiter, **generation_params)
             else:
-                 temp_image_path = pathlib.Path(temp_image_path_str)
-
+                result = self.rate_limiter.call(self.client_pool.predict, **generation_params)
+        logger.info(f"Gradio client predict returned: {result}")
 
-            if not temp_image_path.exists():
-                 logger.error(f"Generated image file not found at temporary path: {temp_image_path_str}")
-                 raise FileNotFoundError(f"Generated image file not found at path: {temp_image_path_str}")
+        temp_image_path_str = result[0]
+        used_seed = result[1]
 
-            # 5. Generar nombre de archivo final y copiar
-            new_filename = self._generate_filename(generation_params['prompt'], image_format)
-            new_filepath = self.save_dir / new_filename
+        # Gradio puede devolver rutas temporales, necesitamos copiarlas
+        # Usa gradio_utils.download_file si es una URL o maneja rutas locales
+        if temp_image_path_str.startswith('http'):
+             with telemetry.observe("flux.download", telemetry.IMAGE_STAGE_SECONDS, stage="download"):
+                 temp_image_path = pathlib.Path(gradio_utils.download_file(temp_image_path_str))
+        else:
+             temp_image_path = pathlib.Path(temp_image_path_str)
+
+        if not temp_image_path.exists():
+             logger.error(f"Generated image file not found at temporary path: {temp_image_path_str}")
+             raise FileNotFoundError(f"Generated image file not found at path: {temp_image_path_str}")
+        return temp_image_path, used_seed
+
+    def _derive(self, result: Dict[str, Any], derivative_presets: Dict[str, Tuple[int, int]],
+                encoding: Optional[str], generation_id: Optional[str], refresh: bool = False) -> Dict[str, Any]:
+        """Deriva los formatos pedidos a partir del master (con `refresh`, de nuevo tras refinarlo)."""
+        if not derivative_presets:
+            return result
+        with telemetry.observe("flux.derive", telemetry.IMAGE_STAGE_SECONDS,
+                               attributes={"presets": len(derivative_presets)}, stage="derive"):
+            manifest = self.derivative_pipeline.derive(
+                result['filename'], derivative_presets,
+                master_info={'prompt': result['prompt'], 'seed': result['seed'],
+                             'width': result['width'], 'height': result['height']},
+                encoding=encoding, force=refresh)
+        # Los derivados quedan indexados con su master: la GC los borra junto a él
+        for derivative in manifest['derivatives']:
+            self.image_store.register(derivative['filename'], parent=result['filename'])
+            if not refresh:
+                self.image_store.add_record(derivative['filename'], result['prompt'], derivative['preset'],
+                                            result['seed'], derivative['width'], derivative['height'],
+                                            generation_id=generation_id, kind='derivative')
+        result['derivatives'] = manifest['derivatives']
+        result['manifest'] = self.derivative_pipeline.manifest_path(result['filename']).name
+        return result
+
+    # --- Modo progresivo ---
+    def _preview_params(self, generation_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Parámetros de la vista previa (menos pasos, menor tamaño); None si no sería más barata que el render final."""
+        def scaled(value: int) -> int:
+            return min(value, max(8 * DIMENSION_MULTIPLE,
+                                  int(value * self.preview_scale) // DIMENSION_MULTIPLE * DIMENSION_MULTIPLE))
+
+        steps = min(self.preview_steps, generation_params['num_inference_steps'])
+        width, height = scaled(generation_params['width']), scaled(generation_params['height'])
+        if (steps, width, height) == (generation_params['num_inference_steps'], generation_params['width'],
+                                      generation_params['height']):
+            return None
+        return {**generation_params, 'num_inference_steps': steps, 'width': width, 'height': height}
+
+    def _image_event(self, event: str, result: Dict[str, Any],
+                     preview_params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Evento de progreso de una imagen progresiva (vista previa lista / render final listo)."""
+        info = {
+            "message": ("Image preview ready, rendering it at full quality..." if event == "image_preview"
+                        else "Full-quality image ready."),
+            "event": event,
+            "url": result['url'],
+            "filename": result['filename'],
+            "path": str(self.save_dir / result['filename']),
+            "prompt": result['prompt'],
+            "format": result['format'],
+            "width": result['width'],
+            "height": result['height'],
+            "seed": result['seed'],
+            "derivatives": [derivative['url'] for derivative in result.get('derivatives', [])],
+        }
+        if preview_params is not None:
+            info["preview"] = {"width": preview_params['width'], "height": preview_params['height'],
+                               "steps": preview_params['num_inference_steps']}
+        return info
+
+    def _schedule_refinement(self, result: Dict[str, Any], params: Dict[str, Any],
+                             derivative_presets: Dict[str, Tuple[int, int]], encoding: Optional[str],
+                             cache_key: Optional[str]) -> None:
+        generation_id = current_generation_id()
+        # El token se captura ahora: el render sigue cancelándose con la ejecución aunque esta ya haya terminado
+        token = cancellation.current_token()
+        with self.refinements_lock:
+            if self.refine_executor is None:
+                self.refine_executor = ThreadPoolExecutor(max_workers=self.client_pool.size,
+                                                          thread_name_prefix="flux-refine")
+            # El render hereda el contexto de la ejecución (generation_id, plazos, progreso)
+            future = self.refine_executor.submit(contextvars.copy_context().run, self._refine, result, params,
+                                                 derivative_presets, encoding, cache_key, token)
+            if generation_id is None:
+                # Fuera de una ejecución nadie espera los renders: solo se guardan los que siguen en curso
+                self.pending_refinements[None] = [f for f in self.pending_refinements.get(None, []) if not f.done()]
+            self.pending_refinements.setdefault(generation_id, []).append(future)
+
+    def _refine(self, result: Dict[str, Any], params: Dict[str, Any], derivative_presets: Dict[str, Tuple[int, int]],
+                encoding: Optional[str], cache_key: Optional[str],
+                token: Optional[cancellation.CancellationToken]) -> str:
+        """Render final de una vista previa: sustituye su archivo (y sus derivados). Devuelve refined/failed/cancelled."""
+        generation_id = current_generation_id()
+        try:
+            with cancellation.cancel_scope(token):
+                cancellation.check_cancelled()
+                temp_image_path, used_seed = self._predict(params)
+                with telemetry.observe("flux.store", telemetry.IMAGE_STAGE_SECONDS, stage="store"):
+                    # Rename atómico sobre el archivo de la vista previa: la URL no cambia
+                    self.image_store.replace(result['filename'], temp_image_path, seed=int(used_seed),
+                                             width=result['width'], height=result['height'])
+                refined = {**result, 'seed': int(used_seed), 'preview': False}
+                refined = self._derive(refined, derivative_presets, encoding, generation_id, refresh=True)
+                if cache_key:
+                    self.image_cache.store_blob(cache_key, result['filename'], int(used_seed),
+                                                result['width'], result['height'])
+        except cancellation.RunCancelled as e:
+            logger.info(f"Full-quality render of {result['filename']} abandoned ({e.reason}), keeping the preview")
+            report_progress({"message": f"Full-quality render abandoned ({e.reason}), keeping the preview",
+                             "event": "image_refine_cancelled", "url": result['url'], "filename": result['filename']})
+            return "cancelled"
+        except Exception as e:
+            telemetry.IMAGES.inc(result="error")
+            logger.error(f"Full-quality render of {result['filename']} failed, keeping the preview: {e}", exc_info=True)
+            report_progress({"message": f"Full-quality render failed, keeping the preview: {e}",
+                             "event": "image_refine_failed", "url": result['url'], "filename": result['filename']})
+            return "failed"
+        finally:
+            self.image_store.unpin(result['filename'])
+        telemetry.IMAGES.inc(result="generated")
+        logger.info(f"Full-quality render stored over the preview {result['filename']}")
+        report_progress(self._image_event("image_refined", refined))
+        return "refined"
+
+    def wait_for_refinements(self, generation_id: Optional[str], wait: bool = True) -> Optional[Dict[str, int]]:
+        """
+        Espera los renders finales pendientes de una generación (cancelable: ver src.cancellation)
+        y devuelve cuántos terminaron refined/failed/cancelled (o siguen pending con `wait=False`);
+        None si la generación no tuvo imágenes progresivas.
+        """
+        with self.refinements_lock:
+            futures = self.pending_refinements.pop(generation_id, [])
+        if not futures:
+            return None
+        if wait:
+            pending = sum(1 for future in futures if not future.done())
+            if pending:
+                logger.info(f"[{generation_id}] Waiting for {pending} full-quality image render(s)...")
+                report_progress({"message": f"Waiting for {pending} full-quality image render(s)...",
+                                 "event": "image_refining", "pending": pending})
+            for future in futures:
+                cancellation.wait_future(future)
+        summary = {"refined": 0, "failed": 0, "cancelled": 0, "pending": 0}
+        for future in futures:
+            summary[future.result() if future.done() else "pending"] += 1
+        return summary
+
+    @staticmethod
+    def _split_specs(arguments: str) -> List[str]:
+        """
+        Separa varias especificaciones de imagen en una sola entrada. Cada especificación
+        empieza por 'prompt:' y se separa de la anterior con ';' o un salto de línea.
+        """
+        specs = re.split(r'[;\n]\s*(?=prompt\s*:)', arguments.strip(), flags=re.IGNORECASE)
+        return [spec.strip().rstrip(';').strip() for spec in specs if spec.strip()]
 
-            shutil.copy2(temp_image_path, new_filepath)
-            logger.info(f"Image successfully copied to: {new_filepath.resolve()}")
+    def _run_batch(self, specs: List[str]) -> str:
+        """
+        Genera varias imágenes en paralelo (una tarea por especificación sobre el pool de
+        clientes Gradio). Los fallos individuales no cancelan el resto: cada entrada de la
+        lista resultante tiene status 'success' o 'error'. La cancelación de la ejecución
+        (RunCancelled, que no es un Exception) sí se propaga.
+        """
+        max_workers = min(len(specs), self._batch_concurrency())
+        logger.info(f"Generating {len(specs)} images concurrently (max_workers={max_workers})")
+        results: List[Optional[Dict[str, Any]]] = [None] * len(specs)
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="flux-batch") as executor:
+            # Cada tarea hereda el contexto (generation_id) del hilo que llama
+            futures = {executor.submit(contextvars.copy_context().run, self._generate_image, spec): i
+                       for i, spec in enumerate(specs)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = {'index': i, 'status': 'success', **future.result()}
+                except Exception as e:
+                    results[i] = {'index': i, 'status': 'error', 'spec': specs[i], 'error': self._error_message(e)}
+
+        succeeded = sum(1 for r in results if r['status'] == 'success')
+        summary = f"Generated {succeeded} of {len(specs)} images."
+        logger.info(summary)
+        return f"{summary}\n{json.dumps(results, indent=2, ensure_ascii=False)}"
+
+    def _batch_concurrency(self) -> int:
+        """Máximo de generaciones simultáneas en modo batch (env IMAGE_BATCH_CONCURRENCY, por defecto el tamaño del pool)."""
+        try:
+            return max(1, int(os.getenv('IMAGE_BATCH_CONCURRENCY', self.client_pool.size)))
+        except ValueError:
+            logger.warning("Invalid IMAGE_BATCH_CONCURRENCY in .env, using the Gradio pool size")
+            return self.client_pool.size
 
-            # 6. Limpiar archivo temporal si es necesario (opcional)
+    def _run(self, arguments: str) -> str:
+        """
+        Ejecuta la generación de imagen.
+        Este es el método principal llamado por CrewAI. Si la entrada contiene varias
+        especificaciones (separadas por ';' o saltos de línea) se generan en paralelo.
+        """
+        cancellation.check_cancelled() # Cada llamada a la herramienta es un punto de cancelación
+        specs = self._split_specs(arguments)
+        with telemetry.observe("flux.tool", attributes={"images": len(specs)}):
+            if len(specs) > 1:
+                return self._run_batch(specs)
             try:
-                if temp_image_path.exists() and not str(new_filepath.resolve()) == str(temp_image_path.resolve()):
-                    temp_image_path.unlink()
-                    logger.debug(f"Temporary file removed: {temp_image_path}")
-            except OSError as e:
-                logger.warning(f"Could not remove temporary file {temp_image_path}: {e}")
-
-
-            # 7. Devolver la RUTA URL RELATIVA para el frontend
-            # Asumiendo que FastAPI sirve el directorio 'output/images' en '/generated_images/'
-            relative_url_path = f"/generated_images/{new_filename}"
-
-            success_message = (
-                f"Image generated successfully.\n"
-                f"URL Path: {relative_url_path}\n"
-                f"Format: {image_format.value}\n"
-                f"Dimensions: {dimensions['width']}x{dimensions['height']}\n"
-                f"Seed used: {int(used_seed)}" # Convertir seed a int para claridad
-            )
-            logger.info(success_message.replace('\n', ' | ')) # Log en una línea
-            return success_message
-
-        except ValueError as ve: # Errores de procesamiento de argumentos
-             logger.error(f"Argument processing error: {ve}")
-             return f"Error en los argumentos: {ve}"
-        except FileNotFoundError as fnfe:
-            logger.error(f"File handling error: {fnfe}", exc_info=True)
-            return f"Error de archivo: {fnfe}"
-        except Exception as e:
-            logger.error(f"Unexpected error during image generation: {e}", exc_info=True)
-            # Capturar traceback para debugging
-            # error_trace = traceback.format_exc()
-            return f"Error inesperado al generar imagen: {str(e)}"
\ No newline at end of file
+                return self._success_message(self._generate_image(arguments))
+            except Exception as e:
+                return self._error_message(e)
\ No newline at end of file
@@ -0,0 +1,365 @@
+# backend/src/tools/flux_balancer.py
+
+import contextvars
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from src import cancellation, telemetry
+from src.ratelimit import UpstreamLimiter
+from src.tools.gradio_pool import DEFAULT_FLUX_SRC, GradioClientPool, GradioPoolError, get_client_pool
+
+logger = logging.getLogger(__name__)
+
+# Estados del circuit breaker de cada endpoint
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class FluxEndpointsUnavailable(GradioPoolError):
+    """Todos los endpoints de FLUX tienen el circuito abierto."""
+
+
+class _Endpoint:
+    """Un endpoint de FLUX (su pool de conexiones) con sus peticiones en curso, latencias y circuito."""
+
+    def __init__(self, pool: GradioClientPool, window: int):
+        self.pool = pool
+        self.name = pool.src
+        self.outstanding = 0
+        self.latencies: deque = deque(maxlen=window)
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.requests = 0
+        self.failures = 0
+        self.cancelled = 0
+
+    def percentile(self, q: float) -> Optional[float]:
+        return _percentile(self.latencies, q)
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class _Attempt:
+    def __init__(self, endpoint: _Endpoint, future: Future, token: cancellation.CancellationToken, hedge: bool):
+        self.endpoint = endpoint
+        self.future = future
+        self.token = token
+        self.hedge = hedge
+
+
+class FluxEndpointBalancer:
+    """
+    Reparte las peticiones a FLUX entre varios endpoints equivalentes (Spaces o réplicas
+    propias), cada uno con su `GradioClientPool`. Misma interfaz que el pool (`predict`,
+    `size`, `metrics`), así que la herramienta puede usar cualquiera de los dos.
+
+    - Balanceo por menos peticiones en curso (relativo al tamaño del pool de cada endpoint;
+      a igualdad, el de menor latencia mediana).
+    - Peticiones cubiertas (hedging): si la respuesta tarda más que `hedge_delay` (segundos, o
+      un percentil de las latencias observadas como 'p90') se lanza un duplicado en otro
+      endpoint; gana la primera respuesta y la otra se cancela (el job de Gradio incluido).
+    - Failover: si un endpoint falla, la petición se reintenta en otro no probado todavía.
+    - Limitador (`predict_with`): cada intento (original, duplicado o failover) ocupa su propio
+      hueco en el limitador, y no se duplica ninguna petición mientras el limitador está lleno.
+    - Circuit breaker: tras `failure_threshold` fallos seguidos el endpoint deja de recibir
+      tráfico durante `cooldown_seconds`; después recibe una petición de prueba (half-open)
+      que lo cierra si sale bien o lo vuelve a abrir si falla.
+    """
+
+    def __init__(self,
+                 pools: List[GradioClientPool],
+                 hedge_delay: Union[float, str, None] = "p90",
+                 hedge_min_samples: int = 20,
+                 failure_threshold: int = 3,
+                 cooldown_seconds: float = 30.0,
+                 window: int = 200):
+        if not pools:
+            raise ValueError("FluxEndpointBalancer needs at least one endpoint")
+        self.endpoints = [_Endpoint(pool, window) for pool in pools]
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self._latencies: deque = deque(maxlen=window) # Latencias de todas las respuestas correctas
+        self._lock = threading.Lock()
+        # Un hilo por intento en curso: como mucho dos por petición (original + duplicado)
+        self._executor = ThreadPoolExecutor(max_workers=2 * self.size + 2, thread_name_prefix="flux-attempt")
+        self._hedges_fired = 0
+        self._hedges_won = 0
+
+    @property
+    def size(self) -> int:
+        return sum(endpoint.pool.size for endpoint in self.endpoints)
+
+    @property
+    def src(self) -> str:
+        return ",".join(endpoint.name for endpoint in self.endpoints)
+
+    # --- Selección de endpoint y circuit breaker ---
+    def _available(self, endpoint: _Endpoint, now: float) -> bool:
+        if endpoint.state == CIRCUIT_OPEN and now - endpoint.opened_at >= self.cooldown_seconds:
+            endpoint.state = CIRCUIT_HALF_OPEN
+            endpoint.trial_in_flight = False
+            logger.info(f"FLUX endpoint {endpoint.name}: circuit half-open, sending a trial request")
+        if endpoint.state == CIRCUIT_OPEN:
+            return False
+        return endpoint.state == CIRCUIT_CLOSED or not endpoint.trial_in_flight
+
+    def _pick(self, exclude: set) -> Optional[_Endpoint]:
+        """Endpoint disponible con menos peticiones en curso (lo marca como ocupado), o None."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e not in exclude and self._available(e, now)]
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda e: (e.outstanding / e.pool.size, e.percentile(0.5) or 0.0,
+                                                      random.random()))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            if endpoint.state == CIRCUIT_HALF_OPEN:
+                endpoint.trial_in_flight = True
+            return endpoint
+
+    def _finish(self, endpoint: _Endpoint, seconds: float, outcome: str) -> None:
+        telemetry.FLUX_ENDPOINT_REQUESTS.inc(endpoint=endpoint.name, status=outcome)
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.trial_in_flight = False
+            if outcome == "ok":
+                endpoint.latencies.append(seconds)
+                self._latencies.append(seconds)
+                endpoint.consecutive_failures = 0
+                if endpoint.state != CIRCUIT_CLOSED:
+                    endpoint.state = CIRCUIT_CLOSED
+                    logger.info(f"FLUX endpoint {endpoint.name}: trial request succeeded, circuit closed")
+            elif outcome == "error":
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.state == CIRCUIT_HALF_OPEN or (
+                        endpoint.state == CIRCUIT_CLOSED and endpoint.consecutive_failures >= self.failure_threshold):
+                    endpoint.state = CIRCUIT_OPEN
+                    endpoint.opened_at = time.monotonic()
+                    telemetry.FLUX_CIRCUIT_OPENS.inc(endpoint=endpoint.name)
+                    logger.warning(f"FLUX endpoint {endpoint.name}: circuit open after "
+                                   f"{endpoint.consecutive_failures} consecutive failures "
+                                   f"(retry in {self.cooldown_seconds}s)")
+            else:
+                endpoint.cancelled += 1
+                # Un intento abandonado tardó al menos esto: cuenta para elegir endpoint, no para el hedging
+                endpoint.latencies.append(seconds)
+        if outcome == "ok":
+            telemetry.FLUX_ENDPOINT_SECONDS.observe(seconds, endpoint=endpoint.name)
+
+    def current_hedge_delay(self) -> Optional[float]:
+        """Segundos tras los que se duplica una petición; None si el hedging está desactivado o faltan muestras."""
+        if self.hedge_delay is None or len(self.endpoints) < 2:
+            return None
+        if not isinstance(self.hedge_delay, str):
+            return float(self.hedge_delay)
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            return _percentile(self._latencies, float(self.hedge_delay.lstrip("p")) / 100)
+
+    # --- Peticiones ---
+    def _run_attempt(self, endpoint: _Endpoint, token: cancellation.CancellationToken,
+                     rate_limiter: Optional[UpstreamLimiter], args, kwargs) -> Any:
+        started = time.perf_counter()
+        try:
+            with cancellation.cancel_scope(token):
+                if rate_limiter is None:
+                    result = endpoint.pool.predict(*args, **kwargs)
+                else:
+                    with rate_limiter.slot():
+                        result = endpoint.pool.predict(*args, **kwargs)
+        except cancellation.RunCancelled:
+            self._finish(endpoint, time.perf_counter() - started, "cancelled")
+            raise
+        except Exception:
+            self._finish(endpoint, time.perf_counter() - started, "error")
+            raise
+        self._finish(endpoint, time.perf_counter() - started, "ok")
+        return result
+
+    def _start(self, endpoint: _Endpoint, rate_limiter: Optional[UpstreamLimiter], args, kwargs,
+               wake: threading.Event, hedge: bool) -> _Attempt:
+        token = cancellation.CancellationToken(f"flux:{endpoint.name}")
+        # Cada intento hereda el contexto (generation_id, plazos) del hilo que llama
+        future = self._executor.submit(contextvars.copy_context().run, self._run_attempt, endpoint, token,
+                                       rate_limiter, args, kwargs)
+        future.add_done_callback(lambda _: wake.set())
+        return _Attempt(endpoint, future, token, hedge)
+
+    def predict(self, *args, **kwargs) -> Any:
+        """`client.predict` en el mejor endpoint, con duplicado tras el retardo de hedging y failover."""
+        return self.predict_with(None, *args, **kwargs)
+
+    def predict_with(self, rate_limiter: Optional[UpstreamLimiter], *args, **kwargs) -> Any:
+        """Como `predict`, pasando cada intento por `rate_limiter` (sin sus reintentos: el failover los sustituye)."""
+        cancellation.check_cancelled()
+        tried = set()
+        attempts: List[_Attempt] = []
+        wake = threading.Event()
+        last_error: Optional[BaseException] = None
+        hedge_at: Optional[float] = None
+        hedged = False
+        unregister = cancellation.on_cancel(wake.set)
+        try:
+            while True:
+                wake.clear()
+                for attempt in [a for a in attempts if a.future.done()]:
+                    attempts.remove(attempt)
+                    try:
+                        result = attempt.future.result()
+                    except cancellation.RunCancelled:
+                        continue # Intento abandonado; si se canceló la ejecución lo detecta check_cancelled
+                    except Exception as e:
+                        logger.warning(f"FLUX endpoint {attempt.endpoint.name} failed: {e}")
+                        last_error = e
+                        continue
+                    if hedged:
+                        telemetry.FLUX_HEDGES.inc(result="won" if attempt.hedge else "lost")
+                        if attempt.hedge:
+                            with self._lock:
+                                self._hedges_won += 1
+                    for loser in attempts:
+                        loser.token.cancel()
+                    return result
+                cancellation.check_cancelled()
+
+                now = time.monotonic()
+                if not attempts:
+                    # Primer intento, o failover tras el fallo de todos los intentos en curso
+                    endpoint = self._pick(tried)
+                    if endpoint is None:
+                        if last_error is not None:
+                            raise last_error
+                        raise FluxEndpointsUnavailable(f"No FLUX endpoint available ({self.src}): all circuits open")
+                    tried.add(endpoint)
+                    attempts.append(self._start(endpoint, rate_limiter, args, kwargs, wake, hedge=False))
+                    delay = self.current_hedge_delay()
+                    hedge_at = now + delay if delay is not None else None
+                    continue
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None # Un solo duplicado por petición
+                    if rate_limiter is not None and rate_limiter.saturated():
+                        # Un duplicado solo esperaría en la cola del limitador, quitando el hueco a otra petición
+                        logger.info(f"Not hedging FLUX request: rate limiter '{rate_limiter.name}' is saturated")
+                        continue
+                    endpoint = self._pick(tried)
+                    if endpoint is not None:
+                        tried.add(endpoint)
+                        attempts.append(self._start(endpoint, rate_limiter, args, kwargs, wake, hedge=True))
+                        hedged = True
+                        telemetry.FLUX_HEDGES.inc(result="fired")
+                        with self._lock:
+                            self._hedges_fired += 1
+                        logger.info(f"Hedging FLUX request on {endpoint.name} "
+                                    f"(no answer from {attempts[0].endpoint.name} yet)")
+                    continue
+                timeouts = [t for t in (hedge_at - now if hedge_at is not None else None,
+                                        cancellation.remaining_time()) if t is not None]
+                wake.wait(max(min(timeouts), 0.0) if timeouts else None)
+        finally:
+            unregister()
+            for attempt in attempts:
+                attempt.token.cancel() # Cancelación de la ejecución o plazo vencido: abortar lo que quede
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {
+                e.name: {
+                    "state": e.state,
+                    "outstanding": e.outstanding,
+                    "requests": e.requests,
+                    "failures": e.failures,
+                    "cancelled": e.cancelled,
+                    "latency_p50": e.percentile(0.5),
+                    "latency_p90": e.percentile(0.9),
+                    "latency_p99": e.percentile(0.99),
+                }
+                for e in self.endpoints
+            }
+            hedges = {"fired": self._hedges_fired, "won": self._hedges_won}
+        return {"src": self.src, "size": self.size, "hedge_delay": self.current_hedge_delay(),
+                "hedges": hedges, "endpoints": endpoints,
+                "pools": {e.name: e.pool.metrics() for e in self.endpoints}}
+
+
+def _parse_hedge_delay(value: str) -> Union[float, str, None]:
+    value = value.strip().lower()
+    if value in ("", "off", "none", "false", "0"):
+        return None
+    if value.startswith("p"):
+        try:
+            if 0 < float(value[1:]) < 100:
+                return value
+        except ValueError:
+            pass
+    else:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+    logger.warning(f"Invalid FLUX_HEDGE_DELAY '{value}', using p90")
+    return "p90"
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} in .env, using default {default}")
+        return default
+
+
+# --- Registro a nivel de proceso ---
+_balancers: Dict[Tuple[str, ...], FluxEndpointBalancer] = {}
+_balancers_lock = threading.Lock()
+
+
+def get_flux_backend(src: Optional[str] = None) -> Union[GradioClientPool, FluxEndpointBalancer]:
+    """
+    Cliente FLUX compartido del proceso para `src` (por defecto env FLUX_GRADIO_SRC): con un
+    solo endpoint, su pool (ver `get_client_pool`); con varios separados por comas, un
+    balanceador sobre el pool de cada uno. El balanceador se configura con FLUX_HEDGE_DELAY
+    (p90 por defecto, segundos u 'off'), FLUX_HEDGE_MIN_SAMPLES (20), FLUX_CIRCUIT_FAILURES (3)
+    y FLUX_CIRCUIT_COOLDOWN_SECONDS (30).
+    """
+    src = src or os.getenv('FLUX_GRADIO_SRC', DEFAULT_FLUX_SRC)
+    sources = tuple(dict.fromkeys(part.strip() for part in src.split(",") if part.strip())) or (DEFAULT_FLUX_SRC,)
+    if len(sources) == 1:
+        return get_client_pool(sources[0])
+    with _balancers_lock:
+        balancer = _balancers.get(sources)
+        if balancer is None:
+            balancer = FluxEndpointBalancer(
+                [get_client_pool(source) for source in sources],
+                hedge_delay=_parse_hedge_delay(os.getenv('FLUX_HEDGE_DELAY', 'p90')),
+                hedge_min_samples=int(_env_number('FLUX_HEDGE_MIN_SAMPLES', 20)),
+                failure_threshold=int(_env_number('FLUX_CIRCUIT_FAILURES', 3)),
+                cooldown_seconds=_env_number('FLUX_CIRCUIT_COOLDOWN_SECONDS', 30.0),
+            )
+            _balancers[sources] = balancer
+            logger.info(f"Created FLUX balancer over {len(sources)} endpoints: {', '.join(sources)}")
+        return balancer
+
+
+def all_balancer_metrics() -> Dict[str, Dict[str, Any]]:
+    with _balancers_lock:
+        return {balancer.src: balancer.metrics() for balancer in _balancers.values()}
@@ -0,0 +1,265 @@
+# backend/src/tools/gradio_pool.py
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from gradio_client import Client
+
+from src import cancellation
+
+logger = logging.getLogger(__name__)
+
+# Space (o URL de un servidor Gradio local) usado por defecto para FLUX
+DEFAULT_FLUX_SRC = "black-forest-labs/FLUX.1-schnell"
+
+
+class GradioPoolError(RuntimeError):
+    """No se pudo obtener una conexión Gradio del pool."""
+
+
+class _PooledClient:
+    """Conexión del pool con sus metadatos."""
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.created_at = time.monotonic()
+        self.last_checked = self.created_at
+        self.uses = 0
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+
+def default_health_check(client: Any) -> bool:
+    """Comprueba que el servidor responde pidiendo la descripción de su API."""
+    return client.view_api(print_info=False, return_format="dict") is not None
+
+
+class GradioClientPool:
+    """
+    Pool de clientes Gradio compartido por todas las instancias de la herramienta.
+
+    - Las conexiones se crean de forma perezosa, en el primer `acquire`, hasta `size`.
+    - Una conexión ociosa más de `health_check_interval` segundos se verifica antes de
+      entregarla; si falla se descarta y se reconecta.
+    - Las conexiones que lanzan una excepción durante su uso se descartan (reconexión en el
+      siguiente `acquire`). Con `max_age` se reciclan las conexiones viejas.
+    - `metrics()` expone tiempo de espera del pool y edad de las conexiones.
+    """
+
+    def __init__(self,
+                 src: str = DEFAULT_FLUX_SRC,
+                 size: int = 2,
+                 acquire_timeout: float = 120.0,
+                 health_check_interval: float = 300.0,
+                 max_age: Optional[float] = None,
+                 client_factory: Callable[..., Any] = Client,
+                 health_check: Callable[[Any], bool] = default_health_check,
+                 **client_kwargs):
+        self.src = src
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.max_age = max_age
+        self.client_factory = client_factory
+        self.health_check = health_check
+        self.client_kwargs = client_kwargs
+
+        self._idle: List[_PooledClient] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+        # Métricas
+        self._acquisitions = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._created = 0
+        self._discarded = 0
+        self._health_check_failures = 0
+        self._busy: List[_PooledClient] = []
+
+    @property
+    def open_connections(self) -> int:
+        return len(self._idle) + self._in_use
+
+    def _connect(self) -> _PooledClient:
+        logger.info(f"Opening Gradio connection to {self.src}...")
+        started = time.perf_counter()
+        client = self.client_factory(src=self.src, **self.client_kwargs)
+        logger.info(f"Gradio connection to {self.src} ready in {time.perf_counter() - started:.2f}s")
+        with self._cond:
+            self._created += 1
+        return _PooledClient(client)
+
+    def _is_healthy(self, pooled: _PooledClient) -> bool:
+        if self.max_age and pooled.age > self.max_age:
+            logger.info(f"Recycling Gradio connection after {pooled.age:.0f}s")
+            return False
+        if time.monotonic() - pooled.last_checked < self.health_check_interval:
+            return True
+        try:
+            healthy = bool(self.health_check(pooled.client))
+        except Exception as e:
+            logger.warning(f"Gradio health check failed for {self.src}: {e}")
+            healthy = False
+        pooled.last_checked = time.monotonic()
+        if not healthy:
+            with self._cond:
+                self._health_check_failures += 1
+        return healthy
+
+    def _acquire(self) -> _PooledClient:
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.acquire_timeout
+        pooled = None
+        must_connect = False
+        with self._cond:
+            while not self._idle and self.open_connections >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise GradioPoolError(f"Timed out after {self.acquire_timeout}s waiting for a Gradio connection")
+                self._cond.wait(min(remaining, 0.5))
+                cancellation.check_cancelled() # Una ejecución cancelada deja de esperar conexión
+            self._in_use += 1
+            if self._idle:
+                pooled = self._idle.pop()
+            else:
+                must_connect = True
+
+        # Conectar / verificar fuera del lock para no bloquear al resto de hilos
+        try:
+            if must_connect:
+                pooled = self._connect()
+            elif not self._is_healthy(pooled):
+                self._discard(pooled, reconnecting=True)
+                pooled = self._connect()
+        except Exception as e:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise GradioPoolError(f"Could not connect to Gradio server {self.src}: {e}") from e
+
+        waited = time.perf_counter() - started
+        with self._cond:
+            self._acquisitions += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._busy.append(pooled)
+        pooled.uses += 1
+        return pooled
+
+    def _release(self, pooled: _PooledClient, broken: bool = False) -> None:
+        with self._cond:
+            self._in_use -= 1
+            if pooled in self._busy:
+                self._busy.remove(pooled)
+            if not broken:
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    def _discard(self, pooled: _PooledClient, reconnecting: bool = False) -> None:
+        with self._cond:
+            self._discarded += 1
+        try:
+            close = getattr(pooled.client, "close", None)
+            if callable(close):
+                close()
+        except Exception:
+            pass
+        if reconnecting:
+            logger.info(f"Reconnecting to Gradio server {self.src}")
+
+    @contextmanager
+    def client(self) -> Iterator[Any]:
+        """Entrega un cliente del pool; si el bloque lanza una excepción (o se cancela) la conexión se descarta."""
+        pooled = self._acquire()
+        try:
+            yield pooled.client
+        except BaseException:
+            self._discard(pooled)
+            self._release(pooled, broken=True)
+            raise
+        else:
+            self._release(pooled)
+
+    def predict(self, *args, **kwargs) -> Any:
+        """
+        `client.predict` usando una conexión del pool. Dentro de una ejecución con token de
+        cancelación o deadline (ver src.cancellation) la petición se envía como job
+        (`client.submit`) y se cancela si la ejecución se cancela o vence su plazo. Un job
+        cancelado deja la conexión reutilizable; cualquier otro fallo la descarta.
+        """
+        pooled = self._acquire()
+        broken = True
+        try:
+            submit = getattr(pooled.client, "submit", None)
+            if submit is None:
+                # Sin jobs la llamada abandonada sigue usando el cliente: se descarta si se cancela
+                result = cancellation.call_cancellable(pooled.client.predict, *args, **kwargs)
+            else:
+                job = submit(*args, **kwargs)
+                try:
+                    result = cancellation.wait_future(getattr(job, "future", job), on_abort=job.cancel)
+                except cancellation.RunCancelled:
+                    broken = False # El job se canceló en el servidor; la conexión sigue siendo válida
+                    raise
+            broken = False
+            return result
+        finally:
+            if broken:
+                self._discard(pooled)
+            self._release(pooled, broken=broken)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            ages = [p.age for p in self._idle + self._busy]
+            return {
+                "src": self.src,
+                "size": self.size,
+                "open_connections": self.open_connections,
+                "idle_connections": len(self._idle),
+                "in_use": self._in_use,
+                "acquisitions": self._acquisitions,
+                "wait_seconds_total": round(self._wait_total, 4),
+                "wait_seconds_avg": round(self._wait_total / self._acquisitions, 4) if self._acquisitions else 0.0,
+                "wait_seconds_max": round(self._wait_max, 4),
+                "connections_created": self._created,
+                "connections_discarded": self._discarded,
+                "health_check_failures": self._health_check_failures,
+                "connection_age_max": round(max(ages), 1) if ages else 0.0,
+                "connection_age_avg": round(sum(ages) / len(ages), 1) if ages else 0.0,
+            }
+
+
+# --- Registro de pools a nivel de proceso ---
+_pools: Dict[str, GradioClientPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_client_pool(src: Optional[str] = None, size: Optional[int] = None, **kwargs) -> GradioClientPool:
+    """
+    Devuelve el pool compartido del proceso para `src` (por defecto env FLUX_GRADIO_SRC o el
+    Space de FLUX.1-schnell), creándolo si no existe. El tamaño por defecto es env
+    GRADIO_POOL_SIZE (2). No abre ninguna conexión.
+    """
+    src = src or os.getenv('FLUX_GRADIO_SRC', DEFAULT_FLUX_SRC)
+    with _pools_lock:
+        pool = _pools.get(src)
+        if pool is None:
+            if size is None:
+                try:
+                    size = int(os.getenv('GRADIO_POOL_SIZE', 2))
+                except ValueError:
+                    logger.warning("Invalid GRADIO_POOL_SIZE in .env, using default 2")
+                    size = 2
+            if 'hf_token' not in kwargs and os.getenv('HF_TOKEN'):
+                kwargs['hf_token'] = os.getenv('HF_TOKEN')
+            pool = GradioClientPool(src=src, size=size, **kwargs)
+            _pools[src] = pool
+            logger.info(f"Created shared Gradio client pool for {src} (size {size})")
+        return pool
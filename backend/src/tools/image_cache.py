@@ -0,0 +1,81 @@
+# backend/src/tools/image_cache.py
+
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from src.tools.image_store import ImageStore
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCache:
+    """
+    Caché de imágenes deterministas (randomize_seed=False) para FluxImageGeneratorTool.
+
+    - La clave es un hash de los parámetros de generación (modelo, prompt, dimensiones, pasos, semilla).
+    - Es solo un índice clave -> blob sobre el ImageStore: los archivos, la deduplicación por
+      contenido y la expulsión por cuota (LRU) son cosa del almacén. Las entradas cuyo blob
+      ya no existe se descartan al consultarlas.
+    - El índice vive en la misma base SQLite que el almacén y sobrevive reinicios.
+    """
+
+    def __init__(self, store: ImageStore):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._conn = store.connection
+        self._lock = store.lock
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " key TEXT PRIMARY KEY, blob TEXT NOT NULL, seed INTEGER, width INTEGER, height INTEGER,"
+            " created_at REAL NOT NULL)"
+        )
+
+    @staticmethod
+    def make_key(generation_params: Dict[str, Any], model: str) -> str:
+        """Clave a partir de los parámetros que determinan la imagen y del endpoint/modelo (`src`) que la genera."""
+        payload = {
+            'model': model,
+            'prompt': generation_params.get('prompt'),
+            'width': generation_params.get('width'),
+            'height': generation_params.get('height'),
+            'num_inference_steps': generation_params.get('num_inference_steps'),
+            'seed': generation_params.get('seed'),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def lookup(self, key: str) -> Optional[Tuple[str, int]]:
+        """Devuelve (nombre_de_archivo, semilla) si la clave está en caché y el blob sigue en el almacén."""
+        with self._lock:
+            row = self._conn.execute("SELECT blob, seed FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.store.contains(row[0]):
+                self.store.touch(row[0])
+                self.hits += 1
+                return row[0], row[1]
+            if row is not None:
+                # El almacén expulsó (o perdió) el blob: limpiar la entrada
+                self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def store_blob(self, key: str, blob: str, seed: int, width: int, height: int) -> None:
+        """Registra la clave para un blob que ya está en el almacén."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, blob, seed, width, height, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, blob, seed, width, height, time.time()),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': entries,
+            **{f'store_{k}': v for k, v in self.store.stats().items()},
+        }
@@ -0,0 +1,257 @@
+# backend/src/tools/image_derivatives.py
+
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, Executor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageFilter, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Lado máximo que acepta el Space de FLUX.1-schnell y múltiplo requerido para las dimensiones
+MAX_MASTER_SIDE = 2048
+DIMENSION_MULTIPLE = 32
+
+# Formatos de salida soportados: extensión -> (formato PIL, opciones de guardado)
+ENCODINGS: Dict[str, Tuple[str, Dict[str, Any]]] = {
+    "webp": ("WEBP", {"method": 4}),
+    "jpeg": ("JPEG", {"optimize": True, "progressive": True}),
+}
+
+# Tamaño de la miniatura usada para elegir el recorte (el coste no depende del master)
+_SALIENCY_SIDE = 256
+
+
+def master_dimensions(sizes: Iterable[Tuple[int, int]], max_side: int = MAX_MASTER_SIDE) -> Tuple[int, int]:
+    """
+    Dimensiones del master capaz de cubrir todos los presets: el ancho máximo y el alto máximo
+    pedidos, escalados para no superar `max_side` y redondeados al múltiplo de 32 del modelo.
+    """
+    sizes = list(sizes)
+    if not sizes:
+        raise ValueError("At least one derivative size is required")
+    width = max(w for w, _ in sizes)
+    height = max(h for _, h in sizes)
+    scale = min(1.0, max_side / max(width, height))
+
+    def fit(value: float) -> int:
+        return max(DIMENSION_MULTIPLE, int(value * scale) // DIMENSION_MULTIPLE * DIMENSION_MULTIPLE)
+
+    return fit(width), fit(height)
+
+
+def _best_offset(profile: List[float], window: int) -> int:
+    """Posición de la ventana de tamaño `window` con mayor energía acumulada (sumas prefijas)."""
+    if window >= len(profile):
+        return 0
+    prefix = [0.0]
+    for value in profile:
+        prefix.append(prefix[-1] + value)
+    best, best_offset = -1.0, 0
+    for offset in range(len(profile) - window + 1):
+        energy = prefix[offset + window] - prefix[offset]
+        if energy > best:
+            best, best_offset = energy, offset
+    return best_offset
+
+
+def smart_crop_box(image: Image.Image, width: int, height: int) -> Tuple[int, int, int, int]:
+    """
+    Caja de recorte con la relación de aspecto width:height que conserva la zona con más
+    detalle (energía de bordes) de la imagen. Solo se desliza sobre el eje que sobra.
+    """
+    src_w, src_h = image.size
+    target_ratio = width / height
+    if abs(src_w / src_h - target_ratio) < 1e-3:
+        return 0, 0, src_w, src_h
+
+    thumb = image.convert("L")
+    thumb.thumbnail((_SALIENCY_SIDE, _SALIENCY_SIDE))
+    edges = thumb.filter(ImageFilter.FIND_EDGES)
+    t_w, t_h = edges.size
+    scale = src_w / t_w
+
+    if src_w / src_h > target_ratio:
+        # Sobra ancho: elegir la franja vertical con más energía
+        crop_w = int(round(src_h * target_ratio))
+        profile = list(edges.resize((t_w, 1), Image.Resampling.BOX).tobytes())  # Energía media por columna
+        offset = int(_best_offset(profile, max(1, int(crop_w / scale))) * scale)
+        offset = min(offset, src_w - crop_w)
+        return offset, 0, offset + crop_w, src_h
+
+    # Sobra alto: elegir la franja horizontal con más energía
+    crop_h = int(round(src_w / target_ratio))
+    profile = list(edges.resize((1, t_h), Image.Resampling.BOX).tobytes())  # Energía media por fila
+    offset = int(_best_offset(profile, max(1, int(crop_h / scale))) * scale)
+    offset = min(offset, src_h - crop_h)
+    return 0, offset, src_w, offset + crop_h
+
+
+def render_derivative(master_path: str, out_path: str, width: int, height: int,
+                      encoding: str = "webp", quality: int = 85) -> Dict[str, Any]:
+    """
+    Genera un derivado: recorte inteligente + redimensionado + codificación. Función de nivel
+    de módulo para poder ejecutarse en un proceso del pool. Escribe de forma atómica.
+    """
+    pil_format, save_options = ENCODINGS[encoding]
+    with Image.open(master_path) as master:
+        image = ImageOps.exif_transpose(master)
+        box = smart_crop_box(image, width, height)
+        derivative = image.crop(box).resize((width, height), Image.Resampling.LANCZOS)
+        if pil_format == "JPEG" and derivative.mode not in ("RGB", "L"):
+            derivative = derivative.convert("RGB")
+        # Temporal único: dos renders del mismo derivado (procesos o hilos) no se pisan
+        tmp_path = f"{out_path}.{os.getpid()}-{uuid.uuid4().hex}.tmp"
+        try:
+            derivative.save(tmp_path, format=pil_format, quality=quality, **save_options)
+            os.replace(tmp_path, out_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return {"width": width, "height": height, "crop_box": list(box), "bytes": os.path.getsize(out_path)}
+
+
+# --- Pool de procesos compartido por el proceso ---
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Pool de procesos perezoso y compartido (env IMAGE_DERIVATIVE_WORKERS, por defecto nº de CPUs).
+    Los procesos se crean con 'spawn': hacer fork de un proceso con hilos (servidor, clientes
+    Gradio, pools) puede heredar locks tomados y colgar al hijo.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            if max_workers is None:
+                try:
+                    max_workers = int(os.getenv('IMAGE_DERIVATIVE_WORKERS', 0)) or None
+                except ValueError:
+                    logger.warning("Invalid IMAGE_DERIVATIVE_WORKERS in .env, using the CPU count")
+                    max_workers = None
+            _process_pool = ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        return _process_pool
+
+
+def _reset_process_pool() -> None:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+class DerivativePipeline:
+    """
+    Produce todas las variantes de formato a partir de una única imagen master.
+
+    Los derivados se escriben en `save_dir` como `<master>__<preset>.<ext>` y un manifiesto
+    `<master>.manifest.json` enlaza cada derivado con su master (prompt, semilla, recorte).
+    El trabajo de imagen se reparte en un pool de procesos; si el pool no está disponible
+    se hace en el propio proceso.
+    """
+
+    def __init__(self, save_dir: pathlib.Path, executor: Optional[Executor] = None,
+                 encoding: str = "webp", quality: int = 85):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unsupported encoding '{encoding}'. Use one of: {', '.join(ENCODINGS)}")
+        self.save_dir = pathlib.Path(save_dir)
+        self.executor = executor
+        self.encoding = encoding
+        self.quality = quality
+
+    def manifest_path(self, master_filename: str) -> pathlib.Path:
+        return self.save_dir / f"{pathlib.Path(master_filename).stem}.manifest.json"
+
+    def derive(self, master_filename: str, presets: Dict[str, Tuple[int, int]],
+               master_info: Optional[Dict[str, Any]] = None,
+               encoding: Optional[str] = None, force: bool = False) -> Dict[str, Any]:
+        """
+        Genera un derivado por preset ({nombre: (ancho, alto)}) a partir de
+        `save_dir/master_filename` y escribe el manifiesto. Devuelve el manifiesto.
+        Con `force` se regeneran aunque ya existan (el master cambió: vista previa refinada).
+        """
+        encoding = encoding or self.encoding
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unsupported encoding '{encoding}'. Use one of: {', '.join(ENCODINGS)}")
+        master_path = self.save_dir / master_filename
+        if not master_path.exists():
+            raise FileNotFoundError(f"Master image not found: {master_path}")
+
+        existing = None if force else self._reusable_manifest(master_filename, presets, encoding)
+        if existing is not None:
+            logger.info(f"Derivatives of {master_filename} already up to date, reusing manifest")
+            return existing
+
+        stem = master_path.stem
+        jobs = []
+        for preset, (width, height) in presets.items():
+            filename = f"{stem}__{preset}.{'jpg' if encoding == 'jpeg' else encoding}"
+            jobs.append((preset, filename, (str(master_path), str(self.save_dir / filename),
+                                            width, height, encoding, self.quality)))
+
+        rendered = self._render_all([args for _, _, args in jobs])
+        derivatives = []
+        for (preset, filename, _), info in zip(jobs, rendered):
+            derivatives.append({
+                "preset": preset,
+                "filename": filename,
+                "url": f"/generated_images/{filename}",
+                "encoding": encoding,
+                **info,
+            })
+
+        manifest = {
+            "master": {"filename": master_filename, "url": f"/generated_images/{master_filename}",
+                       **(master_info or {})},
+            "derivatives": derivatives,
+        }
+        manifest_path = self.manifest_path(master_filename)
+        tmp_path = manifest_path.with_suffix(f".json.{os.getpid()}-{uuid.uuid4().hex}.tmp")
+        tmp_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, manifest_path)
+        logger.info(f"Created {len(derivatives)} derivatives of {master_filename} (manifest: {manifest_path.name})")
+        return manifest
+
+    def _reusable_manifest(self, master_filename: str, presets: Dict[str, Tuple[int, int]],
+                           encoding: str) -> Optional[Dict[str, Any]]:
+        """Manifiesto existente si ya contiene exactamente estos derivados (p. ej. master servido desde la caché)."""
+        path = self.manifest_path(master_filename)
+        try:
+            manifest = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        derivatives = {d.get("preset"): d for d in manifest.get("derivatives", [])}
+        for preset, (width, height) in presets.items():
+            derivative = derivatives.get(preset)
+            if (derivative is None or derivative.get("encoding") != encoding
+                    or (derivative.get("width"), derivative.get("height")) != (width, height)
+                    or not (self.save_dir / derivative["filename"]).exists()):
+                return None
+        manifest["derivatives"] = [derivatives[preset] for preset in presets]
+        return manifest
+
+    def _render_all(self, jobs: List[Tuple]) -> List[Dict[str, Any]]:
+        if len(jobs) <= 1:
+            return [render_derivative(*args) for args in jobs]
+        executor = self.executor or get_process_pool()
+        try:
+            futures = [executor.submit(render_derivative, *args) for args in jobs]
+            return [future.result() for future in futures]
+        except (BrokenProcessPool, OSError, RuntimeError) as e:
+            # Sin procesos disponibles (sandbox, pool roto): hacerlo en este proceso
+            logger.warning(f"Process pool unavailable for derivatives ({e}), rendering in-process")
+            if self.executor is None:
+                _reset_process_pool()
+            return [render_derivative(*args) for args in jobs]
@@ -0,0 +1,356 @@
+# backend/src/tools/image_store.py
+
+import errno
+import hashlib
+import logging
+import os
+import pathlib
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Extensiones de imagen que la GC puede considerar al limpiar archivos no indexados
+IMAGE_SUFFIXES = (".webp", ".jpg", ".jpeg", ".png")
+
+
+def file_sha256(path: pathlib.Path, chunk_size: int = 1024 * 1024) -> str:
+    """Calcula el sha256 del contenido de un archivo."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_size(value: str) -> int:
+    """'500M', '2G', '1048576' -> bytes."""
+    value = value.strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+class ImageStore:
+    """
+    Almacén de imágenes direccionado por contenido para `save_dir` (output/images).
+
+    - Los archivos se nombran `<sha256><ext>` y llegan a su sitio por rename/hardlink atómico
+      (copia a un temporal + rename solo si el origen está en otro sistema de archivos).
+    - Un índice SQLite (`image_store.sqlite3`) guarda los blobs (tamaño, último acceso) y un
+      manifiesto de imágenes (prompt, formato, semilla, dimensiones, generation_id -> blob),
+      así que listar o buscar nunca recorre el directorio.
+    - Los derivados (ver image_derivatives) se registran con su master como `parent`; al
+      borrar un master por la GC se borran también sus derivados y su manifiesto.
+    - `gc()` aplica cuotas de tamaño total (LRU) y de antigüedad; `max_bytes` también se
+      aplica automáticamente tras cada inserción. Los blobs fijados con `pin` (p. ej. una
+      vista previa cuyo render final sigue en curso) no se borran hasta `unpin`.
+    """
+
+    def __init__(self, save_dir: pathlib.Path, max_bytes: Optional[int] = None,
+                 max_age_seconds: Optional[float] = None, index_name: str = "image_store.sqlite3"):
+        self.save_dir = pathlib.Path(save_dir)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.save_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._pinned: Dict[str, int] = {}
+        self._conn = sqlite3.connect(str(self.save_dir / index_name), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " blob TEXT PRIMARY KEY, size INTEGER NOT NULL, parent TEXT,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, blob TEXT NOT NULL, kind TEXT NOT NULL DEFAULT 'image',"
+            " prompt TEXT, format TEXT, seed INTEGER, width INTEGER, height INTEGER,"
+            " generation_id TEXT, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_parent ON blobs(parent)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_images_blob ON images(blob)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_images_generation ON images(generation_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_images_created ON images(created_at)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Conexión al índice, para índices auxiliares que viven en la misma base (ej. ImageCache)."""
+        return self._conn
+
+    @property
+    def lock(self) -> threading.RLock:
+        return self._lock
+
+    # --- Escritura ---
+
+    def _copy_into(self, source: pathlib.Path, target: pathlib.Path) -> None:
+        """Copia `source` sobre `target` vía temporal + rename (sustituye el archivo existente)."""
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copy2(source, tmp)
+        os.replace(tmp, target)
+
+    def _place(self, source: pathlib.Path, target: pathlib.Path, move: bool) -> None:
+        """Coloca `source` en `target` de forma atómica: rename (move) o hardlink (sin move)."""
+        try:
+            if move:
+                os.replace(source, target)
+            else:
+                os.link(source, target)
+            return
+        except FileExistsError:
+            return # Mismo contenido ya presente (otro hilo lo colocó antes)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+        # Otro sistema de archivos (o sin soporte de hardlinks): copia a temporal + rename
+        self._copy_into(source, target)
+        if move:
+            source.unlink(missing_ok=True)
+
+    def ingest(self, source_path: pathlib.Path, suffix: str = ".webp", move: bool = True,
+               parent: Optional[str] = None, name: Optional[str] = None) -> str:
+        """
+        Añade un archivo al almacén por hash de contenido y devuelve su nombre de blob.
+        Con `move=True` el origen se consume (rename); si el contenido ya existe se descarta.
+        Con `name` se guarda con ese nombre estable en lugar del hash: es el caso de las
+        imágenes cuyo contenido se sustituye después (ver `replace`).
+        """
+        source_path = pathlib.Path(source_path)
+        blob = name or f"{file_sha256(source_path)}{suffix}"
+        target = self.save_dir / blob
+        if name:
+            if move:
+                self._place(source_path, target, move=True)
+            else:
+                self._copy_into(source_path, target)
+        elif target.exists():
+            if move and source_path.resolve() != target.resolve():
+                source_path.unlink(missing_ok=True)
+        else:
+            self._place(source_path, target, move)
+        self.register(blob, parent=parent)
+        return blob
+
+    def replace(self, blob: str, source_path: pathlib.Path, seed: Optional[int] = None,
+                width: Optional[int] = None, height: Optional[int] = None, kind: str = "image",
+                move: bool = True) -> None:
+        """
+        Sustituye de forma atómica el contenido de `blob` (guardado con nombre estable) por
+        `source_path`: quien lee la URL ve el archivo anterior o el nuevo, nunca uno a medias.
+        Actualiza el tamaño del blob y sus entradas del manifiesto (semilla, dimensiones, tipo).
+        """
+        source_path, target = pathlib.Path(source_path), self.save_dir / blob
+        if move:
+            self._place(source_path, target, move=True) # os.replace sobrescribe el destino
+        else:
+            self._copy_into(source_path, target)
+        self.register(blob)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE images SET kind = ?, seed = COALESCE(?, seed), width = COALESCE(?, width),"
+                " height = COALESCE(?, height) WHERE blob = ?",
+                (kind, seed, width, height, blob),
+            )
+
+    def register(self, blob: str, parent: Optional[str] = None) -> None:
+        """Indexa un archivo que ya está en `save_dir` (p. ej. un derivado escrito en su sitio)."""
+        size = (self.save_dir / blob).stat().st_size
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM blobs WHERE blob = ?", (blob,)).fetchone()
+            self._conn.execute(
+                "INSERT INTO blobs (blob, size, parent, created_at, last_access) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(blob) DO UPDATE SET size = excluded.size, last_access = excluded.last_access,"
+                " parent = COALESCE(excluded.parent, blobs.parent)",
+                (blob, size, parent, now, now),
+            )
+            self._total_bytes += size - (previous["size"] if previous else 0)
+            if self.max_bytes and self._total_bytes > self.max_bytes:
+                self._collect(max_bytes=self.max_bytes, keep={blob, parent})
+
+    def add_record(self, blob: str, prompt: Optional[str] = None, image_format: Optional[str] = None,
+                   seed: Optional[int] = None, width: Optional[int] = None, height: Optional[int] = None,
+                   generation_id: Optional[str] = None, kind: str = "image") -> int:
+        """Añade una entrada al manifiesto de imágenes. Devuelve su id."""
+        with self._lock:
+            return self._conn.execute(
+                "INSERT INTO images (blob, kind, prompt, format, seed, width, height, generation_id, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (blob, kind, prompt, image_format, seed, width, height, generation_id, time.time()),
+            ).lastrowid
+
+    def put(self, source_path: pathlib.Path, prompt: Optional[str] = None, image_format: Optional[str] = None,
+            seed: Optional[int] = None, width: Optional[int] = None, height: Optional[int] = None,
+            generation_id: Optional[str] = None, suffix: str = ".webp", move: bool = True,
+            name: Optional[str] = None, kind: str = "image") -> str:
+        """`ingest` + `add_record` en una sola llamada. Devuelve el nombre de blob."""
+        blob = self.ingest(source_path, suffix=suffix, move=move, name=name)
+        self.add_record(blob, prompt, image_format, seed, width, height, generation_id, kind=kind)
+        return blob
+
+    # --- Lectura ---
+
+    def contains(self, blob: str) -> bool:
+        """True si el blob está indexado y su archivo existe (si falta, se limpia el índice)."""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM blobs WHERE blob = ?", (blob,)).fetchone()
+            if row is None:
+                return False
+            if (self.save_dir / blob).exists():
+                return True
+            logger.warning(f"Stored image {blob} missing on disk, dropping index entries.")
+            self._forget(blob)
+            return False
+
+    def touch(self, blob: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE blobs SET last_access = ? WHERE blob = ?", (time.time(), blob))
+
+    def find(self, generation_id: Optional[str] = None, prompt: Optional[str] = None,
+             image_format: Optional[str] = None, kind: Optional[str] = None,
+             limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Busca en el manifiesto (más recientes primero). `prompt` filtra por subcadena."""
+        query = "SELECT images.*, blobs.size FROM images JOIN blobs ON blobs.blob = images.blob"
+        conditions, params = [], []
+        if generation_id is not None:
+            conditions.append("images.generation_id = ?")
+            params.append(generation_id)
+        if prompt:
+            conditions.append("images.prompt LIKE ?")
+            params.append(f"%{prompt}%")
+        if image_format:
+            conditions.append("images.format = ?")
+            params.append(image_format)
+        if kind:
+            conditions.append("images.kind = ?")
+            params.append(kind)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY images.created_at DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [{**dict(row), "url": f"/generated_images/{row['blob']}"} for row in rows]
+
+    # --- Retención / GC ---
+
+    def pin(self, blob: str) -> None:
+        """Protege `blob` (y sus derivados) de la GC hasta el `unpin` correspondiente."""
+        with self._lock:
+            self._pinned[blob] = self._pinned.get(blob, 0) + 1
+
+    def unpin(self, blob: str) -> None:
+        with self._lock:
+            count = self._pinned.get(blob, 0) - 1
+            if count > 0:
+                self._pinned[blob] = count
+            else:
+                self._pinned.pop(blob, None)
+
+    def _forget(self, blob: str) -> int:
+        """Borra un blob, sus derivados y sus entradas del índice. Devuelve los bytes liberados."""
+        freed = 0
+        for child in self._conn.execute("SELECT blob FROM blobs WHERE parent = ?", (blob,)).fetchall():
+            freed += self._forget(child["blob"])
+        row = self._conn.execute("SELECT size FROM blobs WHERE blob = ?", (blob,)).fetchone()
+        self._conn.execute("DELETE FROM blobs WHERE blob = ?", (blob,))
+        self._conn.execute("DELETE FROM images WHERE blob = ?", (blob,))
+        if row:
+            self._total_bytes -= row["size"]
+            freed += row["size"]
+        try:
+            (self.save_dir / blob).unlink(missing_ok=True)
+            # Manifiesto de derivados del master, si lo tiene
+            (self.save_dir / f"{pathlib.Path(blob).stem}.manifest.json").unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Could not remove stored image {blob}: {e}")
+        return freed
+
+    def _collect(self, max_bytes: Optional[int] = None, max_age_seconds: Optional[float] = None,
+                 keep: Optional[set] = None) -> Dict[str, int]:
+        keep = set(keep or ()) | set(self._pinned)
+        removed, freed = 0, 0
+        if max_age_seconds:
+            cutoff = time.time() - max_age_seconds
+            for row in self._conn.execute(
+                    "SELECT blob FROM blobs WHERE last_access < ? AND parent IS NULL", (cutoff,)).fetchall():
+                if row["blob"] not in keep:
+                    freed += self._forget(row["blob"])
+                    removed += 1
+        if max_bytes is not None and self._total_bytes > max_bytes:
+            # LRU sobre los masters/imágenes sueltas; los derivados caen con su master
+            for row in self._conn.execute(
+                    "SELECT blob FROM blobs WHERE parent IS NULL ORDER BY last_access ASC").fetchall():
+                if self._total_bytes <= max_bytes:
+                    break
+                if row["blob"] in keep:
+                    continue
+                freed += self._forget(row["blob"])
+                removed += 1
+        if removed:
+            logger.info(f"Image store GC removed {removed} images ({freed} bytes), {self._total_bytes} bytes in use.")
+        return {"removed": removed, "freed_bytes": freed}
+
+    def gc(self, max_bytes: Optional[int] = None, max_age_seconds: Optional[float] = None,
+           include_untracked: bool = False) -> Dict[str, int]:
+        """
+        Aplica las cuotas (por defecto las del almacén). Con `include_untracked` también borra
+        archivos de imagen de `save_dir` que no están en el índice y superan la antigüedad máxima.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age_seconds = self.max_age_seconds if max_age_seconds is None else max_age_seconds
+        with self._lock:
+            result = self._collect(max_bytes=max_bytes, max_age_seconds=max_age_seconds)
+            untracked = 0
+            if include_untracked and max_age_seconds:
+                cutoff = time.time() - max_age_seconds
+                indexed = {row["blob"] for row in self._conn.execute("SELECT blob FROM blobs").fetchall()}
+                for path in self.save_dir.iterdir():
+                    if (path.is_file() and path.suffix.lower() in IMAGE_SUFFIXES
+                            and path.name not in indexed and path.stat().st_mtime < cutoff):
+                        result["freed_bytes"] += path.stat().st_size
+                        path.unlink(missing_ok=True)
+                        untracked += 1
+            result["untracked_removed"] = untracked
+            result["size_bytes"] = self._total_bytes
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            blobs = self._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+            images = self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+        return {
+            'blobs': blobs,
+            'images': images,
+            'size_bytes': self._total_bytes,
+            'max_bytes': self.max_bytes,
+            'max_age_seconds': self.max_age_seconds,
+        }
+
+
+def store_from_env(save_dir: pathlib.Path) -> ImageStore:
+    """
+    ImageStore configurado desde el entorno: IMAGE_STORE_MAX_BYTES (ej. '2G', por defecto
+    IMAGE_CACHE_MAX_BYTES o 2 GiB; '0' = sin límite) e IMAGE_STORE_MAX_AGE_DAYS (sin límite por defecto).
+    """
+    max_bytes_env = os.getenv('IMAGE_STORE_MAX_BYTES') or os.getenv('IMAGE_CACHE_MAX_BYTES') or str(2 * 1024 ** 3)
+    try:
+        max_bytes = parse_size(max_bytes_env) or None
+    except ValueError:
+        logger.warning(f"Invalid IMAGE_STORE_MAX_BYTES '{max_bytes_env}', using 2 GiB")
+        max_bytes = 2 * 1024 ** 3
+    max_age_seconds = None
+    if os.getenv('IMAGE_STORE_MAX_AGE_DAYS'):
+        try:
+            max_age_seconds = float(os.getenv('IMAGE_STORE_MAX_AGE_DAYS')) * 86400
+        except ValueError:
+            logger.warning("Invalid IMAGE_STORE_MAX_AGE_DAYS in .env, ignoring it")
+    return ImageStore(save_dir, max_bytes=max_bytes, max_age_seconds=max_age_seconds)
@@ -0,0 +1,280 @@
+"""
+Near-duplicate topic index: finds a previous generation whose topic is close enough to a
+new one that its draft can be reused ("AI LLMs", "LLMs in AI", "large language models (AI)").
+
+Topics are embedded locally with a hashing vectorizer (no model, no network): stemmed words
+and character trigrams (typos), L2-normalized into a fixed-size float32 matrix. A lookup
+gathers the candidate rows from an inverted index on words and scores them with one
+vectorized NumPy cosine, so its cost depends on the candidates, not on the size of the
+index (sub-millisecond with hundreds of thousands of topics). Acronyms are matched by
+contraction ("large language models" <-> "LLMs", see `TopicIndex`).
+
+The index is an append-only NDJSON log next to the generation history
+(`topic_index.ndjson`), re-vectorized on load; it is backfilled from the history the first
+time it is created.
+"""
+import functools
+import itertools
+import json
+import logging
+import os
+import pathlib
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIM = 128
+# Rows scored per lookup. Postings are taken rarest word first, so very common words ("ai")
+# only add candidates when the rarer words of the query have few
+MAX_CANDIDATES = 1024
+# Spelled-out topics re-scored per lookup when the query uses their acronym
+MAX_ACRONYM_RESCORES = 32
+# Whole words dominate the vectors; character trigrams absorb typos and inflections
+WORD_WEIGHT = 1.0
+TRIGRAM_WEIGHT = 0.3
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_STOPWORDS = frozenset("""
+a an and are as at by for from how in into is of on or the to vs what why with about
+al con de del el en la las los para por sobre un una y
+""".split())
+
+
+def _normalize(text: str) -> str:
+    text = text.lower()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _stem(word: str) -> str:
+    # Plural folding is enough for topics ("models" == "model", "LLMs" == "LLM")
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def topic_words(topic: str) -> List[str]:
+    """Stemmed content words of a topic."""
+    return [_stem(w) for w in _TOKEN_RE.findall(_normalize(topic)) if w not in _STOPWORDS]
+
+
+def topic_key(topic: str) -> str:
+    """Normalized form of a topic; topics with the same key are exact duplicates (same words, any order)."""
+    return " ".join(sorted(topic_words(topic)))
+
+
+def acronyms(words: List[str]) -> List[Tuple[str, int, int]]:
+    """(initials, start, size) of every run of 2-4 consecutive words ("large language model" -> "llm")."""
+    found = []
+    for start in range(len(words) - 1):
+        initials = ""
+        for size in range(1, min(4, len(words) - start) + 1):
+            word = words[start + size - 1]
+            if len(word) <= 2:  # "AI LLM" has no meaningful initials
+                break
+            initials += word[0]
+            if size > 1:
+                found.append((initials, start, size))
+    return found
+
+
+def contract(words: List[str], acronym: str) -> Optional[List[str]]:
+    """The words with the first run abbreviated by `acronym` replaced by it, or None if there is none."""
+    for initials, start, size in acronyms(words):
+        if initials == acronym:
+            return words[:start] + [acronym] + words[start + size:]
+    return None
+
+
+def _hash(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8"))
+
+
+class TopicVectorizer:
+    """Hashing vectorizer for short topics (stemmed words + character trigrams, L2-normalized)."""
+
+    def __init__(self, dim: int = DEFAULT_DIM):
+        self.dim = dim
+        # Hashed features per word: topics share a small vocabulary, so each word is hashed once
+        self._word_features = functools.lru_cache(maxsize=65536)(self._features)
+
+    def _features(self, word: str) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+        padded = f"#{word}#"
+        trigrams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+        indices = [_hash("w:" + word) % self.dim] + [_hash("c:" + t) % self.dim for t in trigrams]
+        return tuple(indices), (WORD_WEIGHT,) + (TRIGRAM_WEIGHT,) * len(trigrams)
+
+    def transform_words(self, words: List[str]) -> np.ndarray:
+        indices, weights = [], []
+        for word in words:
+            word_indices, word_weights = self._word_features(word)
+            indices.extend(word_indices)
+            weights.extend(word_weights)
+        vector = np.bincount(indices, weights, minlength=self.dim).astype(np.float32) if indices \
+            else np.zeros(self.dim, dtype=np.float32)
+        norm = float(np.sqrt(vector @ vector))
+        return vector / norm if norm else vector
+
+    def transform(self, topic: str) -> np.ndarray:
+        return self.transform_words(topic_words(topic))
+
+
+class TopicIndex:
+    """
+    In-memory topic index (optionally persisted to an NDJSON log). `search` returns the
+    closest indexed topic as {'generation_id', 'topic', 'score'} or None; `add` indexes the
+    topic of a finished generation. Thread-safe.
+
+    Candidates are the topics sharing a word with the query. Acronyms are matched in both
+    directions by contraction: a spelled-out query ("large language models") is also scored
+    as "llm" when "llm" is an indexed word, and indexed spelled-out topics are re-scored in
+    contracted form when the query uses their acronym.
+    """
+
+    def __init__(self, path: Optional[Union[str, pathlib.Path]] = None, dim: int = DEFAULT_DIM):
+        self.path = pathlib.Path(path) if path else None
+        self.vectorizer = TopicVectorizer(dim)
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((1024, dim), dtype=np.float32)
+        self._size = 0
+        self._generation_ids: List[str] = []
+        self._topics: List[str] = []
+        self._words: List[Tuple[str, ...]] = []
+        self._rows: Dict[str, int] = {}
+        self._exact: Dict[str, int] = {}
+        self._word_postings: Dict[str, List[int]] = {}
+        self._acronym_postings: Dict[str, List[int]] = {}
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _load(self) -> None:
+        started = time.perf_counter()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line after a crash
+                self._add(entry["topic"], entry["generation_id"])
+        logger.info(f"Topic index loaded: {self._size} topics in {time.perf_counter() - started:.2f}s")
+
+    def _add(self, topic: str, generation_id: str) -> bool:
+        words = topic_words(topic)
+        if generation_id in self._rows or not words:
+            return False
+        if self._size == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+        row = self._size
+        self._vectors[row] = self.vectorizer.transform_words(words)
+        self._generation_ids.append(generation_id)
+        self._topics.append(topic)
+        self._words.append(tuple(words))
+        self._rows[generation_id] = row
+        self._exact[" ".join(sorted(words))] = row  # The newest generation wins
+        for word in dict.fromkeys(words):
+            self._word_postings.setdefault(word, []).append(row)
+        for initials in dict.fromkeys(initials for initials, _, _ in acronyms(words)):
+            self._acronym_postings.setdefault(initials, []).append(row)
+        self._size += 1
+        return True
+
+    def add(self, topic: str, generation_id: str) -> None:
+        """Indexes a generation's topic (once per generation_id) and appends it to the log."""
+        with self._lock:
+            if not self._add(topic, generation_id) or self.path is None:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"topic": topic, "generation_id": generation_id, "added_at": time.time()},
+                                   ensure_ascii=False) + "\n")
+
+    def search(self, topic: str, exclude: Iterable[str] = ()) -> Optional[Dict[str, Any]]:
+        """Closest indexed topic (newest on ties) with its cosine similarity, or None if none shares a word."""
+        words = topic_words(topic)
+        if not words:
+            return None
+        with self._lock:
+            excluded = {self._rows[generation_id] for generation_id in exclude if generation_id in self._rows}
+            exact = self._exact.get(" ".join(sorted(words)))
+            if exact is not None and exact not in excluded:
+                return self._match(exact, 1.0)
+            queries = [words]
+            keys = [w for w in dict.fromkeys(words) if w in self._word_postings]
+            for initials, _, _ in acronyms(words):
+                if initials in self._word_postings:  # Query spells out an indexed acronym
+                    queries.append(contract(words, initials))
+                    keys.append(initials)
+            # Rarest keys first: the newest topics of each until MAX_CANDIDATES rows are gathered
+            postings, gathered = [], 0
+            for key in sorted(keys, key=lambda k: len(self._word_postings[k])):
+                if gathered >= MAX_CANDIDATES:
+                    break
+                posting = self._word_postings[key][-(MAX_CANDIDATES - gathered):]
+                postings.append(posting)
+                gathered += len(posting)
+            query_matrix = np.stack([self.vectorizer.transform_words(q) for q in queries])
+            best_row, best_score = -1, -1.0
+            if postings:
+                candidates = np.fromiter(itertools.chain.from_iterable(postings), dtype=np.int64)
+                scores = (self._vectors[candidates] @ query_matrix.T).max(axis=1)
+                if excluded:
+                    scores[np.isin(candidates, list(excluded))] = -1.0
+                # Newest first on ties: postings are in insertion order, so take the last maximum
+                position = len(scores) - 1 - int(np.argmax(scores[::-1]))
+                best_row, best_score = int(candidates[position]), float(scores[position])
+            for word in words:  # Query uses the acronym of indexed spelled-out topics
+                if not 2 <= len(word) <= 5:
+                    continue
+                rows = [row for row in self._acronym_postings.get(word, [])[-MAX_ACRONYM_RESCORES:]
+                        if row not in excluded]
+                if not rows:
+                    continue
+                contracted = np.stack([self.vectorizer.transform_words(contract(list(self._words[row]), word))
+                                       for row in rows])
+                scores = (contracted @ query_matrix.T).max(axis=1)
+                position = int(np.argmax(scores))
+                if scores[position] > best_score:
+                    best_row, best_score = rows[position], float(scores[position])
+            return self._match(best_row, best_score) if best_row >= 0 and best_score > 0 else None
+
+    def _match(self, row: int, score: float) -> Dict[str, Any]:
+        return {"generation_id": self._generation_ids[row], "topic": self._topics[row], "score": round(min(score, 1.0), 4)}
+
+
+def build_topic_index_from_env(generation_store) -> Optional[TopicIndex]:
+    """
+    Builds the topic index for draft reuse from environment variables:
+      TOPIC_REUSE=on (default) | off, TOPIC_INDEX_PATH (default: topic_index.ndjson in the
+      generation store directory). Reuse needs the generation history (the cached drafts).
+    """
+    if generation_store is None or os.getenv("TOPIC_REUSE", "on").lower() in ("", "off", "none", "false", "0"):
+        return None
+    path = pathlib.Path(os.getenv("TOPIC_INDEX_PATH", str(generation_store.root / "topic_index.ndjson")))
+    try:
+        backfill = not path.exists()
+        index = TopicIndex(path)
+        if backfill:
+            # First run with an existing history: index its successful generations (oldest first)
+            records = list(generation_store.iter_records(status="success", include_blobs=False))
+            for record in reversed(records):
+                index.add(record["topic"], record["id"])
+            if records:
+                logger.info(f"Topic index backfilled with {len(index)} topics from the generation history")
+        return index
+    except (OSError, ValueError) as e:
+        logger.error(f"Error initializing the topic index, draft reuse disabled: {e}")
+        return None
@@ -3,8 +3,7 @@ import os
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
-import uuid # To generate unique IDs for runs
-import time # To simulate some delay if needed and for unique IDs
+import time # Polling interval of the background runs
 
 # Import the Mininos class from your existing crew script
 # Ensure the script can find the 'src' directory.
@@ -14,113 +13,207 @@ import time # To simulate some delay if needed and for unique IDs
 # If issues arise, might need sys.path manipulation, but let's try this first.
 try:
     from src.crew import Mininos
+    from src.app_runs import AppRunPool
+    from src.jobs import JOB_DONE, JOB_CANCELLED, FINISHED_STATES
+    from src.logging_setup import configure_logging
 except ImportError:
     # If the direct import fails, try adding the backend directory to the path
     import sys
     sys.path.insert(0, str(Path(__file__).parent))
     from src.crew import Mininos
+    from src.app_runs import AppRunPool
+    from src.jobs import JOB_DONE, JOB_CANCELLED, FINISHED_STATES
+    from src.logging_setup import configure_logging
 
 # --- Basic Configuration ---
 # Load environment variables from .env file in the backend directory
 dotenv_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=dotenv_path)
 
-# Setup logging (optional but good practice)
-log_dir = Path(__file__).parent / "src" / "logs"
-log_dir.mkdir(exist_ok=True)
-log_file = log_dir / "streamlit_crew.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(log_file)
-    ]
-)
+# Setup logging: queued, redacted, rotating JSON log (once per process, reruns reuse it; see src.logging_setup)
+log_file = Path(__file__).parent / "src" / "logs" / "streamlit_crew.log"
+configure_logging(log_file=os.getenv('LOG_FILE', str(log_file)))
 logger = logging.getLogger(__name__)
 
-# --- Streamlit UI ---
-st.set_page_config(page_title="MewAI Crew Execution", layout="wide")
-st.title("🐱 MewAI Crew Execution Interface")
-st.markdown("Enter a topic and kick off the CrewAI agents to generate content.")
+# How often the page polls the progress of its active runs
+POLL_SECONDS = 0.5
+
+# --- Shared Resources ---
+# Built once per process and reused by every rerun and browser session
+@st.cache_resource(show_spinner="Setting up the crew (LLM, image generator)...")
+def get_crew_template() -> Mininos:
+    """LLM, Gradio client and compiled configurations shared by every run (see Mininos.spawn)."""
+    return Mininos(topic=None)
 
-# --- Input Section ---
-topic = st.text_input("Enter the topic for the crew:", value=os.getenv('TOPIC', 'AI LLMs'))
 
-# --- Progress Display Area ---
-# Using st.status for cleaner progress updates
-status_placeholder = st.status("Waiting for kickoff...", expanded=False)
+@st.cache_resource
+def get_run_pool() -> AppRunPool:
+    """Background workers for the crew runs (env STREAMLIT_MAX_RUNS runs side by side)."""
+    try:
+        max_runs = int(os.getenv('STREAMLIT_MAX_RUNS', 2))
+    except ValueError:
+        logger.warning("Invalid STREAMLIT_MAX_RUNS in .env, using default 2")
+        max_runs = 2
+    return AppRunPool(get_crew_template(), max_workers=max_runs)
 
-# --- Results Display Area ---
-st.subheader("Crew Results")
-results_placeholder = st.empty() # Placeholder for final results
 
 # --- Callback Function for Progress ---
-# This function will be passed to the Mininos class
-# It needs to update Streamlit elements
+# Runs in the worker thread of each run (no Streamlit calls here): the pool then puts the
+# event in the run's queue, which the script drains on its next poll
 def streamlit_progress_callback(generation_id: str, progress_info: dict):
-    """Updates Streamlit UI based on progress info from Mininos."""
-    message = progress_info.get("message", "Processing...")
-    progress = progress_info.get("progress") # Percentage (optional)
+    """Logs progress info from Mininos (token deltas are only shown live, not logged)."""
+    if progress_info.get("event") == "token_delta":
+        return
+    logger.info(f"[{generation_id}] Progress: {progress_info.get('message', 'Processing...')} "
+                f"({progress_info.get('progress')}%)")
+
+
+def apply_progress(view: dict, progress_info: dict):
+    """Folds a progress event of a run into its display state (script thread)."""
+    if progress_info.get("event") == "status":
+        return
+    # Token deltas: the current LLM output growing live
+    if progress_info.get("event") == "token_delta":
+        if progress_info.get("stream_id") != view["stream_id"]:
+            view.update(stream_id=progress_info.get("stream_id"), live="", live_task=progress_info.get("task"))
+        view["live"] += progress_info.get("delta", "")
+    # Progressive images: the preview shows up at once and its full-quality render replaces it
+    # (possibly after the run finished: the render does not hold up the crew)
+    if progress_info.get("event") in ("image_preview", "image_refined"):
+        view["images"][progress_info["filename"]] = {
+            "path": progress_info["path"], "caption": progress_info.get("prompt"),
+            "final": progress_info["event"] == "image_refined", "refining": progress_info["event"] == "image_preview"}
+    if progress_info.get("event") in ("image_refine_failed", "image_refine_cancelled"):
+        image = view["images"].get(progress_info["filename"])
+        if image is not None:
+            image["refining"] = False # The preview stays
+    if progress_info.get("message"):
+        view["message"] = progress_info["message"]
+    if progress_info.get("progress") is not None:
+        view["progress"] = progress_info["progress"]
+
+
+def show_images(view: dict):
+    """Images of a run as they arrive: previews first, replaced by their full-quality renders."""
+    if view["images"]:
+        images = list(view["images"].values())
+        st.image([image["path"] for image in images], width=320,
+                 caption=[f"{'' if image['final'] else '(preview) '}{image['caption'] or ''}" for image in images])
+
+
+def show_results(final_results: dict):
+    """Final results of a run."""
+    if final_results.get("status") == "success":
+        st.success("Crew finished successfully!")
+        st.json(final_results, expanded=False) # Display the full results dictionary
+
+        # Display specific parts more nicely
+        if final_results.get("social_media"):
+            st.subheader("Generated Social Media Content:")
+            st.write(final_results["social_media"]) # Might be dict or string
+        if final_results.get("images"):
+            st.subheader("Generated Image Info:")
+            st.write(final_results["images"]) # Path or message from tool
+    elif final_results.get("status") in ("cancelled", "timeout"):
+        # Stopped runs keep the outputs of the tasks that completed
+        st.warning(final_results.get("message", "Crew run stopped."))
+        st.json(final_results, expanded=False)
+    else:
+        st.error(f"Crew execution failed: {final_results.get('message', 'An unknown error occurred.')}")
+        st.json(final_results) # Show error details
 
-    # Update the status box
-    status_placeholder.update(label=message, state="running", expanded=True)
 
-    # Log the progress
-    logger.info(f"[{generation_id}] Progress: {message} ({progress}%)")
+# --- Streamlit UI ---
+st.set_page_config(page_title="MewAI Crew Execution", layout="wide")
+st.title("🐱 MewAI Crew Execution Interface")
+st.markdown("Enter a topic and kick off the CrewAI agents to generate content. "
+            "Runs execute in the background: you can start several and keep using the page.")
+
+try:
+    run_pool = get_run_pool()
+except Exception as e:
+    logger.error(f"Error setting up the crew: {e}", exc_info=True)
+    st.error(f"Could not set up the crew: {e}")
+    st.stop()
+
+# Runs of this browser session (newest first) and their display state
+session_runs = st.session_state.setdefault("runs", [])
+run_views = st.session_state.setdefault("run_views", {})
+
+# --- Input Section ---
+topic = st.text_input("Enter the topic for the crew:", value=os.getenv('TOPIC', 'AI LLMs'))
+stream_output = st.checkbox("Stream agent output live", value=True)
 
 # --- Button to Start Crew ---
-if st.button("🚀 Kick Off Crew!"):
+col_start, col_clear = st.columns([1, 4])
+if col_start.button("🚀 Kick Off Crew!"):
     if not topic:
         st.error("Please enter a topic before kicking off the crew.")
     else:
-        # Clear previous results
-        results_placeholder.empty()
-        status_placeholder.update(label="Initializing Crew...", state="running", expanded=True)
-
-        # Generate a unique ID for this run
-        generation_id = f"st-{uuid.uuid4()}-{int(time.time())}"
-        logger.info(f"Starting crew run with ID: {generation_id} for topic: '{topic}'")
-
-        try:
-            # Instantiate Mininos with the topic and the Streamlit callback
-            mininos_instance = Mininos(
-                topic=topic,
-                generation_id=generation_id,
-                progress_callback=streamlit_progress_callback
-            )
-
-            # Run the crew (this is a blocking call)
-            # Consider running in a thread for long tasks, but start simple
-            status_placeholder.write("Crew execution started...")
-            final_results = mininos_instance.run_crew_and_get_results()
-            status_placeholder.write("Crew execution finished.")
-
-            # Display final results
-            if final_results.get("status") == "success":
-                status_placeholder.update(label="Crew execution completed successfully!", state="complete", expanded=False)
-                results_placeholder.success("Crew finished successfully!")
-                st.json(final_results) # Display the full results dictionary
-
-                # Optionally display specific parts more nicely
-                if final_results.get("social_media"):
-                    st.subheader("Generated Social Media Content:")
-                    st.write(final_results["social_media"]) # Might be dict or string
-                if final_results.get("images"):
-                    st.subheader("Generated Image Info:")
-                    st.write(final_results["images"]) # Path or message from tool
-
+        run_id = run_pool.submit(topic, streamlit_progress_callback, stream=stream_output)
+        logger.info(f"Starting crew run with ID: {run_id} for topic: '{topic}'")
+        session_runs.insert(0, run_id)
+if col_clear.button("Clear finished runs"):
+    for run_id in list(session_runs):
+        run = run_pool.get(run_id)
+        if run is None or run["status"] in FINISHED_STATES:
+            session_runs.remove(run_id)
+            run_views.pop(run_id, None)
+
+# --- Runs Display Area ---
+st.subheader("Crew Runs")
+st.caption(f"{run_pool.active_count()} run(s) in progress or queued, up to {run_pool.max_workers} at a time.")
+if not session_runs:
+    st.info("Waiting for kickoff...")
+
+any_active = False
+for run_id in list(session_runs):
+    run = run_pool.get(run_id)
+    if run is None: # Forgotten by the pool (old finished run)
+        session_runs.remove(run_id)
+        run_views.pop(run_id, None)
+        continue
+    view = run_views.setdefault(run_id, {"message": "Queued...", "progress": None,
+                                         "stream_id": None, "live": "", "live_task": None, "images": {}})
+    for progress_info in run_pool.poll(run_id):
+        apply_progress(view, progress_info)
+
+    if run["status"] not in FINISHED_STATES:
+        any_active = True
+        with st.status(f"{run['topic']}: {view['message']}", state="running", expanded=True):
+            if view["progress"] is not None:
+                st.progress(min(max(int(view["progress"]), 0), 100))
+            if view["live"]:
+                st.markdown(f"**✍️ {view['live_task']}...**\n\n{view['live']}")
+            show_images(view)
+            if st.button("⏹ Stop", key=f"stop-{run_id}"):
+                run_pool.cancel(run_id)
+                view["message"] = "Stopping..."
+    elif run["status"] == JOB_CANCELLED:
+        with st.status(f"{run['topic']}: stopped", state="error", expanded=run_id == session_runs[0]):
+            if run["result"]:
+                show_results(run["result"])
             else:
-                error_message = final_results.get("message", "An unknown error occurred.")
-                status_placeholder.update(label=f"Crew execution failed: {error_message}", state="error", expanded=True)
-                results_placeholder.error(f"Crew execution failed: {error_message}")
-                st.json(final_results) # Show error details
-
-        except Exception as e:
-            logger.error(f"[{generation_id}] Error during Streamlit crew execution: {e}", exc_info=True)
-            status_placeholder.update(label=f"Critical error: {e}", state="error", expanded=True)
-            results_placeholder.error(f"An unexpected error occurred: {e}")
+                st.info(run["error"] or "Cancelled before start")
+    elif run["status"] == JOB_DONE:
+        with st.status(f"{run['topic']}: completed successfully!", state="complete",
+                       expanded=run_id == session_runs[0]):
+            show_images(view)
+            show_results(run["result"])
+        # Full-quality renders still running after the run: keep polling for their events
+        any_active = any_active or any(image.get("refining") for image in view["images"].values())
+    else:
+        with st.status(f"{run['topic']}: failed: {run['error']}", state="error", expanded=True):
+            if run["result"]:
+                show_results(run["result"])
+            else:
+                st.error(f"An unexpected error occurred: {run['error']}")
 
 # --- Footer or additional info ---
 st.markdown("---")
 st.markdown("Check `backend/src/logs/streamlit_crew.log` for detailed logs.")
+
+# Poll: rerun the script (cheap, the crew is cached) while this session has active runs
+if any_active:
+    time.sleep(POLL_SECONDS)
+    st.rerun()
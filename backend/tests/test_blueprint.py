@@ -0,0 +1,46 @@
+import pathlib
+
+from src.blueprint import CrewBlueprint, load_blueprint
+
+CONFIG_DIR = pathlib.Path(__file__).resolve().parent.parent / "src" / "config"
+
+AGENTS = {"writer": {"role": "Writer of {topic}"}, "reviewer": {"role": "Reviewer"}}
+
+
+def test_layout_follows_tasks_yaml():
+    tasks = {
+        "crew": {"deadline_seconds": 60},
+        "write": {"agent": "writer", "description": "Write about {topic}"},
+        "review": {"agent": "reviewer", "context": ["write"], "description": "Review"},
+    }
+    blueprint = CrewBlueprint(AGENTS, tasks)
+    assert blueprint.layout == (("write", "writer", ()), ("review", "reviewer", ("write",)))
+    assert blueprint.run_settings == {"deadline_seconds": 60}
+    assert blueprint.task_config("write", "cats") == {"description": "Write about cats"}
+    assert blueprint.agent_config("writer", "cats") == {"role": "Writer of cats"}
+
+
+def test_invalid_layout_entries_are_left_out():
+    tasks = {
+        "review": {"agent": "reviewer", "context": "write"},  # Context runs later
+        "write": {"agent": "writer"},
+        "orphan": {"agent": "nobody"},
+    }
+    assert CrewBlueprint(AGENTS, tasks).layout == (("review", "reviewer", ()), ("write", "writer", ()))
+
+
+def test_reloads_when_the_yaml_changes(tmp_path):
+    (tmp_path / "agents.yaml").write_text("writer:\n  role: Writer\n", encoding="utf-8")
+    tasks_file = tmp_path / "tasks.yaml"
+    tasks_file.write_text("write:\n  agent: writer\n", encoding="utf-8")
+    first = load_blueprint(tmp_path)
+    assert load_blueprint(tmp_path) is first
+
+    tasks_file.write_text("write:\n  agent: writer\nproofread:\n  agent: writer\n  context: [write]\n",
+                          encoding="utf-8")
+    assert load_blueprint(tmp_path).task_keys == ["write", "proofread"]
+
+
+def test_shipped_configuration_wires_every_task():
+    blueprint = load_blueprint(CONFIG_DIR)
+    assert [key for key, _, _ in blueprint.layout] == list(blueprint.tasks_config)
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from src import cancellation
+from src.cancellation import (DeadlineExceeded, RunCancelled, call_cancellable, cancel_scope, check_cancelled,
+                              deadline_scope, parse_deadline, remaining_time)
+from src.run_context import generation_context
+
+
+@pytest.fixture
+def run():
+    token = cancellation.register("gen-test")
+    with generation_context("gen-test"):
+        yield token
+    cancellation.unregister(token)
+
+
+def cancel_later(token, delay=0.05):
+    timer = threading.Timer(delay, token.cancel)
+    timer.start()
+    return timer
+
+
+def test_outside_a_run_calls_are_plain():
+    assert remaining_time() is None
+    check_cancelled()
+    assert call_cancellable(lambda x: x * 2, 21) == 42
+
+
+def test_cancel_by_generation_id(run):
+    assert cancellation.cancel("gen-test")
+    with pytest.raises(RunCancelled) as error:
+        check_cancelled()
+    assert error.value.reason == cancellation.CANCELLED
+    assert not cancellation.cancel("gen-unknown")
+
+
+def test_cancel_releases_a_blocked_call_at_once(run):
+    release = threading.Event()
+    cancel_later(run)
+    started = time.monotonic()
+    with pytest.raises(RunCancelled):
+        call_cancellable(release.wait, 5)
+    assert time.monotonic() - started < 1
+    release.set()
+
+
+def test_call_keeps_the_context_and_returns_the_result(run):
+    assert call_cancellable(cancellation.current_token) is run
+
+
+def test_deadline_scope_bounds_the_call_and_nested_scopes_keep_the_earliest(run):
+    release = threading.Event()
+    with deadline_scope(0.1, label="write_draft"):
+        with deadline_scope(60):
+            assert remaining_time() <= 0.1
+        with pytest.raises(DeadlineExceeded) as error:
+            call_cancellable(release.wait, 5)
+    release.set()
+    assert error.value.reason == cancellation.TIMEOUT
+    assert remaining_time() is None
+
+
+def test_run_deadline_cancels_the_token():
+    token = cancellation.register("gen-deadline", deadline_seconds=0.05)
+    try:
+        with generation_context("gen-deadline"):
+            with pytest.raises(DeadlineExceeded):
+                cancellation.sleep(5)
+        assert token.cancelled and token.reason == cancellation.TIMEOUT
+    finally:
+        cancellation.unregister(token)
+
+
+def test_cancel_scope_aborts_only_its_block(run):
+    with cancel_scope() as scope:
+        cancel_later(scope)
+        with pytest.raises(RunCancelled):
+            cancellation.sleep(5)
+    check_cancelled()  # The run goes on
+    assert not run.cancelled
+
+
+def test_cancelling_the_run_cancels_its_scopes(run):
+    with cancel_scope() as scope:
+        run.cancel()
+        assert scope.cancelled
+
+
+def test_parse_deadline():
+    assert parse_deadline("task", 300) == 300.0
+    assert parse_deadline("task", None) is None
+    assert parse_deadline("task", "soon") is None
+    assert parse_deadline("task", -5) is None
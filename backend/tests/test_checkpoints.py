@@ -0,0 +1,41 @@
+import os
+import time
+
+from src.checkpoints import CheckpointStore, config_fingerprint
+
+
+def test_saves_and_loads_task_outputs(tmp_path):
+    store = CheckpointStore(tmp_path)
+    store.save_run("gen-1", "cats", "dag")
+    store.save_task("gen-1", "write_draft", "draft", agent="Content Writer", fingerprint="abc")
+
+    assert store.load_run("gen-1")["topic"] == "cats"
+    tasks = store.load_tasks("gen-1")
+    assert list(tasks) == ["write_draft"]
+    assert tasks["write_draft"]["raw"] == "draft" and tasks["write_draft"]["fingerprint"] == "abc"
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_unreadable_checkpoints_are_ignored(tmp_path):
+    store = CheckpointStore(tmp_path)
+    store.save_task("gen-1", "write_draft", "draft")
+    (tmp_path / "gen-1" / "review_draft.json").write_text("{not json", encoding="utf-8")
+    assert list(store.load_tasks("gen-1")) == ["write_draft"]
+    assert store.load_tasks("missing") == {}
+
+
+def test_fingerprint_follows_the_configuration():
+    assert config_fingerprint({"a": 1, "b": 2}) == config_fingerprint({"b": 2, "a": 1})
+    assert config_fingerprint({"a": 1}) != config_fingerprint({"a": 2})
+
+
+def test_prune_removes_only_old_generations(tmp_path):
+    store = CheckpointStore(tmp_path)
+    store.save_task("old", "write_draft", "draft")
+    store.save_task("new", "write_draft", "draft")
+    past = time.time() - 3 * 86400
+    for path in (tmp_path / "old").iterdir():
+        os.utime(path, (past, past))
+
+    assert store.prune(max_age_seconds=86400) == 1
+    assert store.load_tasks("old") == {} and list(store.load_tasks("new")) == ["write_draft"]
@@ -0,0 +1,56 @@
+from src.context_budget import (TRUNCATION_MARKER, ContextBudget, estimate_tokens, extractive_summary, key_points,
+                                parse_context_budget, truncate)
+
+POST = """# Cats in Space
+
+Cats have always been curious explorers. Space agencies now study how cats adapt to microgravity.
+
+Microgravity changes how cats move. Cats use their tails to turn in microgravity, a trick astronauts envy.
+
+## Food
+
+Feeding cats in orbit needs sealed pouches. Crumbs are dangerous in a space station.
+
+## Conclusion
+
+Cats in space teach us about balance, adaptation and curiosity."""
+
+
+def test_text_within_budget_is_unchanged():
+    assert truncate(POST, 1000) == POST
+    assert extractive_summary(POST, 1000) == POST
+    assert ContextBudget(strategy="summary", max_tokens=1000).apply(POST) == POST
+
+
+def test_truncate_cuts_at_a_boundary_and_marks_the_cut():
+    result = truncate(POST, 60)
+    assert result.endswith(TRUNCATION_MARKER)
+    assert estimate_tokens(result) <= 60
+    head = result[:-len(TRUNCATION_MARKER)]
+    assert POST.startswith(head)
+    assert head.endswith(".")
+
+
+def test_extractive_summary_keeps_the_title_and_original_order():
+    result = extractive_summary(POST, 50)
+    assert estimate_tokens(result) <= 50
+    assert result.startswith("# Cats in Space")
+    sentences = result.split("\n\n")[1:]
+    positions = [POST.index(sentence.split(". ")[0]) for sentence in sentences]
+    assert positions == sorted(positions)
+
+
+def test_key_points_digest_fits_the_budget():
+    result = key_points(POST, 60)
+    lines = result.splitlines()
+    assert lines[0] == "Title: Cats in Space"
+    assert lines[1].startswith("Key themes: cats")
+    assert "Key points:" in lines and any(line.startswith("- ") for line in lines)
+    assert estimate_tokens(result) <= 60
+
+
+def test_parse_context_budget():
+    assert parse_context_budget("task", None) is None
+    assert parse_context_budget("task", 300) == ContextBudget(strategy="truncate", max_tokens=300)
+    assert parse_context_budget("task", {"strategy": "key_points", "max_tokens": 150}).strategy == "key_points"
+    assert parse_context_budget("task", {"strategy": "poem", "max_tokens": 150}) is None
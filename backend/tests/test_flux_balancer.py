@@ -0,0 +1,110 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from src.ratelimit import UpstreamLimiter
+from src.tools.flux_balancer import CIRCUIT_CLOSED, CIRCUIT_OPEN, FluxEndpointBalancer, FluxEndpointsUnavailable
+from src.tools.gradio_pool import GradioClientPool
+
+
+class FakeSpaces:
+    """
+    FLUX endpoints answering '<name>.webp' after `latencies[name]` seconds ('fail' raises).
+    `first_latency` overrides the latency of the very first request, whichever endpoint gets it.
+    """
+
+    def __init__(self, first_latency=None, **latencies):
+        self.latencies = latencies
+        self.first_latency = first_latency
+        self.calls = []
+        self.cancelled = []
+
+    def _submit(self, name):
+        latency = self.first_latency if not self.calls and self.first_latency is not None else self.latencies[name]
+        self.calls.append(name)
+        future = Future()
+        if latency == "fail":
+            future.set_exception(RuntimeError(f"{name} is down"))
+        else:
+            timer = threading.Timer(latency, lambda: future.done() or future.set_result(f"{name}.webp"))
+            timer.daemon = True
+            timer.start()
+        spaces = self
+
+        class Job:
+            def cancel(self):
+                spaces.cancelled.append(name)
+                return future.cancel()
+        Job.future = future
+        return Job()
+
+    def balancer(self, **options):
+        def client_factory(name):
+            class Client:
+                def __init__(client, *args, **kwargs):
+                    pass
+
+                def submit(client, *args, **kwargs):
+                    return self._submit(name)
+            return Client
+
+        pools = [GradioClientPool(src=name, size=2, client_factory=client_factory(name),
+                                  health_check=lambda client: True) for name in self.latencies]
+        return FluxEndpointBalancer(pools, **options)
+
+
+def test_slow_request_is_hedged_and_the_loser_cancelled():
+    spaces = FakeSpaces(first_latency=5.0, a=0.01, b=0.01)
+    balancer = spaces.balancer(hedge_delay=0.05)
+    started = time.monotonic()
+    result = balancer.predict("a cat")
+    assert time.monotonic() - started < 1
+    assert result == f"{spaces.calls[1]}.webp"
+    assert balancer.metrics()["hedges"] == {"fired": 1, "won": 1}
+    deadline = time.monotonic() + 1
+    while not spaces.cancelled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert spaces.cancelled == [spaces.calls[0]]
+
+
+def test_no_hedge_while_the_rate_limiter_is_saturated():
+    spaces = FakeSpaces(first_latency=0.2, a=0.01, b=0.01)
+    balancer = spaces.balancer(hedge_delay=0.05)
+    limiter = UpstreamLimiter("flux-test", max_concurrency=1, max_retries=0)
+    assert balancer.predict_with(limiter, "a cat") == f"{spaces.calls[0]}.webp"
+    assert len(spaces.calls) == 1
+    assert balancer.metrics()["hedges"]["fired"] == 0
+
+
+def test_failing_endpoint_fails_over_and_its_circuit_opens():
+    spaces = FakeSpaces(a="fail", b=0.01)
+    balancer = spaces.balancer(hedge_delay=None, failure_threshold=2, cooldown_seconds=60)
+    results = [balancer.predict("a cat") for _ in range(6)]
+    assert results == ["b.webp"] * 6
+    endpoints = balancer.metrics()["endpoints"]
+    assert endpoints["a"]["state"] == CIRCUIT_OPEN
+    assert endpoints["a"]["failures"] == 2  # No traffic once open
+
+
+def test_open_circuit_gets_a_trial_request_after_the_cooldown():
+    spaces = FakeSpaces(a="fail", b=0.01)
+    balancer = spaces.balancer(hedge_delay=None, failure_threshold=1, cooldown_seconds=0.05)
+    balancer.predict("a cat")
+    while balancer.metrics()["endpoints"]["a"]["state"] != CIRCUIT_OPEN:
+        balancer.predict("a cat")
+    spaces.latencies["a"] = 0.01
+    time.sleep(0.1)
+    for _ in range(4):
+        balancer.predict("a cat")
+    assert balancer.metrics()["endpoints"]["a"]["state"] == CIRCUIT_CLOSED
+
+
+def test_all_endpoints_down():
+    spaces = FakeSpaces(a="fail", b="fail")
+    balancer = spaces.balancer(hedge_delay=None, failure_threshold=1, cooldown_seconds=60)
+    with pytest.raises(RuntimeError, match="is down"):
+        balancer.predict("a cat")
+    with pytest.raises(FluxEndpointsUnavailable):
+        balancer.predict("a cat")
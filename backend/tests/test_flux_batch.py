@@ -0,0 +1,19 @@
+from src.tools.FluxImageGeneratorTool import FluxImageGeneratorTool
+
+
+def test_specs_are_split_on_semicolons_and_newlines_before_a_prompt():
+    specs = FluxImageGeneratorTool._split_specs(
+        "prompt: a cat, format: hd; prompt: a dog, formats: instagram_square, twitter_post\nprompt: a bird")
+    assert specs == ["prompt: a cat, format: hd",
+                     "prompt: a dog, formats: instagram_square, twitter_post",
+                     "prompt: a bird"]
+
+
+def test_semicolons_inside_a_spec_are_kept():
+    assert FluxImageGeneratorTool._split_specs("prompt: a cat; in space, steps: 4") == [
+        "prompt: a cat; in space, steps: 4"]
+
+
+def test_single_spec_and_case_insensitive_prompt_key():
+    assert FluxImageGeneratorTool._split_specs("prompt: only one, steps: 4;") == ["prompt: only one, steps: 4"]
+    assert FluxImageGeneratorTool._split_specs("Prompt: x; PROMPT : y") == ["Prompt: x", "PROMPT : y"]
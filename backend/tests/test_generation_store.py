@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from src.generation_store import GenerationStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = GenerationStore(tmp_path)
+    for i in range(5):
+        generation_id = f"gen-{i}"
+        store.start(generation_id, f"Cats {i}" if i % 2 == 0 else f"Dogs {i}", execution_mode="dag")
+        store.finish(generation_id, {
+            "status": "success" if i != 3 else "error",
+            "message": "boom" if i == 3 else None,
+            "blog_reviewed": f"Post {i}",
+            "images": f"Saved to /generated_images/img-{i}.webp",
+            "social_media": {"twitter": f"tweet {i}"},
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+        }, elapsed_seconds=1.5)
+    return store
+
+
+def test_export_ndjson_streams_every_record_with_its_blobs(store):
+    records = [json.loads(line) for line in store.export_ndjson(batch_size=2)]
+    assert len(records) == 5
+    assert len({record["id"] for record in records}) == 5
+    record = next(record for record in records if record["id"] == "gen-2")
+    assert record["blog_reviewed"] == "Post 2"
+    assert record["image_urls"] == ["/generated_images/img-2.webp"]
+    assert record["social_media"] == {"twitter": "tweet 2"}
+
+
+def test_export_ndjson_applies_the_filters(store):
+    records = [json.loads(line) for line in store.export_ndjson(topic="cats")]
+    assert sorted(record["id"] for record in records) == ["gen-0", "gen-2", "gen-4"]
+    failed = [json.loads(line) for line in store.export_ndjson(status="error")]
+    assert [(record["id"], record["error"]) for record in failed] == [("gen-3", "boom")]
+
+
+def test_list_omits_blobs_and_stats_aggregate(store):
+    listed = store.list(limit=2)
+    assert len(listed) == 2 and "blog_reviewed" not in listed[0]
+    stats = store.stats()
+    assert stats["generations"] == 5
+    assert stats["by_status"] == {"success": 4, "error": 1}
+    assert stats["prompt_tokens"] == 50
@@ -0,0 +1,39 @@
+from src.tools.image_cache import ImageCache
+from src.tools.image_store import ImageStore
+
+PARAMS = {"prompt": "a cat in space", "width": 1024, "height": 1024, "num_inference_steps": 4, "seed": 42}
+
+
+def test_key_depends_on_the_image_parameters_and_the_model():
+    key = ImageCache.make_key(PARAMS, "black-forest-labs/FLUX.1-schnell")
+    assert key == ImageCache.make_key(dict(PARAMS, randomize_seed=False), "black-forest-labs/FLUX.1-schnell")
+    assert key != ImageCache.make_key(dict(PARAMS, seed=43), "black-forest-labs/FLUX.1-schnell")
+    assert key != ImageCache.make_key(PARAMS, "black-forest-labs/FLUX.1-dev")
+
+
+def test_hit_returns_the_stored_blob_and_seed(tmp_path):
+    store = ImageStore(tmp_path / "images")
+    cache = ImageCache(store)
+    source = tmp_path / "cat.webp"
+    source.write_bytes(b"cat")
+    blob = store.put(source, prompt=PARAMS["prompt"])
+    key = ImageCache.make_key(PARAMS, "flux")
+    assert cache.lookup(key) is None
+
+    cache.store_blob(key, blob, seed=42, width=1024, height=1024)
+    assert cache.lookup(key) == (blob, 42)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_entries_whose_blob_was_evicted_are_dropped(tmp_path):
+    store = ImageStore(tmp_path / "images")
+    cache = ImageCache(store)
+    source = tmp_path / "cat.webp"
+    source.write_bytes(b"cat")
+    blob = store.put(source)
+    key = ImageCache.make_key(PARAMS, "flux")
+    cache.store_blob(key, blob, seed=42, width=1024, height=1024)
+
+    store.gc(max_bytes=0)
+    assert cache.lookup(key) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+from PIL import Image, ImageDraw
+
+from src.tools.image_derivatives import DerivativePipeline, master_dimensions, smart_crop_box
+
+
+def test_master_covers_every_preset_in_multiples_of_32():
+    assert master_dimensions([(1080, 1080), (1200, 675), (1080, 1350)]) == (1184, 1344)
+
+
+def test_master_is_scaled_down_to_the_max_side():
+    width, height = master_dimensions([(4096, 1024)], max_side=2048)
+    assert (width, height) == (2048, 512)
+
+
+def test_master_needs_at_least_one_size():
+    with pytest.raises(ValueError):
+        master_dimensions([])
+
+
+def detailed_image(size, box):
+    """Flat image with a busy pattern inside `box`."""
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    left, top, right, bottom = box
+    for x in range(left, right, 8):
+        draw.line([(x, top), (x, bottom)], fill="black", width=3)
+    return image
+
+
+def test_crop_keeps_the_detailed_region_horizontally():
+    image = detailed_image((1200, 400), (800, 0, 1200, 400))
+    left, top, right, bottom = smart_crop_box(image, 100, 100)
+    assert (top, bottom, right - left) == (0, 400, 400)
+    assert left >= 700
+
+
+def test_crop_keeps_the_detailed_region_vertically():
+    image = detailed_image((400, 1200), (0, 0, 400, 400))
+    left, top, right, bottom = smart_crop_box(image, 100, 100)
+    assert (left, right, bottom - top) == (0, 400, 400)
+    assert top <= 100
+
+
+def test_same_ratio_keeps_the_whole_image():
+    assert smart_crop_box(Image.new("RGB", (800, 400)), 400, 200) == (0, 0, 800, 400)
+
+
+def test_pipeline_renders_each_preset_and_writes_a_manifest(tmp_path):
+    detailed_image((1184, 1344), (0, 0, 600, 600)).save(tmp_path / "master.png")
+    pipeline = DerivativePipeline(tmp_path)
+    manifest = pipeline.derive("master.png", {"square": (108, 108), "story": (108, 192)}, encoding="webp")
+
+    derivatives = {d["preset"]: d for d in manifest["derivatives"]}
+    with Image.open(tmp_path / derivatives["story"]["filename"]) as story:
+        assert story.size == (108, 192)
+    assert json.loads(pipeline.manifest_path("master.png").read_text(encoding="utf-8")) == manifest
+    assert not list(tmp_path.glob("*.tmp"))
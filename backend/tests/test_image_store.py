@@ -0,0 +1,59 @@
+import pytest
+
+from src.tools.image_store import ImageStore, parse_size
+
+
+@pytest.fixture
+def write(tmp_path):
+    def write(name, size, fill=b"x"):
+        path = tmp_path / "incoming" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(fill * size)
+        return path
+    return write
+
+
+def test_same_content_is_stored_once(tmp_path, write):
+    store = ImageStore(tmp_path / "images")
+    first = store.put(write("a.webp", 100), prompt="cat")
+    second = store.put(write("b.webp", 100), prompt="cat")
+    assert first == second
+    assert store.stats()["blobs"] == 1 and store.stats()["size_bytes"] == 100
+
+
+def test_size_quota_evicts_least_recently_used(tmp_path, write):
+    store = ImageStore(tmp_path / "images", max_bytes=250)
+    a = store.put(write("a.webp", 100, b"a"))
+    b = store.put(write("b.webp", 100, b"b"))
+    store.touch(a)
+    c = store.put(write("c.webp", 100, b"c"))
+    assert store.contains(a) and store.contains(c)
+    assert not store.contains(b)
+
+
+def test_pinned_blobs_survive_the_quota_until_unpinned(tmp_path, write):
+    store = ImageStore(tmp_path / "images", max_bytes=250)
+    store.pin("progressive-1.webp")
+    preview = store.put(write("p.webp", 100, b"p"), name="progressive-1.webp", kind="preview")
+    for fill in (b"a", b"b", b"c"):
+        store.put(write(f"{fill.decode()}.webp", 100, fill))
+    assert store.contains(preview)
+
+    store.unpin(preview)
+    store.put(write("d.webp", 100, b"d"))
+    assert not store.contains(preview)
+
+
+def test_derivatives_go_with_their_master(tmp_path, write):
+    store = ImageStore(tmp_path / "images")
+    master = store.put(write("m.webp", 100, b"m"))
+    (tmp_path / "images" / "m_small.webp").write_bytes(b"s" * 10)
+    store.register("m_small.webp", parent=master)
+    assert store.gc(max_bytes=0)["removed"] == 1
+    assert not store.contains(master) and not store.contains("m_small.webp")
+
+
+def test_parse_size():
+    assert parse_size("2G") == 2 * 1024 ** 3
+    assert parse_size("500M") == 500 * 1024 ** 2
+    assert parse_size("0") == 0
@@ -0,0 +1,58 @@
+from src.jobs import JOB_CANCELLED, JOB_DONE, JOB_QUEUED, JOB_RUNNING, JobStore
+
+
+def test_claims_the_oldest_queued_job_once(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    first = store.create("cats")
+    second = store.create("dogs")
+
+    claimed = store.claim_next()
+    assert claimed["id"] == first["id"] and claimed["status"] == JOB_RUNNING
+    assert store.claim_next()["id"] == second["id"]
+    assert store.claim_next() is None
+
+
+def test_running_jobs_are_requeued_on_restart(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    job = JobStore(path).create("cats")
+    JobStore(path).claim_next()
+
+    restarted = JobStore(path)
+    assert restarted.get(job["id"])["status"] == JOB_QUEUED
+    assert restarted.claim_next()["id"] == job["id"]
+
+
+def test_requeue_only_finished_jobs(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    job = store.create("cats", {"mode": "dag"})
+    assert not store.requeue(job["id"])  # Still queued
+    store.claim_next()
+    store.finish(job["id"], JOB_DONE, result={"blog": "..."})
+    assert store.get(job["id"])["progress"] == 100
+
+    assert store.requeue(job["id"], {"mode": "dag", "resume": True})
+    requeued = store.get(job["id"])
+    assert requeued["status"] == JOB_QUEUED
+    assert requeued["options"] == {"mode": "dag", "resume": True}
+    assert requeued["result"] is None and requeued["progress"] == 0
+
+
+def test_cancel_if_queued(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    queued = store.create("cats")
+    running = store.create("dogs")
+    store.claim_next()  # Claims "cats"
+    assert store.cancel_if_queued(running["id"])
+    assert not store.cancel_if_queued(queued["id"])
+    assert store.get(running["id"])["status"] == JOB_CANCELLED
+
+
+def test_progress_after_the_end_keeps_the_final_state(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    job = store.create("cats")
+    store.claim_next()
+    store.update_progress(job["id"], 50, "Writing")
+    store.finish(job["id"], JOB_DONE, result={"status": "success"})
+    store.update_progress(job["id"], None, "Full-quality render stored")  # Background image render
+    finished = store.get(job["id"])
+    assert (finished["progress"], finished["message"]) == (100, "Job done")
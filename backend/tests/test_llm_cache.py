@@ -0,0 +1,69 @@
+import pytest
+
+from src import llm_cache
+from src.llm_cache import LLMResponseCache, MemoryLRUBackend, SQLiteBackend, make_cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemoryLRUBackend(**kwargs)
+        return SQLiteBackend(tmp_path / "llm_cache.sqlite3", **kwargs)
+    return make
+
+
+def test_key_ignores_formatting_of_equivalent_messages():
+    params = {"temperature": 0.6, "stop": ["b", "a"], "seed": None}
+    key = make_cache_key("gemini/x", params, [{"role": "User", "content": " hi\r\n"}])
+    assert key == make_cache_key("gemini/x", {"temperature": 0.6, "stop": ["a", "b"]}, "hi")
+    assert key != make_cache_key("gemini/x", {"temperature": 0.7, "stop": ["a", "b"]}, "hi")
+
+
+def test_evicts_least_recently_used_entry(make_backend, clock):
+    backend = make_backend(max_entries=2)
+    backend.set("a", "1")
+    clock[0] += 1
+    backend.set("b", "2")
+    clock[0] += 1
+    assert backend.get("a") == "1"  # "b" is now the least recently used
+    clock[0] += 1
+    backend.set("c", "3")
+    assert backend.get("b") is None
+    assert backend.get("a") == "1" and backend.get("c") == "3"
+    assert backend.evictions == 1
+
+
+def test_evicts_to_stay_within_byte_budget(make_backend, clock):
+    backend = make_backend(max_bytes=10)
+    backend.set("a", "x" * 6)
+    clock[0] += 1
+    backend.set("b", "y" * 6)
+    assert backend.get("a") is None and backend.get("b") == "y" * 6
+    backend.set("big", "z" * 11)  # Larger than the whole budget: never stored
+    assert backend.get("big") is None
+
+
+def test_entries_expire_after_ttl(make_backend, clock):
+    backend = make_backend(ttl=60)
+    backend.set("a", "1")
+    clock[0] += 59
+    assert backend.get("a") == "1"
+    clock[0] += 2
+    assert backend.get("a") is None
+
+
+def test_front_counts_hits_and_misses():
+    cache = LLMResponseCache(MemoryLRUBackend())
+    assert cache.get("k") is None
+    cache.set("k", "v")
+    assert cache.get("k") == "v"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
@@ -0,0 +1,53 @@
+import json
+import logging
+import queue
+
+from src.logging_setup import (REDACTED, JsonFormatter, SamplingFilter, SecretRedactor, _LogListener, _QueueHandler,
+                               parse_sample_rates)
+
+
+def record(name="app", level=logging.INFO, msg="message", **extra):
+    log_record = logging.LogRecord(name, level, __file__, 1, msg, None, None)
+    log_record.__dict__.update(extra)
+    return log_record
+
+
+def test_redactor_masks_key_formats_and_secret_env_values(monkeypatch):
+    monkeypatch.setenv("MY_SERVICE_TOKEN", "s3cr3t-value-123")
+    redactor = SecretRedactor(extra_secrets=["hunter22"])
+    text = ("key AIza" + "A" * 35 + " url https://x/y?key=abc&z=1 header Bearer abcdefghij"
+            " token s3cr3t-value-123 password hunter22")
+    redacted = redactor.redact(text)
+    for secret in ("AIza", "abc&", "abcdefghij", "s3cr3t-value-123", "hunter22"):
+        assert secret not in redacted
+    assert redacted.count(REDACTED) == 5
+
+
+def test_redact_value_walks_containers_and_keeps_scalars():
+    redactor = SecretRedactor(extra_secrets=["hunter22"])
+    value = {"auth": ["Bearer abcdefghij", ("hunter22", 3)], "ok": True, "n": 1.5, "none": None}
+    assert redactor.redact_value(value) == {
+        "auth": [f"Bearer {REDACTED}", [REDACTED, 3]], "ok": True, "n": 1.5, "none": None}
+
+
+def test_listener_redacts_extra_fields_for_the_json_formatter():
+    listener = _LogListener(queue.Queue(), _QueueHandler(queue.Queue()), SecretRedactor(extra_secrets=["hunter22"]), 0)
+    prepared = listener.prepare(record(msg="login with hunter22", request={"password": "hunter22"}))
+    entry = json.loads(JsonFormatter().format(prepared))
+    assert entry["message"] == f"login with {REDACTED}"
+    assert entry["request"] == {"password": REDACTED}
+
+
+def test_sampling_keeps_a_fixed_fraction_of_noisy_debug_records():
+    sampling = SamplingFilter({"LiteLLM": 0.25, "httpx": 0})
+    kept = sum(sampling.filter(record("LiteLLM.proxy", logging.DEBUG)) for _ in range(100))
+    assert kept == 25
+    assert not sampling.filter(record("httpx", logging.INFO))
+    assert sampling.filter(record("httpx", logging.WARNING))
+    assert sampling.filter(record("src.crew", logging.DEBUG))
+
+
+def test_parse_sample_rates_overrides_the_defaults():
+    rates = parse_sample_rates("LiteLLM=1, httpx=0.5,bad,x=oops")
+    assert rates["LiteLLM"] == 1.0 and rates["httpx"] == 0.5
+    assert "bad" not in rates and "x" not in rates
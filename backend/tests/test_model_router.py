@@ -0,0 +1,75 @@
+import pytest
+
+from src.model_router import FAST_TIER, QUALITY_TIER, ModelEndpoint, ModelHealth, ModelRouter, RoutedLLM
+
+
+def test_model_is_degraded_by_p95_latency():
+    health = ModelHealth("slow", min_calls=5, p95_seconds=1.0, cooldown_seconds=60)
+    for _ in range(4):
+        health.record(5.0, ok=True)
+    assert health.healthy()  # Not enough calls yet
+    health.record(5.0, ok=True)
+    assert not health.healthy()
+    assert health.stats()["degraded"]
+
+
+def test_model_is_degraded_by_error_rate_and_recovers_after_the_cooldown():
+    health = ModelHealth("flaky", min_calls=4, error_rate=0.5, cooldown_seconds=0)
+    for ok in (True, False, False, False):
+        health.record(0.1, ok=ok)
+    assert not health.healthy()
+    assert health.healthy()  # Cooldown over: window cleared
+    assert health.stats()["calls"] == 0
+
+
+class FakeLLM:
+    def __init__(self, model, error=None, healthy=True):
+        self.model = model
+        self.error = error
+        self.health = ModelHealth(model, min_calls=1, error_rate=0.0, cooldown_seconds=60)
+        if not healthy:
+            self.health.record(1.0, ok=False)
+        self.temperature, self.max_tokens, self.timeout, self.base_url, self.api_key = 0.5, None, 60, None, None
+        self.stop = None
+        self.calls = 0
+
+    def call(self, messages, callbacks=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return f"answer from {self.model}"
+
+
+def test_failed_call_fails_over_to_the_next_model():
+    primary, fallback = FakeLLM("gemini/primary", error=RuntimeError("503 overloaded")), FakeLLM("gemini/fallback")
+    llm = RoutedLLM([primary, fallback])
+    assert llm.call([{"role": "user", "content": "hi"}]) == "answer from gemini/fallback"
+    assert primary.calls == 1 and fallback.calls == 1
+
+
+def test_degraded_models_go_last():
+    primary, fallback = FakeLLM("gemini/primary", healthy=False), FakeLLM("gemini/fallback")
+    assert RoutedLLM([primary, fallback]).call([]) == "answer from gemini/fallback"
+    assert primary.calls == 0
+
+
+def test_the_last_error_and_context_length_errors_are_raised():
+    primary = FakeLLM("gemini/primary", error=RuntimeError("context length exceeded"))
+    fallback = FakeLLM("gemini/fallback")
+    with pytest.raises(RuntimeError):
+        RoutedLLM([primary, fallback]).call([])
+    assert fallback.calls == 0
+    with pytest.raises(RuntimeError):
+        RoutedLLM([FakeLLM("gemini/a", error=RuntimeError("boom")), FakeLLM("gemini/b", error=RuntimeError("boom"))]).call([])
+
+
+def test_agent_settings_pick_the_tier_and_override_its_models():
+    router = ModelRouter({
+        QUALITY_TIER: [ModelEndpoint("gemini/pro"), ModelEndpoint("gemini/flash")],
+        FAST_TIER: [ModelEndpoint("openai/local", base_url="http://localhost:8000"), ModelEndpoint("gemini/flash")],
+    })
+    assert [e.model for e in router.endpoints_for()] == ["gemini/pro", "gemini/flash"]
+    assert [e.model for e in router.endpoints_for({"tier": "fast"})] == ["openai/local", "gemini/flash"]
+    assert router.endpoints_for({"tier": "fast"})[0].base_url == "http://localhost:8000"
+    assert [e.model for e in router.endpoints_for({"model": "flash-lite", "fallback": []})] == ["gemini/flash-lite"]
+    assert [e.model for e in router.endpoints_for({"tier": "unknown", "fallback": "gemini/pro"})] == ["gemini/pro"]
@@ -0,0 +1,24 @@
+from concurrent.futures import Future
+
+from src.ratelimit import UpstreamLimiter
+from src.tools.FluxImageGeneratorTool import FluxImageGeneratorTool
+from src.tools.gradio_pool import GradioClientPool
+
+
+def done(outcome):
+    future = Future()
+    future.set_result(outcome)
+    return future
+
+
+def test_refinements_are_summarized_without_waiting(tmp_path):
+    pool = GradioClientPool(src="fake/flux", size=1, client_factory=lambda *args, **kwargs: None)
+    tool = FluxImageGeneratorTool(save_dir=tmp_path, client_pool=pool, progressive=True,
+                                  rate_limiter=UpstreamLimiter("flux-test", max_retries=0))
+    running = Future()
+    tool.pending_refinements["gen-1"] = [done("refined"), done("failed"), running]
+
+    assert tool.wait_for_refinements("gen-1", wait=False) == {"refined": 1, "failed": 1, "cancelled": 0, "pending": 1}
+    assert not running.done()
+    assert tool.wait_for_refinements("gen-1", wait=False) is None  # Reported once
+    assert tool.wait_for_refinements("gen-without-previews") is None
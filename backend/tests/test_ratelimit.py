@@ -0,0 +1,101 @@
+import pytest
+
+from src import ratelimit
+from src.ratelimit import UpstreamLimiter, get_limiter
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+def fail(error):
+    def call():
+        raise error
+    return call
+
+
+def test_throttling_halves_the_concurrency_limit():
+    limiter = UpstreamLimiter("test", max_concurrency=8, max_retries=0, window=4)
+    with pytest.raises(Throttled):
+        limiter.call(fail(Throttled("slow down")))
+    assert limiter.concurrency_limit == 4
+    with pytest.raises(Throttled):
+        limiter.call(fail(Throttled("slow down")))
+    assert limiter.concurrency_limit == 2
+
+
+def test_successes_raise_the_limit_back_one_at_a_time():
+    limiter = UpstreamLimiter("test", max_concurrency=4, window=4)
+    limiter.concurrency_limit = 2
+    for _ in range(2):
+        limiter.call(lambda: "ok")
+    assert limiter.concurrency_limit == 3
+    for _ in range(10):
+        limiter.call(lambda: "ok")
+    assert limiter.concurrency_limit == 4  # Never above max_concurrency
+
+
+def test_non_retryable_errors_leave_the_limit_alone():
+    limiter = UpstreamLimiter("test", max_concurrency=4, window=4)
+    limiter.concurrency_limit = 2
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            limiter.call(fail(ValueError("bad request")))
+    assert limiter.concurrency_limit == 2
+    assert limiter.metrics()["retries"] == 0
+
+
+def test_retries_throttled_calls(monkeypatch):
+    monkeypatch.setattr(ratelimit, "cancellable_sleep", lambda seconds: None)
+    limiter = UpstreamLimiter("test", max_retries=2)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Throttled("429 too many requests")
+        return "ok"
+
+    assert limiter.call(flaky) == "ok"
+    assert limiter.metrics()["retries"] == 2
+
+
+def test_unconfigured_limiter_still_retries_and_adapts(monkeypatch):
+    for suffix in ("RPM", "TPM", "MAX_CONCURRENCY", "MAX_RETRIES", "RATE_LIMIT"):
+        monkeypatch.delenv(f"UNSET_{suffix}", raising=False)
+    monkeypatch.setattr(ratelimit, "_limiters", {})
+    limiter = get_limiter("unset")
+    assert limiter.concurrency_limit is None and limiter.max_retries == 4 and limiter.adaptive
+    assert not limiter.saturated()
+
+
+def test_rate_limit_off_is_a_pass_through(monkeypatch):
+    monkeypatch.setenv("PASSTHROUGH_RATE_LIMIT", "off")
+    monkeypatch.setenv("PASSTHROUGH_MAX_RETRIES", "3")
+    monkeypatch.setattr(ratelimit, "_limiters", {})
+    limiter = get_limiter("passthrough")
+    assert limiter.concurrency_limit is None and limiter.max_retries == 0 and not limiter.adaptive
+
+
+def test_unlimited_concurrency_is_capped_once_throttled_and_lifted_again():
+    limiter = UpstreamLimiter("adaptive", max_concurrency=None, error_rate_threshold=0.5, window=4)
+    limiter._in_flight = 8
+    limiter._record(throttled=True)
+    assert limiter.concurrency_limit == 4
+    limiter._in_flight = 1
+    for _ in range(40):
+        limiter._record(throttled=False)
+    assert limiter.concurrency_limit is None
+
+
+def test_malformed_retry_after_falls_back_to_backoff():
+    class BadHeader(Exception):
+        headers = {"Retry-After": "garbage"}
+
+    assert UpstreamLimiter.retry_after(BadHeader("429")) is None
+
+
+def test_zero_retries_setting_is_honoured(monkeypatch):
+    monkeypatch.setenv("ZERO_MAX_RETRIES", "0")
+    monkeypatch.setattr(ratelimit, "_limiters", {})
+    assert get_limiter("zero").max_retries == 0
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from src.scheduler import DagScheduler
+
+
+class Node:
+    def __init__(self, name, context=()):
+        self.name = name
+        self.context = list(context)
+
+
+def test_runs_dependencies_first_and_independent_nodes_in_parallel():
+    draft = Node("draft")
+    review = Node("review", [draft])
+    social = Node("social", [review])
+    images = Node("images", [review])
+    order, running, overlap = [], set(), []
+    lock = threading.Lock()
+
+    def execute(node):
+        with lock:
+            running.add(node.name)
+            if {"social", "images"} <= running:
+                overlap.append(True)
+        time.sleep(0.05)
+        with lock:
+            running.discard(node.name)
+            order.append(node.name)
+        return node.name.upper()
+
+    scheduler = DagScheduler([draft, review, social, images], max_workers=2)
+    results = scheduler.run(execute)
+
+    assert results == {0: "DRAFT", 1: "REVIEW", 2: "SOCIAL", 3: "IMAGES"}
+    assert order[:2] == ["draft", "review"]
+    assert overlap, "social and images should run at the same time"
+    assert scheduler.levels() == [[0], [1], [2, 3]]
+
+
+def test_dependencies_outside_the_nodes_are_satisfied():
+    restored = Node("draft")
+    review = Node("review", [restored])
+    assert DagScheduler([review]).run(lambda node: node.name) == {0: "review"}
+
+
+def test_cycle_is_rejected():
+    a, b = Node("a"), Node("b")
+    a.context, b.context = [b], [a]
+    with pytest.raises(ValueError, match="cycle"):
+        DagScheduler([a, b])
+
+
+def test_failure_stops_new_nodes_and_is_raised():
+    first = Node("first")
+    second = Node("second", [first])
+    started = []
+
+    def execute(node):
+        started.append(node.name)
+        raise RuntimeError(f"{node.name} failed")
+
+    with pytest.raises(RuntimeError, match="first failed"):
+        DagScheduler([first, second]).run(execute)
+    assert started == ["first"]
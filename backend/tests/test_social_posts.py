@@ -0,0 +1,55 @@
+from src.social_posts import SocialPostStream, parse_social_posts
+
+FENCED_OUTPUT = '''Final Answer: here are the posts
+```json
+{
+  "instagram": {"text": "Cats in space!", "hashtags": ["cats", "#space"]},
+  "X": "Cats are going to space.",
+  "linkedin": ["Paragraph one.", "Paragraph two."]
+}
+```'''
+
+
+def test_parses_fenced_output_with_aliases_and_nested_text():
+    result = parse_social_posts(FENCED_OUTPUT)
+    assert result == {
+        "instagram": "Cats in space!\n\n#cats #space",
+        "twitter": "Cats are going to space.",
+        "linkedin": "Paragraph one.\n\nParagraph two.",
+    }
+
+
+def test_raw_newlines_inside_strings_are_accepted():
+    result = parse_social_posts('{"instagram": "line one\nline two", "twitter": "t", "linkedin": "l"}')
+    assert result["instagram"] == "line one\nline two"
+    assert "errors" not in result
+
+
+def test_posts_nested_under_another_key():
+    result = parse_social_posts('{"social_media": {"instagram": "i", "twitter": "t", "linkedin": "l"}}')
+    assert {key: result[key] for key in ("instagram", "twitter", "linkedin")} == {
+        "instagram": "i", "twitter": "t", "linkedin": "l"}
+
+
+def test_missing_and_invalid_platforms_are_reported_per_platform():
+    result = parse_social_posts('{"instagram": "ok", "twitter": ""}')
+    assert result["instagram"] == "ok"
+    errors = {error["platform"]: error["error"] for error in result["errors"]}
+    assert errors == {"twitter": "invalid_post", "linkedin": "missing"}
+
+
+def test_output_without_json_keeps_the_raw_text():
+    result = parse_social_posts("Sorry, I cannot help with that.")
+    assert result["error"] == "Failed to parse JSON"
+    assert result["raw_output"] == "Sorry, I cannot help with that."
+    assert result["errors"][0]["error"] == "no_json_object"
+
+
+def test_stream_emits_each_post_as_soon_as_it_is_complete():
+    stream = SocialPostStream()
+    emitted = [(platform, post.text) for platform, post in stream.feed('{"instagram": "Cats, in space", "twi')]
+    assert emitted == [("instagram", "Cats, in space")]
+    assert stream.feed('tter": {"text": "Ca') == []
+    emitted = [(platform, post.text) for platform, post in stream.feed('ts"}, "linkedin": "Cats at work"}')]
+    assert emitted == [("twitter", "Cats"), ("linkedin", "Cats at work")]
+    assert stream.result() == {"instagram": "Cats, in space", "twitter": "Cats", "linkedin": "Cats at work"}
@@ -0,0 +1,51 @@
+from src.streaming import DeltaCoalescer, current_stream_sink, stream_sink
+
+
+def recorder():
+    emitted = []
+    return emitted, lambda text, chars, done: emitted.append((text, chars, done))
+
+
+def test_deltas_are_batched_until_the_interval_or_size_limit():
+    emitted, emit = recorder()
+    coalescer = DeltaCoalescer(emit, min_interval=3600, max_chars=5)
+    for delta in ("ab", "c", "de", "f"):
+        coalescer.push(delta)
+    assert emitted == [("abcde", 5, False)]
+    coalescer.close()
+    assert emitted[-1] == ("f", 6, True)
+
+
+def test_close_always_signals_done_and_empty_deltas_are_ignored():
+    emitted, emit = recorder()
+    coalescer = DeltaCoalescer(emit, min_interval=3600)
+    coalescer.push("")
+    coalescer.close()
+    assert emitted == [("", 0, True)]
+
+
+def test_elapsed_interval_flushes_on_the_next_delta():
+    emitted, emit = recorder()
+    coalescer = DeltaCoalescer(emit, min_interval=0)
+    coalescer.push("a")
+    coalescer.push("b")
+    assert emitted == [("a", 1, False), ("b", 2, False)]
+
+
+def test_a_failing_callback_does_not_raise():
+    def emit(text, chars, done):
+        raise RuntimeError("UI gone")
+
+    coalescer = DeltaCoalescer(emit, min_interval=0)
+    coalescer.push("a")
+    coalescer.close()
+
+
+def test_stream_sink_is_scoped_to_the_block():
+    sink = lambda event: None
+    with stream_sink(sink, task="write_draft"):
+        assert current_stream_sink() == (sink, "write_draft")
+        with stream_sink(None):
+            assert current_stream_sink() is None
+        assert current_stream_sink() == (sink, "write_draft")
+    assert current_stream_sink() is None
@@ -0,0 +1,58 @@
+import pytest
+
+from src.telemetry import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_counter_renders_help_type_and_labelled_samples():
+    registry = MetricsRegistry()
+    runs = Counter("runs_total", "Runs by status", ("status",), registry=registry)
+    runs.inc(status="success")
+    runs.inc(2, status="error")
+    assert registry.render() == (
+        "# HELP runs_total Runs by status\n"
+        "# TYPE runs_total counter\n"
+        'runs_total{status="error"} 2\n'
+        'runs_total{status="success"} 1\n'
+    )
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    errors = Counter("errors_total", "Errors", ("error",), registry=registry)
+    errors.inc(error='bad "quote"\nline')
+    assert 'errors_total{error="bad \\"quote\\"\\nline"} 1' in registry.render()
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    registry = MetricsRegistry()
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.5, 1.0), registry=registry)
+    for value in (0.2, 0.7, 3.0):
+        latency.observe(value)
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'latency_seconds_bucket{le="0.5"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 3.9",
+        "latency_seconds_count 3",
+    ]
+    assert latency.count() == 3
+
+
+def test_gauge_goes_up_and_down():
+    gauge = Gauge("in_progress", "In progress", registry=None)
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert gauge.value() == 1
+    gauge.set(5)
+    assert gauge.value() == 5
+
+
+def test_unknown_labels_and_duplicate_names_are_rejected():
+    registry = MetricsRegistry()
+    counter = Counter("dup_total", "Dup", ("status",), registry=registry)
+    with pytest.raises(ValueError):
+        counter.inc(model="x")
+    with pytest.raises(ValueError):
+        Counter("dup_total", "Dup", registry=registry)
@@ -0,0 +1,54 @@
+from src.topic_index import TopicIndex, acronyms, contract, topic_key
+
+
+def test_topic_key_ignores_order_case_plurals_and_stopwords():
+    assert topic_key("The LLMs in AI") == topic_key("ai llm")
+
+
+def test_acronyms_and_contraction():
+    words = ["large", "language", "model"]
+    assert ("llm", 0, 3) in acronyms(words)
+    assert contract(["new", "large", "language", "model"], "llm") == ["new", "llm"]
+    assert contract(words, "xyz") is None
+
+
+def test_exact_duplicates_score_one_and_the_newest_wins():
+    index = TopicIndex()
+    index.add("Cats in space", "gen-1")
+    index.add("space cats", "gen-2")
+    assert index.search("SPACE CAT") == {"generation_id": "gen-2", "topic": "space cats", "score": 1.0}
+
+
+def test_close_topics_match_and_unrelated_ones_do_not():
+    index = TopicIndex()
+    index.add("Healthy recipes for cats", "gen-1")
+    index.add("History of the Roman empire", "gen-2")
+    match = index.search("healthy cat recipe ideas")
+    assert match["generation_id"] == "gen-1" and 0 < match["score"] < 1
+    assert index.search("quantum computing") is None
+
+
+def test_acronym_matches_in_both_directions():
+    index = TopicIndex()
+    index.add("LLMs in healthcare", "gen-1")
+    index.add("Large language models for lawyers", "gen-2")
+    assert index.search("large language models in healthcare")["generation_id"] == "gen-1"
+    assert index.search("LLMs for lawyers")["generation_id"] == "gen-2"
+
+
+def test_excluded_generations_are_skipped():
+    index = TopicIndex()
+    index.add("Cats in space", "gen-1")
+    assert index.search("cats in space", exclude=["gen-1"]) is None
+
+
+def test_index_is_persisted_and_reloaded(tmp_path):
+    path = tmp_path / "topic_index.ndjson"
+    index = TopicIndex(path)
+    index.add("Cats in space", "gen-1")
+    index.add("Cats in space", "gen-1")  # Once per generation
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"topic": "torn')  # Crash mid-write
+    reloaded = TopicIndex(path)
+    assert len(reloaded) == 1
+    assert reloaded.search("space cats")["generation_id"] == "gen-1"